@@ -1,6 +1,48 @@
+import contextlib
+import gzip
+import io
+import shutil
+import sys
+import tempfile
+import time
 import xml.etree.ElementTree as ET
+import zipfile
+from collections import namedtuple
+from collections.abc import Mapping
 from dataclasses import dataclass, field
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, BinaryIO, Callable, Iterable, Iterator, NamedTuple, Sequence, Tuple, Union
+
+try:
+    from lxml import etree as lxml_etree
+    # Older lxml cannot expand internal entities without external ones
+    if lxml_etree.LXML_VERSION < (5,):
+        lxml_etree = None
+except ImportError:
+    lxml_etree = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Field map of a single record: tag -> (text, attributes)
+RecordFields = Dict[str, Tuple[Optional[str], Dict[str, str]]]
+
+# Tags of the records that make up a workflow export
+RECORD_TAGS = frozenset(["wf_workflow_version", "wf_stage", "wf_activity", "wf_condition", "wf_transition"])
+
+# XML backends. lxml is opt-in: with records built in Python it measured no
+# faster than expat on large exports (see workflow_benchmark check-backends)
+XML_BACKENDS = ("lxml", "stdlib")
+DEFAULT_BACKEND = "stdlib"
+
+# Leading bytes of the compressed formats exports are archived in
+COMPRESSION_MAGIC = (
+    (b"\x1f\x8b", "gzip"),
+    (b"\x28\xb5\x2f\xfd", "zstd"),
+    (b"PK\x03\x04", "zip"),
+)
 
 
 @dataclass
@@ -76,6 +118,128 @@ class WorkflowTransition:
                 f"from_activity_id='{self.from_activity_id}', to_activity_id='{self.to_activity_id}')")
 
 
+def _to_number(value: Union[str, int, float]) -> Union[int, float]:
+    """Convert a numeric field to int or float; empty or invalid text is 0."""
+    if not isinstance(value, str):
+        return value
+    try:
+        return int(value)
+    except ValueError:
+        try:
+            return float(value)
+        except ValueError:
+            return 0
+
+
+@dataclass(slots=True)
+class CompactWorkflowStage:
+    """Memory-compact ServiceNow workflow stage model with a numeric order."""
+    id: str = ""
+    name: str = ""
+    value: str = ""
+    order: int = 0
+    
+    def __post_init__(self) -> None:
+        self.id = sys.intern(self.id)
+        self.name = sys.intern(self.name)
+        self.value = sys.intern(self.value)
+        self.order = _to_number(self.order)
+    
+    def __str__(self) -> str:
+        return (f"WorkflowStage(id='{self.id}', name='{self.name}', value='{self.value}', "
+                f"order='{self.order}')")
+
+
+@dataclass(slots=True)
+class CompactWorkflowActivity:
+    """Memory-compact ServiceNow workflow activity model with numeric coordinates."""
+    id: str = ""
+    name: str = ""
+    activity_definition: str = ""
+    stage_id: str = ""
+    x: float = 0
+    y: float = 0
+    
+    def __post_init__(self) -> None:
+        self.id = sys.intern(self.id)
+        self.activity_definition = sys.intern(self.activity_definition)
+        self.stage_id = sys.intern(self.stage_id)
+        self.x = _to_number(self.x)
+        self.y = _to_number(self.y)
+    
+    def __str__(self) -> str:
+        return (f"WorkflowActivity(id='{self.id}', name='{self.name}', "
+                f"activity_definition='{self.activity_definition}', stage_id='{self.stage_id}', "
+                f"x='{self.x}', y='{self.y}')")
+
+
+@dataclass(slots=True)
+class CompactWorkflowCondition:
+    """Memory-compact ServiceNow workflow condition model with a numeric order."""
+    id: str = ""
+    name: str = ""
+    activity_id: str = ""
+    condition: str = ""
+    order: int = 0
+    
+    def __post_init__(self) -> None:
+        self.id = sys.intern(self.id)
+        self.name = sys.intern(self.name)
+        self.activity_id = sys.intern(self.activity_id)
+        self.condition = sys.intern(self.condition)
+        self.order = _to_number(self.order)
+    
+    def __str__(self) -> str:
+        return (f"WorkflowCondition(id='{self.id}', name='{self.name}', "
+                f"activity_id='{self.activity_id}', condition='{self.condition}', "
+                f"order='{self.order}')")
+
+
+@dataclass(slots=True)
+class CompactWorkflowTransition:
+    """Memory-compact ServiceNow workflow transition model."""
+    id: str = ""
+    condition_id: str = ""
+    from_activity_id: str = ""
+    to_activity_id: str = ""
+    
+    def __post_init__(self) -> None:
+        self.condition_id = sys.intern(self.condition_id)
+        self.from_activity_id = sys.intern(self.from_activity_id)
+        self.to_activity_id = sys.intern(self.to_activity_id)
+    
+    def __str__(self) -> str:
+        return (f"WorkflowTransition(id='{self.id}', condition_id='{self.condition_id}', "
+                f"from_activity_id='{self.from_activity_id}', to_activity_id='{self.to_activity_id}')")
+
+
+# Field values of the records read by a lazy parse, in model field order;
+# the models are built from them on first access
+_StageRow = namedtuple("_StageRow", ["id", "name", "value", "order"])
+_ActivityRow = namedtuple("_ActivityRow", ["id", "name", "activity_definition", "stage_id", "x", "y"])
+_ConditionRow = namedtuple("_ConditionRow", ["id", "name", "activity_id", "condition", "order"])
+_TransitionRow = namedtuple("_TransitionRow", ["id", "condition_id", "from_activity_id", "to_activity_id"])
+
+
+class RecordRows(NamedTuple):
+    """
+    Every record of a parsed workflow, as rows with the fields of the
+    models or as the models themselves; see get_record_rows.
+    """
+    stages: Sequence[Any]
+    # In graph node order
+    activities: Sequence[Any]
+    conditions: Sequence[Any]
+    # In mapping order, flattened across their groups
+    transitions: Sequence[Any]
+    # Key and size of each transition group, in mapping order
+    transition_groups: Sequence[Tuple[str, int]]
+    # Positions in transitions of each node's outgoing transitions, parallel
+    # to the graph's successors, and of the dangling transitions
+    out_transitions: Sequence[Sequence[int]]
+    dangling: Sequence[int]
+
+
 @dataclass
 class WorkflowSummary:
     """ServiceNow workflow summary model."""
@@ -94,156 +258,1231 @@ class WorkflowSummary:
                 f"stage_activities={self.stage_activities})")
 
 
+@dataclass
+class ParseStats:
+    """Where the work of a parse went."""
+    input_bytes: int = 0
+    records: Dict[str, int] = field(default_factory=dict)
+    phases: Dict[str, float] = field(default_factory=dict)
+    
+    def __str__(self) -> str:
+        return (f"ParseStats(input_bytes={self.input_bytes}, records={self.records}, "
+                f"phases={self.phases})")
+
+
+# Phase timed for each record builder, also naming its record count
+RECORD_PHASES = {
+    "wf_workflow_version": "version",
+    "wf_stage": "stage",
+    "wf_activity": "activity",
+    "wf_condition": "condition",
+    "wf_transition": "transition",
+}
+
+# Called with a phase name, its seconds and the parser's stats
+ParseHook = Callable[[str, float, ParseStats], None]
+
+# Hooks called for every parser in this process
+_PARSE_HOOKS: List[ParseHook] = []
+
+
+def add_parse_hook(hook: ParseHook) -> None:
+    """
+    Call a hook for the phases of every parser in this process.
+    
+    Phases are "xml" (reading and tokenizing the document), one per record
+    builder (see RECORD_PHASES) and "parse" for the whole parse, reported
+    when a parse finishes, then "graph" and "summary" when those are built.
+    At "parse" the stats also hold the record counts and input bytes.
+    Hooks run on the parsing thread and should be quick.
+    """
+    _PARSE_HOOKS.append(hook)
+
+
+def remove_parse_hook(hook: ParseHook) -> None:
+    """Stop calling a hook added with add_parse_hook."""
+    _PARSE_HOOKS.remove(hook)
+
+
+class WorkflowParseLimitError(ValueError):
+    """Raised when a document crosses one of the parse limits."""
+    
+    def __init__(self, limit: str, maximum: Optional[int], message: str):
+        """
+        Args:
+            limit: Name of the ParseLimits field crossed
+            maximum: Its value, or None for limits without one
+            message: Description of what was crossed
+        """
+        super().__init__(message)
+        self.limit = limit
+        self.maximum = maximum
+    
+    def __reduce__(self):
+        # Rebuilt from all three arguments when sent back from a worker process
+        return type(self), (self.limit, self.maximum, str(self))
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {"limit": self.limit, "maximum": self.maximum}
+
+
+@dataclass(frozen=True)
+class ParseLimits:
+    """
+    Bounds on the documents a parse accepts; None leaves a bound off.
+    
+    Limits are checked as the document streams in, so a parse crossing one
+    stops right there with WorkflowParseLimitError, having read no more
+    than the limit allows.
+    """
+    # Uncompressed XML bytes read
+    max_bytes: Optional[int] = None
+    # Element nesting depth, the root element being depth 1
+    max_depth: Optional[int] = None
+    # Records of each wf_* type
+    max_records: Optional[int] = None
+    # Whether a DOCTYPE, and with it entity declarations, is accepted
+    allow_doctype: bool = False
+
+
+# What a parser without limits accepts: everything, as before limits existed
+NO_LIMITS = ParseLimits(allow_doctype=True)
+
+# Longest document prolog, before the root element, a DOCTYPE is looked for in
+MAX_PROLOG_BYTES = 1024 * 1024
+
+
+def _check_prolog(prolog: bytes, complete: bool) -> bool:
+    """
+    Look for a DOCTYPE in the start of a document.
+    
+    Only the markup allowed before the root element is walked: the XML
+    declaration, processing instructions, comments and whitespace.
+    
+    Args:
+        prolog: The document's first bytes
+        complete: Whether no more bytes follow
+        
+    Returns:
+        True once the root element is reached, False if more bytes are needed
+        
+    Raises:
+        WorkflowParseLimitError: If the document declares a DOCTYPE
+    """
+    # Markup is ASCII, so any encoding but UTF-16 can be read as latin-1
+    if prolog[:2] in (b"\xff\xfe", b"\xfe\xff"):
+        text = prolog.decode("utf-16", errors="ignore")
+    elif prolog[:2] in (b"<\x00", b"\x00<"):
+        text = prolog.decode("utf-16-le" if prolog[0] else "utf-16-be", errors="ignore")
+    else:
+        text = prolog[3:].decode("latin-1") if prolog[:3] == b"\xef\xbb\xbf" else prolog.decode("latin-1")
+    
+    position = 0
+    while True:
+        while position < len(text) and text[position] in " \t\r\n":
+            position += 1
+        if text.startswith("<!DOCTYPE", position):
+            raise WorkflowParseLimitError("allow_doctype", None, "Documents declaring a DOCTYPE are not accepted")
+        if text.startswith("<?", position):
+            terminator = "?>"
+        elif text.startswith("<!--", position):
+            terminator = "-->"
+        elif not complete and any(markup.startswith(text[position:]) for markup in ("<!DOCTYPE", "<!--")):
+            # Too few bytes yet to tell
+            return False
+        else:
+            # The root element, or something the XML parser will reject
+            return True
+        end = text.find(terminator, position)
+        if end < 0:
+            return complete
+        position = end + len(terminator)
+
+
+class _CountingReader:
+    """
+    Binary reader counting the bytes read through it.
+    
+    With limits, it also stops the read past max_bytes and, unless
+    DOCTYPEs are allowed, rejects one before the XML parser can see it.
+    """
+    
+    def __init__(self, stream: BinaryIO, limits: ParseLimits = NO_LIMITS):
+        self._stream = stream
+        self.count = 0
+        self._max_bytes = limits.max_bytes
+        self._prolog: Optional[bytearray] = None if limits.allow_doctype else bytearray()
+    
+    def read(self, size: int = -1) -> bytes:
+        data = self._stream.read(size)
+        self.count += len(data)
+        if self._max_bytes is not None and self.count > self._max_bytes:
+            raise WorkflowParseLimitError(
+                "max_bytes", self._max_bytes, f"Document is larger than {self._max_bytes} bytes"
+            )
+        if self._prolog is not None:
+            self._prolog += data
+            if _check_prolog(bytes(self._prolog), not data):
+                self._prolog = None
+            elif len(self._prolog) > MAX_PROLOG_BYTES:
+                raise WorkflowParseLimitError(
+                    "allow_doctype", None, f"Document has more than {MAX_PROLOG_BYTES} bytes before its root element"
+                )
+        return data
+
+
+def _limit_records(records: Iterable[Tuple[str, Any]], max_records: Optional[int]) -> Iterator[Tuple[str, Any]]:
+    """Pass records through, failing once there are more than max_records of a type."""
+    if max_records is None:
+        yield from records
+        return
+    
+    counts = dict.fromkeys(RECORD_TAGS, 0)
+    for tag, record in records:
+        counts[tag] += 1
+        if counts[tag] > max_records:
+            raise WorkflowParseLimitError(
+                "max_records", max_records, f"Document has more than {max_records} {tag} records"
+            )
+        yield tag, record
+
+
+def _depth_exceeded(max_depth: int) -> WorkflowParseLimitError:
+    return WorkflowParseLimitError("max_depth", max_depth, f"Document nests elements deeper than {max_depth}")
+
+
+def _extract_record(element: ET.Element) -> RecordFields:
+    """
+    Build the field map of a wf_* record in one walk of its direct children.
+    
+    Args:
+        element: Record element
+        
+    Returns:
+        Map of field tag to its text and attributes; the first occurrence wins
+    """
+    fields = {}
+    for child in element:
+        if child.tag not in fields:
+            fields[child.tag] = (child.text, child.attrib)
+    return fields
+
+
+def resolve_backend(backend: Optional[str] = "auto") -> str:
+    """
+    Pick the XML backend to parse with.
+    
+    Args:
+        backend: "lxml", "stdlib", or "auto" (or None) for the default
+        
+    Returns:
+        Name of the backend
+    """
+    if backend in (None, "auto"):
+        return DEFAULT_BACKEND
+    if backend not in XML_BACKENDS:
+        raise ValueError(f"Unknown XML backend: {backend}")
+    if backend == "lxml" and lxml_etree is None:
+        raise ValueError("lxml backend requested but lxml is not installed")
+    return backend
+
+
+def _lxml_parser_options() -> Dict[str, Any]:
+    """
+    Options making lxml read a document the way the standard library does.
+    
+    Comments and processing instructions are dropped like ElementTree's
+    default tree builder does. Internal entities are expanded like expat
+    does, within libxml2's amplification limit; external entities are not
+    loaded and nothing is fetched from the network. huge_tree lifts
+    libxml2's limits on text size and nesting depth for very large exports.
+    """
+    return dict(
+        huge_tree=True,
+        resolve_entities="internal",
+        no_network=True,
+        remove_comments=True,
+        remove_pis=True
+    )
+
+
+def _extract_lxml_record(element: Any) -> RecordFields:
+    """Like _extract_record, copying lxml's live attribute proxies to dicts."""
+    fields = {}
+    for child in element:
+        if child.tag not in fields:
+            fields[child.tag] = (child.text, dict(child.items()))
+    return fields
+
+
+def _iter_lxml_records(source: BinaryIO, max_depth: Optional[int] = None) -> Iterator[Tuple[str, RecordFields]]:
+    """
+    iter_records on lxml.
+    
+    Without a depth limit, the tag filter makes libxml2 skip every element
+    but the records in C, so Python only sees one event per record. With
+    one, every element is seen to track the depth like the standard
+    library backend does, since huge_tree lifts libxml2's own nesting cap.
+    """
+    if max_depth is not None:
+        yield from _iter_lxml_records_bounded(source, max_depth)
+        return
+    
+    context = lxml_etree.iterparse(source, events=("end",), tag=tuple(RECORD_TAGS), **_lxml_parser_options())
+    
+    for _, element in context:
+        yield element.tag, _extract_lxml_record(element)
+        
+        parent = element.getparent()
+        element.clear()
+        
+        # Drop finished siblings so their parent does not grow; inside a
+        # record they may be fields still to be read
+        if parent is not None and parent.tag not in RECORD_TAGS:
+            while element.getprevious() is not None:
+                del parent[0]
+
+
+def _iter_lxml_records_bounded(source: BinaryIO, max_depth: int) -> Iterator[Tuple[str, RecordFields]]:
+    """_iter_lxml_records checking the depth of every element."""
+    root = None
+    depth = 0
+    
+    for event, element in lxml_etree.iterparse(source, events=("start", "end"), **_lxml_parser_options()):
+        if event == "start":
+            if root is None:
+                root = element
+            depth += 1
+            if depth > max_depth:
+                raise _depth_exceeded(max_depth)
+            continue
+        
+        depth -= 1
+        if element is root:
+            break
+        
+        if element.tag in RECORD_TAGS:
+            yield element.tag, _extract_lxml_record(element)
+            element.clear()
+        
+        # Drop finished top-level subtrees so the root does not grow
+        if depth == 1:
+            root.clear()
+
+
+def detect_compression(head: bytes) -> Optional[str]:
+    """
+    Identify the compression of an export from its first bytes.
+    
+    Returns:
+        "gzip", "zstd", "zip", or None for uncompressed input
+    """
+    for magic, compression in COMPRESSION_MAGIC:
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+class _ReplayStream(io.RawIOBase):
+    """Non-seekable stream with bytes already read from it put back in front."""
+    
+    def __init__(self, head: bytes, stream: BinaryIO):
+        self._head = head
+        self._stream = stream
+    
+    def readable(self) -> bool:
+        return True
+    
+    def readinto(self, buffer: Any) -> int:
+        if self._head:
+            data, self._head = self._head[:len(buffer)], self._head[len(buffer):]
+        else:
+            data = self._stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def _zip_export_member(archive: zipfile.ZipFile) -> zipfile.ZipInfo:
+    """Get the one XML export held by a zip archive, such as a zipped update set."""
+    members = [info for info in archive.infolist()
+               if not info.is_dir() and info.filename.lower().endswith(".xml")]
+    if len(members) != 1:
+        raise ValueError(f"Zip archive must hold exactly one XML export, found {len(members)}")
+    return members[0]
+
+
+@contextlib.contextmanager
+def open_export(source: Union[str, bytes, BinaryIO]) -> Iterator[BinaryIO]:
+    """
+    Open an export for reading, decompressing it on the fly.
+    
+    gzip, zstd and zip compression are recognized by their magic bytes,
+    whatever the file is called. Compressed input is decompressed as it is
+    read, so the decompressed document is never held in memory. Only zip
+    archives read from a non-seekable stream are copied to a temporary
+    file first, since their directory is at the end.
+    
+    Args:
+        source: Path to the export, raw bytes or a binary file object;
+            file objects passed in are left open
+        
+    Yields:
+        Binary file object of the uncompressed XML
+        
+    Raises:
+        ValueError: If the export is zstd compressed and zstandard is not
+            installed, or a zip archive does not hold exactly one XML file
+    """
+    with contextlib.ExitStack() as stack:
+        if isinstance(source, (bytes, bytearray)):
+            stream = io.BytesIO(source)
+        elif isinstance(source, str):
+            stream = stack.enter_context(open(source, "rb"))
+        else:
+            stream = source
+        
+        if stream.seekable():
+            start = stream.tell()
+            head = stream.read(4)
+            stream.seek(start)
+        else:
+            head = stream.read(4)
+            stream = io.BufferedReader(_ReplayStream(head, stream))
+        
+        compression = detect_compression(head)
+        if compression == "gzip":
+            stream = stack.enter_context(gzip.GzipFile(fileobj=stream, mode="rb"))
+        elif compression == "zstd":
+            if zstandard is None:
+                raise ValueError("Export is zstd compressed but zstandard is not installed")
+            stream = stack.enter_context(zstandard.ZstdDecompressor().stream_reader(
+                stream, read_across_frames=True, closefd=False
+            ))
+        elif compression == "zip":
+            if not stream.seekable():
+                spooled = stack.enter_context(tempfile.TemporaryFile())
+                shutil.copyfileobj(stream, spooled)
+                spooled.seek(0)
+                stream = spooled
+            archive = stack.enter_context(zipfile.ZipFile(stream))
+            stream = stack.enter_context(archive.open(_zip_export_member(archive)))
+        
+        yield stream
+
+
+def iter_records(
+    source: Union[str, bytes, BinaryIO],
+    backend: Optional[str] = "auto",
+    limits: Optional[ParseLimits] = None
+) -> Iterator[Tuple[str, RecordFields]]:
+    """
+    Stream the wf_* records of a workflow export.
+    
+    Each record is yielded as soon as its end tag is read and is then
+    cleared, and finished top-level subtrees are dropped, so memory stays
+    around one record instead of the whole document. Raw input is decoded
+    using the encoding in the XML declaration. Compressed exports are
+    decompressed as they are read, see open_export.
+    
+    Both backends yield the same records.
+    
+    Args:
+        source: Path to the XML file, raw XML bytes or a binary file object
+        backend: "lxml", "stdlib", or "auto" for the default
+        limits: Bounds the document must stay within, or None for none
+        
+    Yields:
+        Record tag and field map, in document order
+        
+    Raises:
+        WorkflowParseLimitError: If the document crosses one of the limits
+    """
+    backend = resolve_backend(backend)
+    limits = limits or NO_LIMITS
+    
+    with open_export(source) as stream:
+        yield from _iter_stream_records(_CountingReader(stream, limits), backend, limits)
+
+
+def _iter_stream_records(
+    stream: BinaryIO,
+    backend: str,
+    limits: ParseLimits = NO_LIMITS
+) -> Iterator[Tuple[str, RecordFields]]:
+    """
+    iter_records on an open, uncompressed stream with a resolved backend.
+    
+    Enforces the depth and record limits; the byte and DOCTYPE limits are
+    up to the stream, see _CountingReader.
+    """
+    if backend == "lxml":
+        yield from _limit_records(_iter_lxml_records(stream, limits.max_depth), limits.max_records)
+        return
+    
+    yield from _limit_records(_iter_stdlib_records(stream, limits.max_depth), limits.max_records)
+
+
+def _iter_stdlib_records(stream: BinaryIO, max_depth: Optional[int] = None) -> Iterator[Tuple[str, RecordFields]]:
+    """iter_records on the standard library's XML parser."""
+    root = None
+    depth = 0
+    max_depth = max_depth or sys.maxsize
+    
+    for event, element in ET.iterparse(stream, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = element
+            depth += 1
+            if depth > max_depth:
+                raise _depth_exceeded(max_depth)
+            continue
+        
+        depth -= 1
+        if element is root:
+            break
+        
+        if element.tag in RECORD_TAGS:
+            yield element.tag, _extract_record(element)
+            element.clear()
+        
+        # Drop finished top-level subtrees so the root does not grow
+        if depth == 1:
+            root.clear()
+
+
+def _tree_depth(root: Any) -> int:
+    """Get the nesting depth of an element tree, the root being depth 1."""
+    deepest = 0
+    level = [root]
+    while level:
+        deepest += 1
+        level = [child for element in level for child in element]
+    return deepest
+
+
+class LazyList(Sequence):
+    """Read-only sequence of items built on first access."""
+    
+    def __init__(self, length: int, loader: Callable[[int], Any]):
+        """
+        Args:
+            length: Number of items
+            loader: Builds the item at a position
+        """
+        self._items: List[Any] = [None] * length
+        self._loader = loader
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[position] for position in range(*index.indices(len(self._items)))]
+        item = self._items[index]
+        if item is None:
+            item = self._items[index] = self._loader(index % len(self._items))
+        return item
+    
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class LazyRecordMap(Mapping):
+    """
+    Read-only mapping of records that are built on first access.
+    
+    Keys may themselves be a lazy sequence; the key-to-position index is
+    only built on the first lookup, so counting and iterating stay cheap.
+    """
+    
+    def __init__(self, keys: Sequence[str], loader: Callable[[int], Any]):
+        """
+        Args:
+            keys: Record keys in order
+            loader: Builds the record at a position
+        """
+        self._keys = keys
+        self._loader = loader
+        self._records: List[Any] = [None] * len(keys)
+        self._positions: Optional[Dict[str, int]] = None
+    
+    def __getitem__(self, key: str) -> Any:
+        if self._positions is None:
+            self._positions = {k: position for position, k in enumerate(self._keys)}
+        return self.at(self._positions[key])
+    
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._keys)
+    
+    def __len__(self) -> int:
+        return len(self._records)
+    
+    def at(self, position: int) -> Any:
+        """Get the record at a position, building it on first access."""
+        record = self._records[position]
+        if record is None:
+            record = self._records[position] = self._loader(position)
+        return record
+    
+    def items(self):
+        return ((key, self.at(position)) for position, key in enumerate(self._keys))
+    
+    def values(self):
+        return (self.at(position) for position in range(len(self._records)))
+
+
+class WorkflowGraph:
+    """
+    Graph index over a parsed workflow, built once after parsing.
+    
+    Activities are numbered 0..n-1 in parse order. Transitions are resolved
+    to node ids once, whether their references hold a sys_id or a display
+    name, and stored as forward and reverse adjacency lists. Transitions
+    with an endpoint that does not resolve are kept in ``dangling``.
+    """
+    
+    def __init__(
+        self,
+        activities: Dict[str, WorkflowActivity],
+        transitions: Dict[str, List[WorkflowTransition]],
+        conditions: Optional[Dict[str, WorkflowCondition]] = None,
+        start_activity_id: str = ""
+    ):
+        """
+        Args:
+            activities: Activities keyed by sys_id
+            transitions: Transitions grouped by source activity reference
+            conditions: Conditions keyed by sys_id
+            start_activity_id: Reference to the start activity
+        """
+        activity_list = list(activities.values())
+        self._index_nodes(
+            list(activities),
+            [activity.name for activity in activity_list],
+            [activity.stage_id for activity in activity_list],
+            activity_list
+        )
+        
+        self.successors: List[List[int]] = [[] for _ in self.node_ids]
+        self.predecessors: List[List[int]] = [[] for _ in self.node_ids]
+        self.out_transitions: List[List[WorkflowTransition]] = [[] for _ in self.node_ids]
+        self.dangling: List[WorkflowTransition] = []
+        self.edge_count = 0
+        
+        for transition_list in transitions.values():
+            for transition in transition_list:
+                source = self.resolve(transition.from_activity_id)
+                target = self.resolve(transition.to_activity_id)
+                if source is None or target is None:
+                    self.dangling.append(transition)
+                    continue
+                self.successors[source].append(target)
+                self.predecessors[target].append(source)
+                self.out_transitions[source].append(transition)
+                self.edge_count += 1
+        
+        self.conditions = conditions if conditions is not None else {}
+        self.invalidate()
+        self.start = self.resolve(start_activity_id)
+    
+    @classmethod
+    def from_adjacency(
+        cls,
+        node_ids: List[str],
+        node_names: List[str],
+        stage_ids: List[str],
+        activities: Sequence[WorkflowActivity],
+        successors: List[List[int]],
+        out_transitions: Sequence[List[WorkflowTransition]],
+        dangling: List[WorkflowTransition],
+        conditions: Mapping,
+        start_activity_id: str = ""
+    ) -> "WorkflowGraph":
+        """
+        Build the index from adjacency that was resolved earlier, such as a snapshot.
+        
+        Only the per-node strings are needed up front; activities and
+        transitions may be lazy sequences materialized on access.
+        
+        Args:
+            node_ids: Activity sys_ids in node order
+            node_names: Activity names in node order
+            stage_ids: Activity stage references in node order
+            activities: Activities in node order
+            successors: Target nodes of each node's outgoing transitions
+            out_transitions: Each node's outgoing transitions, parallel to successors
+            dangling: Transitions with an endpoint that does not resolve
+            conditions: Conditions keyed by sys_id
+            start_activity_id: Reference to the start activity
+        """
+        graph = cls.__new__(cls)
+        graph._index_nodes(node_ids, node_names, stage_ids, activities)
+        graph.successors = successors
+        graph.predecessors = [[] for _ in node_ids]
+        for source, targets in enumerate(successors):
+            for target in targets:
+                graph.predecessors[target].append(source)
+        graph.out_transitions = out_transitions
+        graph.dangling = dangling
+        graph.edge_count = sum(len(targets) for targets in successors)
+        graph.conditions = conditions
+        graph.invalidate()
+        graph.start = graph.resolve(start_activity_id)
+        return graph
+    
+    def copy(self, conditions: Optional[Mapping] = None) -> "WorkflowGraph":
+        """
+        Copy the indexes, sharing the records, so the copy can be changed
+        in place without affecting this graph. Lazy columns are copied as
+        lists of their records.
+    
+        Args:
+            conditions: Conditions the copy resolves against, or None for
+                this graph's
+        """
+        graph = WorkflowGraph.__new__(WorkflowGraph)
+        graph.node_ids = list(self.node_ids)
+        graph.node_names = list(self.node_names)
+        graph.activities = list(self.activities)
+        graph.sys_id_index = dict(self.sys_id_index)
+        graph.name_index = dict(self.name_index)
+        graph.stage_members = {stage_id: list(members) for stage_id, members in self.stage_members.items()}
+        graph.successors = [list(targets) for targets in self.successors]
+        graph.predecessors = [list(sources) for sources in self.predecessors]
+        graph.out_transitions = [list(transition_list) for transition_list in self.out_transitions]
+        graph.dangling = list(self.dangling)
+        graph.edge_count = self.edge_count
+        graph.conditions = self.conditions if conditions is None else conditions
+        graph.version = self.version
+        graph.invalidate()
+        graph.start = self.start
+        return graph
+    
+    def _index_nodes(
+        self,
+        node_ids: List[str],
+        node_names: List[str],
+        stage_ids: List[str],
+        activities: Sequence[WorkflowActivity]
+    ) -> None:
+        """Number the activities and build the sys_id, name and stage indexes."""
+        self.node_ids = node_ids
+        self.node_names = node_names
+        self.activities = activities
+        self.sys_id_index: Dict[str, int] = {}
+        self.name_index: Dict[str, int] = {}
+        self.stage_members: Dict[str, List[int]] = {}
+        
+        for node, sys_id in enumerate(node_ids):
+            self.sys_id_index[sys_id] = node
+            # The first activity with a name wins when names repeat
+            self.name_index.setdefault(node_names[node], node)
+            if stage_ids[node]:
+                self.stage_members.setdefault(stage_ids[node], []).append(node)
+    
+    def __len__(self) -> int:
+        return len(self.node_ids)
+    
+    def resolve(self, reference: str) -> Optional[int]:
+        """
+        Resolve an activity reference to its node id.
+        
+        Args:
+            reference: Activity sys_id or display name
+            
+        Returns:
+            Node id or None when no activity matches
+        """
+        node = self.sys_id_index.get(reference)
+        if node is None:
+            node = self.name_index.get(reference)
+        return node
+    
+    def condition_for(self, transition: WorkflowTransition) -> Optional[WorkflowCondition]:
+        """Get a transition's condition, resolving a display name within its source activity."""
+        condition = self.conditions.get(transition.condition_id)
+        if condition is None:
+            source = self.resolve(transition.from_activity_id)
+            if source is not None:
+                condition = self._get_condition_names().get((source, transition.condition_id))
+        return condition
+    
+    def invalidate(self) -> None:
+        """
+        Drop the indexes built on first use, after records change in place.
+        
+        Also bumps ``version``, so data derived from the graph elsewhere,
+        such as diagram layouts, can tell it is stale.
+        """
+        self.version = getattr(self, "version", -1) + 1
+        self._condition_names: Optional[Dict[Tuple[int, str], WorkflowCondition]] = None
+        self._node_conditions: Optional[Dict[int, List[WorkflowCondition]]] = None
+        self._unattached_conditions: List[WorkflowCondition] = []
+        self._node_dangling: Optional[Dict[int, List[WorkflowTransition]]] = None
+        self._unattached_dangling: List[WorkflowTransition] = []
+        self._definition_members: Optional[Dict[str, List[int]]] = None
+    
+    def get_node_conditions(self) -> Dict[int, List[WorkflowCondition]]:
+        """Get the conditions of each activity, keyed by node id."""
+        if self._node_conditions is None:
+            self._node_conditions = {}
+            self._unattached_conditions = []
+            for condition in self.conditions.values():
+                node = self.resolve(condition.activity_id)
+                if node is not None:
+                    self._node_conditions.setdefault(node, []).append(condition)
+                else:
+                    self._unattached_conditions.append(condition)
+        return self._node_conditions
+    
+    def get_unattached_conditions(self) -> List[WorkflowCondition]:
+        """Get the conditions whose activity reference does not resolve."""
+        self.get_node_conditions()
+        return self._unattached_conditions
+    
+    def get_node_dangling(self) -> Dict[int, List[WorkflowTransition]]:
+        """Get the dangling transitions leaving each activity, keyed by node id."""
+        if self._node_dangling is None:
+            self._node_dangling = {}
+            self._unattached_dangling = []
+            for transition in self.dangling:
+                node = self.resolve(transition.from_activity_id)
+                if node is not None:
+                    self._node_dangling.setdefault(node, []).append(transition)
+                else:
+                    self._unattached_dangling.append(transition)
+        return self._node_dangling
+    
+    def get_unattached_dangling(self) -> List[WorkflowTransition]:
+        """Get the dangling transitions whose source reference does not resolve."""
+        self.get_node_dangling()
+        return self._unattached_dangling
+    
+    def get_definition_members(self) -> Dict[str, List[int]]:
+        """Get the node ids of each activity definition, in node order."""
+        if self._definition_members is None:
+            self._definition_members = {}
+            for node in range(len(self.node_ids)):
+                definition = self.activities[node].activity_definition
+                self._definition_members.setdefault(definition, []).append(node)
+        return self._definition_members
+    
+    def _get_condition_names(self) -> Dict[Tuple[int, str], WorkflowCondition]:
+        """Index conditions by (node, name) on first use, for exports using display names."""
+        if self._condition_names is None:
+            self._condition_names = {}
+            for condition in self.conditions.values():
+                node = self.resolve(condition.activity_id)
+                if node is not None:
+                    self._condition_names.setdefault((node, condition.name), condition)
+        return self._condition_names
+
+
+class _RecordRows:
+    """
+    Records read by a lazy parse, kept as rows until their models are needed.
+    
+    Models are built on first access and then kept, and the graph index is
+    built from the rows without building any. Loaders are bound methods, so
+    a lazy parser still pickles.
+    """
+    
+    def __init__(
+        self,
+        parser: "ServiceNowWorkflowParser",
+        stages: Dict[str, _StageRow],
+        activities: Dict[str, _ActivityRow],
+        conditions: Dict[str, _ConditionRow],
+        transitions: Dict[str, List[_TransitionRow]]
+    ):
+        """
+        Args:
+            parser: Parser whose models are built
+            stages, activities, conditions, transitions: Rows as the record
+                builders stored them
+        """
+        self.stages = stages
+        self.activities = activities
+        self.conditions = conditions
+        self.transitions = transitions
+        self._models = parser._model_types
+        self._rows = (list(stages.values()), list(activities.values()), list(conditions.values()))
+        
+        self._transition_rows: List[_TransitionRow] = []
+        self._group_starts = [0]
+        for group in transitions.values():
+            self._transition_rows.extend(group)
+            self._group_starts.append(len(self._transition_rows))
+        self.transition_models = LazyList(len(self._transition_rows), self.transition)
+        self._out_positions: List[List[int]] = []
+        self._dangling_positions: List[int] = []
+    
+    def stage(self, position: int) -> Any:
+        return self._models[0](*self._rows[0][position])
+    
+    def activity(self, position: int) -> Any:
+        return self._models[1](*self._rows[1][position])
+    
+    def condition(self, position: int) -> Any:
+        return self._models[2](*self._rows[2][position])
+    
+    def transition(self, position: int) -> Any:
+        return self._models[3](*self._transition_rows[position])
+    
+    def record_rows(self) -> RecordRows:
+        """Get the rows; the graph must have been built from them."""
+        starts = self._group_starts
+        return RecordRows(
+            stages=self._rows[0],
+            activities=self._rows[1],
+            conditions=self._rows[2],
+            transitions=self._transition_rows,
+            transition_groups=[(key, starts[position + 1] - starts[position])
+                               for position, key in enumerate(self.transitions)],
+            out_transitions=self._out_positions,
+            dangling=self._dangling_positions
+        )
+    
+    def transition_group(self, position: int) -> List[Any]:
+        """Build the transitions of the group at a position of the transitions mapping."""
+        start, end = self._group_starts[position], self._group_starts[position + 1]
+        return [self.transition_models[t] for t in range(start, end)]
+    
+    def node_transitions(self, node: int) -> List[Any]:
+        """Build a graph node's outgoing transitions."""
+        return [self.transition_models[t] for t in self._out_positions[node]]
+    
+    def build_graph(self, parser: "ServiceNowWorkflowParser") -> WorkflowGraph:
+        """
+        Index the rows as a graph whose activities and transitions are the
+        parser's lazily built models.
+        """
+        graph = WorkflowGraph(
+            self.activities,
+            self.transitions,
+            parser.conditions,
+            parser.workflow_version.start_activity_id if parser.workflow_version else ""
+        )
+        
+        # The graph was built over rows; point it at the models instead
+        positions = {id(row): position for position, row in enumerate(self._transition_rows)}
+        self._out_positions = [[positions[id(row)] for row in rows] for rows in graph.out_transitions]
+        graph.activities = LazyList(len(graph), parser.activities.at)
+        graph.out_transitions = LazyList(len(graph), self.node_transitions)
+        self._dangling_positions = [positions[id(row)] for row in graph.dangling]
+        graph.dangling = [self.transition_models[position] for position in self._dangling_positions]
+        return graph
+
+
 class ServiceNowWorkflowParser:
     """Parser for ServiceNow workflow XML exports."""
     
-    def __init__(self):
+    def __init__(
+        self,
+        compact: bool = False,
+        backend: Optional[str] = "auto",
+        lazy: bool = False,
+        hooks: Optional[Sequence[ParseHook]] = None,
+        limits: Optional[ParseLimits] = None
+    ):
+        """
+        Args:
+            compact: Build slotted models with interned strings and numeric
+                coordinates and order, for holding many workflows in memory
+            backend: XML backend, "lxml", "stdlib", or "auto" for the
+                default; the parsed models are the same with either
+            lazy: Keep stages, activities, conditions and transitions as
+                plain rows while parsing and build each model the first time
+                it is accessed. The getters then return read-only mappings,
+                and summaries and counts need no models at all; reading
+                every model afterwards costs more than an eager parse.
+            hooks: Called for this parser's phases besides the hooks added
+                with add_parse_hook; they are not pickled with the parser
+            limits: Bounds documents must stay within, such as for
+                untrusted uploads, or None to accept any document
+        """
+        self.compact = compact
+        self.lazy = lazy
+        self.backend = resolve_backend(backend)
+        self.limits = limits or NO_LIMITS
+        # Stage, activity, condition and transition models
+        self._model_types = (
+            (CompactWorkflowStage, CompactWorkflowActivity, CompactWorkflowCondition, CompactWorkflowTransition)
+            if compact else (WorkflowStage, WorkflowActivity, WorkflowCondition, WorkflowTransition)
+        )
+        
+        # What the record builders create: the models, or rows when lazy
+        (self._stage_model, self._activity_model,
+         self._condition_model, self._transition_model) = (
+            (_StageRow, _ActivityRow, _ConditionRow, _TransitionRow) if lazy else self._model_types
+        )
+        
         self.document = None
         self.activities = {}
         self.stages = {}
         self.conditions = {}
         self.transitions = {}
         self.workflow_version = None
+        self._version_parsed = False
+        self._graph = None
+        self._rows: Optional[_RecordRows] = None
+        self.hooks: List[ParseHook] = list(hooks or [])
+        self.stats = ParseStats()
     
-    def parse(self, xml_content: str) -> None:
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state["hooks"] = []
+        return state
+    
+    def parse(self, xml_content: Union[str, bytes]) -> None:
         """
         Parse the ServiceNow workflow XML content.
         
         Args:
-            xml_content: The XML content as a string
+            xml_content: The XML content as a string, or as raw bytes
+                decoded using the encoding in the XML declaration
+                
+        Raises:
+            WorkflowParseLimitError: If the document crosses one of the
+                parser's limits
+        """
+        started = time.perf_counter()
+        self.stats = ParseStats(input_bytes=len(xml_content))
+        self._check_document(xml_content)
+        
+        # Parse the XML content; lxml only takes raw bytes, as decoded text
+        # may carry an encoding declaration it would refuse
+        if self.backend == "lxml" and isinstance(xml_content, (bytes, bytearray)):
+            self.document = lxml_etree.fromstring(
+                bytes(xml_content), lxml_etree.XMLParser(**_lxml_parser_options())
+            )
+            extract = _extract_lxml_record
+        else:
+            self.document = ET.fromstring(xml_content)
+            extract = _extract_record
+        
+        if self.limits.max_depth is not None and _tree_depth(self.document) > self.limits.max_depth:
+            self.document = None
+            raise _depth_exceeded(self.limits.max_depth)
+        
+        # Route every record to its builder in a single walk of the tree
+        self._build_records(_limit_records(
+            ((element.tag, extract(element)) for element in self.document.iter()
+             if element is not self.document and element.tag in _RECORD_BUILDERS),
+            self.limits.max_records
+        ))
+        self._report_parse(started)
+    
+    def _check_document(self, xml_content: Union[str, bytes]) -> None:
+        """Check the size and DOCTYPE limits of a document given whole."""
+        limits = self.limits
+        if limits.max_bytes is not None and len(xml_content) > limits.max_bytes:
+            raise WorkflowParseLimitError(
+                "max_bytes", limits.max_bytes, f"Document is larger than {limits.max_bytes} bytes"
+            )
+        if not limits.allow_doctype:
+            prolog = xml_content[:MAX_PROLOG_BYTES]
+            if isinstance(prolog, str):
+                prolog = prolog.encode("utf-8")
+            if not _check_prolog(prolog, len(xml_content) <= MAX_PROLOG_BYTES):
+                raise WorkflowParseLimitError(
+                    "allow_doctype", None, f"Document has more than {MAX_PROLOG_BYTES} bytes before its root element"
+                )
+    
+    def parse_stream(self, source: Union[str, bytes, BinaryIO]) -> None:
         """
-        # Parse the XML content
-        self.document = ET.fromstring(xml_content)
+        Parse ServiceNow workflow XML incrementally.
         
-        # Parse workflow version
-        self._parse_workflow_version()
+        Each wf_* record is handed to its builder as soon as its end tag is
+        read and then cleared, so peak memory stays around one record
+        instead of the whole document. No DOM is kept in ``self.document``.
+        Raw input is decoded using the encoding in the XML declaration, and
+        gzip, zstd or zip compressed input is decompressed as it is read.
         
-        # Parse stages
-        self._parse_stages()
+        Args:
+            source: Path to the XML file, raw XML bytes or a binary file
+                object such as an upload stream
+                
+        Raises:
+            WorkflowParseLimitError: If the document crosses one of the
+                parser's limits, which stops the parse as soon as it does
+        """
+        started = time.perf_counter()
+        self.stats = ParseStats()
         
-        # Parse activities
-        self._parse_activities()
+        with open_export(source) as stream:
+            reader = _CountingReader(stream, self.limits)
+            self._build_records(_iter_stream_records(reader, self.backend, self.limits))
+            self.stats.input_bytes = reader.count
+        self._report_parse(started)
+    
+    def _build_records(self, records: Iterable[Tuple[str, RecordFields]]) -> None:
+        """
+        Hand records to their builders, counting them and timing each builder.
         
-        # Parse conditions
-        self._parse_conditions()
+        Time not spent in the builders goes to reading the XML.
+        """
+        self._version_parsed = False
+        self._graph = None
+        self._begin_records()
         
-        # Parse transitions
-        self._parse_transitions()
+        clock = time.perf_counter
+        counts = self.stats.records
+        phases = self.stats.phases
+        try:
+            for tag, fields in records:
+                start = clock()
+                _RECORD_BUILDERS[tag](self, fields)
+                phase = RECORD_PHASES[tag]
+                phases[phase] = phases.get(phase, 0.0) + clock() - start
+                counts[phase] = counts.get(phase, 0) + 1
+        finally:
+            self._finish_records()
     
-    def _parse_workflow_version(self) -> None:
+    def _report_parse(self, started: float) -> None:
+        """Account the XML time of a finished parse and report its phases to the hooks."""
+        total = time.perf_counter() - started
+        phases = self.stats.phases
+        phases["xml"] = max(0.0, total - sum(phases.values()))
+        phases["parse"] = total
+        for phase in ("xml", *(p for p in RECORD_PHASES.values() if p in phases), "parse"):
+            self._call_hooks(phase, phases[phase])
+    
+    def _report(self, phase: str, seconds: float) -> None:
+        """Record a phase outside parsing and report it to the hooks."""
+        self.stats.phases[phase] = self.stats.phases.get(phase, 0.0) + seconds
+        self._call_hooks(phase, seconds)
+    
+    def _call_hooks(self, phase: str, seconds: float) -> None:
+        for hook in _PARSE_HOOKS + self.hooks:
+            hook(phase, seconds, self.stats)
+    
+    def _add_record(self, tag: str, fields: RecordFields) -> None:
+        """Build the model of a wf_* record from its field map."""
+        _RECORD_BUILDERS[tag](self, fields)
+    
+    def _begin_records(self) -> None:
+        """Give a lazy parser's record builders back the rows of an earlier parse."""
+        if self._rows is not None:
+            rows = self._rows
+            self.stages, self.activities = rows.stages, rows.activities
+            self.conditions, self.transitions = rows.conditions, rows.transitions
+            self._rows = None
+    
+    def _finish_records(self) -> None:
+        """Put the rows of a lazy parse behind mappings that build models on first access."""
+        if not self.lazy:
+            return
+        rows = self._rows = _RecordRows(self, self.stages, self.activities, self.conditions, self.transitions)
+        self.stages = LazyRecordMap(list(rows.stages), rows.stage)
+        self.activities = LazyRecordMap(list(rows.activities), rows.activity)
+        self.conditions = LazyRecordMap(list(rows.conditions), rows.condition)
+        self.transitions = LazyRecordMap(list(rows.transitions), rows.transition_group)
+    
+    def _parse_workflow_version(self, fields: RecordFields) -> None:
         """Parse workflow version information."""
-        version_elements = self.document.findall(".//wf_workflow_version")
-        if version_elements:
-            element = version_elements[0]
-            
-            self.workflow_version = WorkflowVersion(
-                id=self._get_element_value(element, "sys_id"),
-                name=self._get_element_value(element, "name"),
-                table=self._get_element_value(element, "table"),
-                active=self._get_element_value(element, "active") == "true",
-                description=self._get_element_value(element, "description"),
-                start_activity_id=self._get_element_attribute(element, "start", "display_value")
-            )
+        # Only the first version record of a document describes the workflow
+        if self._version_parsed:
+            return
+        self._version_parsed = True
+        
+        self.workflow_version = WorkflowVersion(
+            id=self._get_record_value(fields, "sys_id"),
+            name=self._get_record_value(fields, "name"),
+            table=self._get_record_value(fields, "table"),
+            active=self._get_record_value(fields, "active") == "true",
+            description=self._get_record_value(fields, "description"),
+            start_activity_id=self._get_record_attribute(fields, "start", "display_value")
+        )
     
-    def _parse_stages(self) -> None:
-        """Parse workflow stages."""
-        stage_elements = self.document.findall(".//wf_stage")
-        for element in stage_elements:
-            stage_id = self._get_element_value(element, "sys_id")
-            
-            stage = WorkflowStage(
-                id=stage_id,
-                name=self._get_element_value(element, "name"),
-                value=self._get_element_value(element, "value"),
-                order=self._get_element_value(element, "order")
-            )
-            
-            self.stages[stage_id] = stage
+    def _parse_stage(self, fields: RecordFields) -> None:
+        """Parse a workflow stage."""
+        stage_id = self._get_record_value(fields, "sys_id")
+        
+        stage = self._stage_model(
+            id=stage_id,
+            name=self._get_record_value(fields, "name"),
+            value=self._get_record_value(fields, "value"),
+            order=self._get_record_value(fields, "order")
+        )
+        
+        self.stages[stage_id] = stage
     
-    def _parse_activities(self) -> None:
-        """Parse workflow activities."""
-        activity_elements = self.document.findall(".//wf_activity")
-        for element in activity_elements:
-            activity_id = self._get_element_value(element, "sys_id")
-            
-            activity = WorkflowActivity(
-                id=activity_id,
-                name=self._get_element_value(element, "name"),
-                activity_definition=self._get_element_attribute(element, "activity_definition", "display_value"),
-                stage_id=self._get_element_attribute(element, "stage", "display_value"),
-                x=self._get_element_value(element, "x"),
-                y=self._get_element_value(element, "y")
-            )
-            
-            self.activities[activity_id] = activity
+    def _parse_activity(self, fields: RecordFields) -> None:
+        """Parse a workflow activity."""
+        activity_id = self._get_record_value(fields, "sys_id")
+        
+        activity = self._activity_model(
+            id=activity_id,
+            name=self._get_record_value(fields, "name"),
+            activity_definition=self._get_record_attribute(fields, "activity_definition", "display_value"),
+            stage_id=self._get_record_attribute(fields, "stage", "display_value"),
+            x=self._get_record_value(fields, "x"),
+            y=self._get_record_value(fields, "y")
+        )
+        
+        self.activities[activity_id] = activity
     
-    def _parse_conditions(self) -> None:
-        """Parse workflow conditions."""
-        condition_elements = self.document.findall(".//wf_condition")
-        for element in condition_elements:
-            condition_id = self._get_element_value(element, "sys_id")
-            
-            condition = WorkflowCondition(
-                id=condition_id,
-                name=self._get_element_value(element, "name"),
-                activity_id=self._get_element_attribute(element, "activity", "display_value"),
-                condition=self._get_element_value(element, "condition"),
-                order=self._get_element_value(element, "order")
-            )
-            
-            self.conditions[condition_id] = condition
-    
-    def _parse_transitions(self) -> None:
-        """Parse workflow transitions."""
-        transition_elements = self.document.findall(".//wf_transition")
-        for element in transition_elements:
-            transition_id = self._get_element_value(element, "sys_id")
-            from_activity_id = self._get_element_attribute(element, "from", "display_value")
-            
-            transition = WorkflowTransition(
-                id=transition_id,
-                condition_id=self._get_element_attribute(element, "condition", "display_value"),
-                from_activity_id=from_activity_id,
-                to_activity_id=self._get_element_attribute(element, "to", "display_value")
-            )
-            
-            # Store transitions by source activity
-            if from_activity_id not in self.transitions:
-                self.transitions[from_activity_id] = []
-            
-            self.transitions[from_activity_id].append(transition)
+    def _parse_condition(self, fields: RecordFields) -> None:
+        """Parse a workflow condition."""
+        condition_id = self._get_record_value(fields, "sys_id")
+        
+        condition = self._condition_model(
+            id=condition_id,
+            name=self._get_record_value(fields, "name"),
+            activity_id=self._get_record_attribute(fields, "activity", "display_value"),
+            condition=self._get_record_value(fields, "condition"),
+            order=self._get_record_value(fields, "order")
+        )
+        
+        self.conditions[condition_id] = condition
+    
+    def _parse_transition(self, fields: RecordFields) -> None:
+        """Parse a workflow transition."""
+        transition_id = self._get_record_value(fields, "sys_id")
+        from_activity_id = self._get_record_attribute(fields, "from", "display_value")
+        
+        transition = self._transition_model(
+            id=transition_id,
+            condition_id=self._get_record_attribute(fields, "condition", "display_value"),
+            from_activity_id=from_activity_id,
+            to_activity_id=self._get_record_attribute(fields, "to", "display_value")
+        )
+        
+        # Store transitions by source activity
+        if from_activity_id not in self.transitions:
+            self.transitions[from_activity_id] = []
+        
+        self.transitions[from_activity_id].append(transition)
     
-    def _get_element_value(self, parent: ET.Element, tag_name: str) -> str:
+    def _get_record_value(self, fields: RecordFields, tag_name: str) -> str:
         """
-        Get element text value.
+        Get a record field's text value.
         
         Args:
-            parent: Parent element
-            tag_name: Tag name to find
+            fields: Field map of the record
+            tag_name: Tag name of the field
             
         Returns:
-            Text content of the element or empty string
+            Text content of the field or empty string
         """
-        element = parent.find(f".//{tag_name}")
-        if element is not None and element.text is not None:
-            return element.text.strip()
+        field_entry = fields.get(tag_name)
+        if field_entry is not None and field_entry[0] is not None:
+            return field_entry[0].strip()
         return ""
     
-    def _get_element_attribute(self, parent: ET.Element, tag_name: str, attribute_name: str) -> str:
+    def _get_record_attribute(self, fields: RecordFields, tag_name: str, attribute_name: str) -> str:
         """
-        Get element attribute value.
+        Get a record field's attribute value.
         
         Args:
-            parent: Parent element
-            tag_name: Tag name to find
+            fields: Field map of the record
+            tag_name: Tag name of the field
             attribute_name: Attribute name to get
             
         Returns:
-            Attribute value of the element or empty string
+            Attribute value of the field or empty string
         """
-        element = parent.find(f".//{tag_name}")
-        if element is not None and attribute_name in element.attrib:
-            return element.attrib[attribute_name]
+        field_entry = fields.get(tag_name)
+        if field_entry is not None:
+            return field_entry[1].get(attribute_name, "")
         return ""
     
     def get_workflow_version(self) -> WorkflowVersion:
@@ -266,8 +1505,91 @@ class ServiceNowWorkflowParser:
         """Get all parsed transitions."""
         return self.transitions
     
+    def get_graph(self) -> WorkflowGraph:
+        """Get the graph index of the parsed workflow, building it on first use."""
+        if self._graph is None:
+            start = time.perf_counter()
+            if self._rows is not None:
+                self._graph = self._rows.build_graph(self)
+            else:
+                self._graph = WorkflowGraph(
+                    self.activities,
+                    self.transitions,
+                    self.conditions,
+                    self.workflow_version.start_activity_id if self.workflow_version else ""
+                )
+            self._report("graph", time.perf_counter() - start)
+        return self._graph
+    
+    def materialize(self) -> None:
+        """
+        Build every model and replace lazy record mappings and graph
+        columns with plain dicts and lists, so the records can be changed
+        in place. Does nothing when the records are already plain.
+        """
+        if not isinstance(self.activities, LazyRecordMap):
+            return
+        graph = self.get_graph()
+        self.stages = dict(self.stages.items())
+        self.activities = dict(self.activities.items())
+        self.conditions = dict(self.conditions.items())
+        self.transitions = {key: list(transition_list) for key, transition_list in self.transitions.items()}
+        graph.activities = list(graph.activities)
+        graph.out_transitions = list(graph.out_transitions)
+        graph.conditions = self.conditions
+        self._rows = None
+    
+    def copy(self) -> "ServiceNowWorkflowParser":
+        """
+        Copy the parsed workflow, sharing the models, so the copy can be
+        changed in place without affecting this parser.
+    
+        The copy holds plain dicts and lists even when this parser is lazy
+        or a snapshot, and keeps nothing of the source document.
+        """
+        graph = self.get_graph()
+        parser = ServiceNowWorkflowParser(compact=self.compact, backend=self.backend, limits=self.limits)
+        parser.stages = dict(self.stages.items())
+        parser.activities = dict(self.activities.items())
+        parser.conditions = dict(self.conditions.items())
+        parser.transitions = {key: list(transition_list) for key, transition_list in self.transitions.items()}
+        parser.workflow_version = self.workflow_version
+        parser._graph = graph.copy(parser.conditions)
+        return parser
+    
+    def get_record_rows(self) -> RecordRows:
+        """
+        Get every record for reading its fields without building models.
+        
+        A lazy parse answers with the rows it kept, which have the fields
+        of the models; otherwise these are the models themselves.
+        """
+        graph = self.get_graph()
+        if self._rows is not None:
+            return self._rows.record_rows()
+        
+        transitions = []
+        transition_groups = []
+        for key, transition_list in self.transitions.items():
+            transition_groups.append((key, len(transition_list)))
+            transitions.extend(transition_list)
+        positions = {id(transition): position for position, transition in enumerate(transitions)}
+        return RecordRows(
+            stages=list(self.stages.values()),
+            activities=graph.activities,
+            conditions=list(self.conditions.values()),
+            transitions=transitions,
+            transition_groups=transition_groups,
+            out_transitions=[[positions[id(transition)] for transition in transition_list]
+                             for transition_list in graph.out_transitions],
+            dangling=[positions[id(transition)] for transition in graph.dangling]
+        )
+    
     def get_workflow_summary(self) -> WorkflowSummary:
         """Get a simplified view of the workflow."""
+        # Built first, so building the graph is not timed as summary
+        graph = self.get_graph() if self.workflow_version else None
+        start = time.perf_counter()
         summary = WorkflowSummary()
         
         if self.workflow_version:
@@ -276,42 +1598,206 @@ class ServiceNowWorkflowParser:
             summary.description = self.workflow_version.description
             
             # Get the start activity
-            start_activity = self.activities.get(self.workflow_version.start_activity_id)
-            if start_activity:
-                summary.start_activity = start_activity.name
+            if graph.start is not None:
+                summary.start_activity = graph.node_names[graph.start]
             
             # Count stages and activities
             summary.stage_count = len(self.stages)
             summary.activity_count = len(self.activities)
             
             # Map activities to stages
-            stage_activities = {}
-            for activity in self.activities.values():
-                if activity.stage_id and activity.stage_id != "":
-                    if activity.stage_id not in stage_activities:
-                        stage_activities[activity.stage_id] = []
-                    stage_activities[activity.stage_id].append(activity.name)
-            
-            summary.stage_activities = stage_activities
+            summary.stage_activities = {
+                stage_id: [graph.node_names[node] for node in members]
+                for stage_id, members in graph.stage_members.items()
+            }
         
+        self._report("summary", time.perf_counter() - start)
         return summary
 
 
-def parse_workflow_file(file_path: str) -> ServiceNowWorkflowParser:
+# Record builders keyed by the XML tag of the wf_* record they handle
+_RECORD_BUILDERS = {
+    "wf_workflow_version": ServiceNowWorkflowParser._parse_workflow_version,
+    "wf_stage": ServiceNowWorkflowParser._parse_stage,
+    "wf_activity": ServiceNowWorkflowParser._parse_activity,
+    "wf_condition": ServiceNowWorkflowParser._parse_condition,
+    "wf_transition": ServiceNowWorkflowParser._parse_transition,
+}
+
+
+# Reference field tying a record to its owner: the workflow version for
+# stages and activities, the activity for conditions and transitions
+_OWNER_FIELDS = {
+    "wf_stage": "workflow_version",
+    "wf_activity": "workflow_version",
+    "wf_condition": "activity",
+    "wf_transition": "from",
+}
+
+
+def _reference_id(fields: RecordFields, tag_name: str) -> str:
+    """Get the sys_id a reference field points to, falling back to its display value."""
+    field_entry = fields.get(tag_name)
+    if field_entry is None:
+        return ""
+    text, attrib = field_entry
+    return (text or "").strip() or attrib.get("display_value", "")
+
+
+class WorkflowCollection(Mapping):
+    """
+    Workflows of a multi-workflow export, keyed by workflow version sys_id.
+    
+    Records are grouped by their owning workflow version while the export is
+    streamed, but a workflow's models are only built the first time it is
+    accessed. Records whose owner could not be determined are kept in
+    ``unassigned``.
+    """
+    
+    def __init__(self, compact: bool = False):
+        self.compact = compact
+        self.unassigned: List[Tuple[str, RecordFields]] = []
+        self._versions: Dict[str, RecordFields] = {}
+        self._records: Dict[str, List[Tuple[int, str, RecordFields]]] = {}
+        self._parsers: Dict[str, ServiceNowWorkflowParser] = {}
+    
+    def __getitem__(self, version_id: str) -> ServiceNowWorkflowParser:
+        parser = self._parsers.get(version_id)
+        if parser is None:
+            if version_id not in self._versions:
+                raise KeyError(version_id)
+            
+            parser = ServiceNowWorkflowParser(compact=self.compact)
+            parser._add_record("wf_workflow_version", self._versions[version_id])
+            
+            # Records are replayed in document order, as a single parse would see them
+            for _, tag, fields in sorted(self._records.pop(version_id, []), key=lambda record: record[0]):
+                parser._add_record(tag, fields)
+            
+            self._parsers[version_id] = parser
+        return parser
+    
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._versions)
+    
+    def __len__(self) -> int:
+        return len(self._versions)
+    
+    def get_version(self, version_id: str) -> WorkflowVersion:
+        """Get a workflow's version record without building its other models."""
+        parser = self._parsers.get(version_id)
+        if parser is not None:
+            return parser.get_workflow_version()
+        
+        parser = ServiceNowWorkflowParser()
+        parser._add_record("wf_workflow_version", self._versions[version_id])
+        return parser.get_workflow_version()
+    
+    def find(self, name: str) -> Optional[ServiceNowWorkflowParser]:
+        """Get the first workflow with the given name, or None."""
+        for version_id in self._versions:
+            if self.get_version(version_id).name == name:
+                return self[version_id]
+        return None
+
+
+def parse_workflow_collection(
+    source: Union[str, bytes, BinaryIO],
+    version_ids: Optional[List[str]] = None,
+    compact: bool = False,
+    backend: Optional[str] = "auto"
+) -> WorkflowCollection:
+    """
+    Split an export holding many workflow versions into per-workflow models.
+    
+    The export is streamed once. Stages and activities are grouped by their
+    workflow_version reference, conditions and transitions by the activity
+    they belong to. When the export holds a single workflow version, records
+    without a usable reference are assigned to it.
+    
+    Args:
+        source: Path to the XML file, raw XML bytes or a binary file object
+        version_ids: Only keep these workflow versions; records of other
+            workflows are dropped as soon as their owner is known
+        compact: Build the memory-compact model variants
+        backend: XML backend, "lxml", "stdlib", or "auto" for the default
+        
+    Returns:
+        Collection of workflows keyed by workflow version sys_id
+    """
+    collection = WorkflowCollection(compact=compact)
+    selected = set(version_ids) if version_ids is not None else None
+    seen_versions = set()
+    activity_versions: Dict[str, str] = {}
+    pending: Dict[str, List[Tuple[int, str, RecordFields]]] = {}
+    orphans: List[Tuple[int, str, RecordFields]] = []
+    
+    def assign(version_id: str, record: Tuple[int, str, RecordFields]) -> None:
+        if not version_id:
+            orphans.append(record)
+        elif selected is None or version_id in selected:
+            collection._records.setdefault(version_id, []).append(record)
+    
+    for sequence, (tag, fields) in enumerate(iter_records(source, backend)):
+        if tag == "wf_workflow_version":
+            version_id = _reference_id(fields, "sys_id")
+            seen_versions.add(version_id)
+            if (selected is None or version_id in selected) and version_id not in collection._versions:
+                collection._versions[version_id] = fields
+            continue
+        
+        record = (sequence, tag, fields)
+        owner_id = _reference_id(fields, _OWNER_FIELDS[tag])
+        
+        if tag == "wf_stage":
+            assign(owner_id, record)
+        elif tag == "wf_activity":
+            activity_id = _reference_id(fields, "sys_id")
+            activity_versions[activity_id] = owner_id
+            assign(owner_id, record)
+            
+            # Conditions and transitions read before their activity
+            for waiting in pending.pop(activity_id, []):
+                assign(owner_id, waiting)
+        elif owner_id in activity_versions:
+            assign(activity_versions[owner_id], record)
+        else:
+            pending.setdefault(owner_id, []).append(record)
+    
+    for waiting in pending.values():
+        orphans.extend(waiting)
+    
+    if len(seen_versions) == 1:
+        for record in orphans:
+            assign(next(iter(seen_versions)), record)
+    else:
+        collection.unassigned = [(tag, fields) for _, tag, fields in sorted(orphans, key=lambda record: record[0])]
+    
+    return collection
+
+
+def parse_workflow_file(
+    file_path: str,
+    backend: Optional[str] = "auto",
+    lazy: bool = False,
+    limits: Optional[ParseLimits] = None
+) -> ServiceNowWorkflowParser:
     """
     Parse a ServiceNow workflow XML file.
     
     Args:
-        file_path: Path to the XML file
+        file_path: Path to the XML file, which may be gzip, zstd or zip
+            compressed
+        backend: XML backend, "lxml", "stdlib", or "auto" for the default
+        lazy: Build record models on first access only
+        limits: Bounds the document must stay within, or None for none
         
     Returns:
         Initialized parser with parsed workflow data
     """
-    with open(file_path, 'r', encoding='utf-8') as file:
-        xml_content = file.read()
-    
-    parser = ServiceNowWorkflowParser()
-    parser.parse(xml_content)
+    parser = ServiceNowWorkflowParser(backend=backend, lazy=lazy, limits=limits)
+    with open(file_path, 'rb') as file:
+        parser.parse_stream(file)
     return parser
 
 
@@ -335,7 +1821,6 @@ if __name__ == "__main__":
         activities = parser.get_activities()
         stages = parser.get_stages()
         conditions = parser.get_conditions()
-        transitions = parser.get_transitions()
         summary = parser.get_workflow_summary()
         
         # Print workflow summary
@@ -368,17 +1853,22 @@ if __name__ == "__main__":
         
         # Print transitions
         print("\n===== Transitions =====")
-        for from_activity_id, transition_list in transitions.items():
-            from_activity = activities.get(from_activity_id)
-            print(f"From: {from_activity.name if from_activity else from_activity_id}")
+        graph = parser.get_graph()
+        for node, transition_list in enumerate(graph.out_transitions):
+            if not transition_list:
+                continue
+            print(f"From: {graph.node_names[node]}")
             
-            for transition in transition_list:
-                to_activity = activities.get(transition.to_activity_id)
-                condition = conditions.get(transition.condition_id)
+            for target, transition in zip(graph.successors[node], transition_list):
+                condition = graph.condition_for(transition)
                 
-                print(f"  To: {to_activity.name if to_activity else transition.to_activity_id} | "
+                print(f"  To: {graph.node_names[target]} | "
                       f"Condition: {condition.name if condition else transition.condition_id}")
         
+        for transition in graph.dangling:
+            print(f"Unresolved: {transition.from_activity_id} -> {transition.to_activity_id} | "
+                  f"Condition: {transition.condition_id}")
+        
     except Exception as e:
         print(f"Error parsing workflow XML: {e}")
         import traceback
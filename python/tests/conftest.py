@@ -0,0 +1,34 @@
+"""
+Make the modules in the parent directory importable under the names they
+import each other by: servicenow-workflow-parser-python.py is imported as
+servicenow_workflow_parser.
+"""
+
+import importlib.abc
+import importlib.util
+import os
+import sys
+
+MODULE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class _HyphenatedModuleFinder(importlib.abc.MetaPathFinder):
+    """Find modules stored as <name with hyphens>-python.py files."""
+
+    def __init__(self, directory: str):
+        self.paths = {}
+        for file_name in os.listdir(directory):
+            if file_name.endswith(".py"):
+                stem = file_name[:-len(".py")]
+                if stem.endswith("-python"):
+                    stem = stem[:-len("-python")]
+                self.paths[stem.replace("-", "_")] = os.path.join(directory, file_name)
+
+    def find_spec(self, name, path=None, target=None):
+        file_path = self.paths.get(name)
+        if file_path is None:
+            return None
+        return importlib.util.spec_from_file_location(name, file_path)
+
+
+sys.meta_path.append(_HyphenatedModuleFinder(MODULE_DIR))
@@ -0,0 +1,66 @@
+"""Every installed XML backend must read the same records and build the same models."""
+
+import io
+
+import pytest
+
+from servicenow_workflow_parser import ServiceNowWorkflowParser, iter_records, lxml_etree
+from workflow_benchmark import EQUIVALENCE_CASES, generate_workflow_xml
+
+# Backends compared with the standard library, the reference
+OTHER_BACKENDS = [
+    pytest.param(
+        "lxml",
+        marks=pytest.mark.skipif(lxml_etree is None, reason="lxml (5 or later) is not installed")
+    ),
+]
+
+
+def _generated_export(display_values: str) -> bytes:
+    out = io.StringIO()
+    generate_workflow_xml(out, 200, seed=1, display_values=display_values)
+    return out.getvalue().encode("utf-8")
+
+
+CASES = dict(EQUIVALENCE_CASES)
+CASES["generated_sys_id"] = _generated_export("sys_id")
+CASES["generated_name"] = _generated_export("name")
+
+
+def _models(data: bytes, backend: str, stream: bool, **options):
+    parser = ServiceNowWorkflowParser(backend=backend, **options)
+    if stream:
+        parser.parse_stream(data)
+    else:
+        parser.parse(data)
+    return {
+        "version": parser.get_workflow_version(),
+        "activities": dict(parser.get_activities()),
+        "stages": dict(parser.get_stages()),
+        "conditions": dict(parser.get_conditions()),
+        "transitions": dict(parser.get_transitions()),
+        "summary": parser.get_workflow_summary()
+    }
+
+
+@pytest.mark.parametrize("backend", OTHER_BACKENDS)
+@pytest.mark.parametrize("case", sorted(CASES))
+def test_records_match_stdlib(backend, case):
+    data = CASES[case]
+    assert list(iter_records(data, backend)) == list(iter_records(data, "stdlib"))
+
+
+@pytest.mark.parametrize("backend", OTHER_BACKENDS)
+@pytest.mark.parametrize("case", sorted(CASES))
+@pytest.mark.parametrize("stream", [True, False], ids=["streamed", "dom"])
+@pytest.mark.parametrize("options", [{}, {"compact": True}, {"lazy": True}], ids=["plain", "compact", "lazy"])
+def test_models_match_stdlib(backend, case, stream, options):
+    data = CASES[case]
+    assert _models(data, backend, stream, **options) == _models(data, "stdlib", stream, **options)
+
+
+@pytest.mark.parametrize("backend", ["stdlib", *OTHER_BACKENDS])
+def test_internal_entities_are_expanded(backend):
+    fields = dict(iter_records(EQUIVALENCE_CASES["internal_entities"], backend))["wf_activity"]
+    assert fields["name"][0] == "A Acme & Co B"
+    assert fields["description"][0] == "Acme & Co Ltd"
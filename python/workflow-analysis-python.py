@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+ServiceNow Workflow Analysis
+
+Structural checks over a parsed workflow: unreachable activities, dead ends,
+loops, dangling transitions and unused conditions. Every check is a single
+linear pass over the workflow graph, so it is cheap enough to run on every
+upload or as a lint gate over many exports.
+"""
+
+import argparse
+import json
+import sys
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List, Any, Iterable, Sequence, Set, Tuple
+
+from servicenow_workflow_parser import ServiceNowWorkflowParser, WorkflowGraph
+from workflow_snapshot import load_workflow
+
+
+# Activity definitions and names that mark an intended end of the workflow
+END_ACTIVITY_NAMES = frozenset(["end"])
+
+
+@dataclass
+class WorkflowAnalysis:
+    """Structural findings for a parsed workflow."""
+    start_found: bool = False
+    unreachable_activities: List[str] = field(default_factory=list)
+    dead_end_activities: List[str] = field(default_factory=list)
+    loops: List[List[str]] = field(default_factory=list)
+    dangling_transitions: List[str] = field(default_factory=list)
+    unused_conditions: List[str] = field(default_factory=list)
+
+    @property
+    def issue_count(self) -> int:
+        """Number of findings, counting a missing start activity as one."""
+        return ((0 if self.start_found else 1) + len(self.unreachable_activities) +
+                len(self.dead_end_activities) + len(self.dangling_transitions) +
+                len(self.unused_conditions))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Get a JSON-serializable representation including the issue count."""
+        result = asdict(self)
+        result["issue_count"] = self.issue_count
+        return result
+
+
+def reachable_nodes(graph: WorkflowGraph, start: int) -> bytearray:
+    """Mark every node reachable from start with a breadth-first search."""
+    reached = bytearray(len(graph))
+    reached[start] = 1
+    queue = [start]
+    for node in queue:
+        for target in graph.successors[node]:
+            if not reached[target]:
+                reached[target] = 1
+                queue.append(target)
+    return reached
+
+
+def strongly_connected_components(graph: WorkflowGraph) -> List[List[int]]:
+    """
+    Find strongly connected components with an iterative Tarjan's algorithm.
+
+    Returns:
+        Components as lists of node ids, in reverse topological order
+    """
+    count = len(graph)
+    index_of = [-1] * count
+    low_link = [0] * count
+    on_stack = bytearray(count)
+    stack = []
+    components = []
+    next_index = 0
+
+    for root in range(count):
+        if index_of[root] != -1:
+            continue
+
+        # Each frame is (node, index of the next successor to visit)
+        work = [(root, 0)]
+        while work:
+            node, position = work[-1]
+
+            if position == 0:
+                index_of[node] = low_link[node] = next_index
+                next_index += 1
+                stack.append(node)
+                on_stack[node] = 1
+
+            successors = graph.successors[node]
+            while position < len(successors):
+                target = successors[position]
+                position += 1
+                if index_of[target] == -1:
+                    work[-1] = (node, position)
+                    work.append((target, 0))
+                    break
+                if on_stack[target]:
+                    low_link[node] = min(low_link[node], index_of[target])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low_link[parent] = min(low_link[parent], low_link[node])
+
+                if low_link[node] == index_of[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack[member] = 0
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(component)
+
+    return components
+
+
+def _is_end_activity(activity: Any) -> bool:
+    """Check whether an activity, or a row of its fields, is meant to end the workflow."""
+    return (activity.activity_definition.lower() in END_ACTIVITY_NAMES or
+            activity.name.lower() in END_ACTIVITY_NAMES)
+
+
+def used_condition_ids(graph: WorkflowGraph, conditions: Sequence[Any], transitions: Iterable[Any]) -> Set[str]:
+    """
+    Find the conditions some transition refers to, by sys_id or by name
+    within the transition's source activity, as WorkflowGraph.condition_for
+    resolves them.
+
+    Args:
+        graph: Graph index of the workflow
+        conditions: Conditions, or rows of their fields
+        transitions: Transitions, or rows of their fields
+
+    Returns:
+        sys_ids of the used conditions
+    """
+    condition_ids = {condition.id for condition in conditions}
+    condition_names: Dict[Tuple[int, str], str] = {}
+    for condition in conditions:
+        node = graph.resolve(condition.activity_id)
+        if node is not None:
+            condition_names.setdefault((node, condition.name), condition.id)
+
+    used = set()
+    for transition in transitions:
+        if transition.condition_id in condition_ids:
+            used.add(transition.condition_id)
+            continue
+        source = graph.resolve(transition.from_activity_id)
+        if source is not None:
+            condition_id = condition_names.get((source, transition.condition_id))
+            if condition_id is not None:
+                used.add(condition_id)
+    return used
+
+
+def analyze_workflow(parser: ServiceNowWorkflowParser) -> WorkflowAnalysis:
+    """
+    Run every structural check on a parsed workflow.
+
+    Args:
+        parser: Initialized workflow parser with data
+
+    Returns:
+        Findings, with activities, transitions and conditions given by sys_id
+    """
+    graph = parser.get_graph()
+    # Rows of a lazy parse are read as they are; no model is built
+    rows = parser.get_record_rows()
+    analysis = WorkflowAnalysis(start_found=graph.start is not None)
+
+    if graph.start is not None:
+        reached = reachable_nodes(graph, graph.start)
+        analysis.unreachable_activities = [graph.node_ids[node] for node in range(len(graph)) if not reached[node]]
+
+    analysis.dead_end_activities = [
+        graph.node_ids[node] for node in range(len(graph))
+        if not graph.successors[node] and not _is_end_activity(rows.activities[node])
+    ]
+
+    for component in strongly_connected_components(graph):
+        node = component[0]
+        if len(component) > 1 or node in graph.successors[node]:
+            analysis.loops.append([graph.node_ids[member] for member in reversed(component)])
+
+    analysis.dangling_transitions = [transition.id for transition in graph.dangling]
+
+    used_conditions = used_condition_ids(graph, rows.conditions, rows.transitions)
+    analysis.unused_conditions = [
+        condition_id for condition_id in parser.get_conditions() if condition_id not in used_conditions
+    ]
+
+    return analysis
+
+
+def main() -> int:
+    """Lint entry point; exits non-zero when any workflow has findings."""
+    parser = argparse.ArgumentParser(
+        description="Check ServiceNow workflow XML files for structural problems"
+    )
+
+    parser.add_argument(
+        "files",
+        nargs="+",
+        help="Paths to ServiceNow workflow XML files or snapshots"
+    )
+
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Print one JSON object per file instead of text"
+    )
+
+    parser.add_argument(
+        "--allow-loops",
+        action="store_true",
+        help="Report loops without failing on them"
+    )
+
+    args = parser.parse_args()
+    failed = False
+
+    for file_path in args.files:
+        try:
+            analysis = analyze_workflow(load_workflow(file_path))
+        except Exception as e:
+            failed = True
+            if args.json:
+                print(json.dumps({"file": file_path, "error": f"{type(e).__name__}: {e}"}))
+            else:
+                print(f"{file_path}: error: {e}")
+            continue
+
+        if analysis.issue_count or (analysis.loops and not args.allow_loops):
+            failed = True
+
+        if args.json:
+            print(json.dumps({"file": file_path, **analysis.to_dict()}))
+            continue
+
+        if not analysis.start_found:
+            print(f"{file_path}: start activity not found")
+        for activity_id in analysis.unreachable_activities:
+            print(f"{file_path}: unreachable activity {activity_id}")
+        for activity_id in analysis.dead_end_activities:
+            print(f"{file_path}: dead-end activity {activity_id}")
+        for loop in analysis.loops:
+            print(f"{file_path}: loop through {', '.join(loop)}")
+        for transition_id in analysis.dangling_transitions:
+            print(f"{file_path}: dangling transition {transition_id}")
+        for condition_id in analysis.unused_conditions:
+            print(f"{file_path}: condition without transitions {condition_id}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
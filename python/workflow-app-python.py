@@ -13,75 +13,51 @@ from typing import Dict, List, Any, Optional, Tuple
 
 from servicenow_workflow_parser import (
     ServiceNowWorkflowParser, 
-    WorkflowActivity, 
-    WorkflowCondition,
+    WorkflowGraph,
     parse_workflow_file
 )
+from workflow_paths import iter_path_lines, iter_paths
+from workflow_serializer import write_workflow_json
 
 
 def generate_path(
-    activity_id: str,
-    activities: Dict[str, WorkflowActivity],
-    transitions: Dict[str, List[Any]],
-    conditions: Dict[str, WorkflowCondition],
-    indent: str = "",
-    visited: Optional[List[str]] = None
+    graph: WorkflowGraph,
+    activity_id: Optional[str] = None,
+    max_depth: Optional[int] = None,
+    max_lines: Optional[int] = None
 ) -> None:
     """
-    Generate workflow path recursively.
+    Print the workflow paths as an indented tree.
     
     Args:
-        activity_id: Current activity ID
-        activities: Dictionary of activities
-        transitions: Dictionary of transitions
-        conditions: Dictionary of conditions
-        indent: String indentation for current level
-        visited: List of already visited activity IDs to prevent cycles
+        graph: Graph index of the workflow
+        activity_id: Activity sys_id or name to start from, defaults to the
+            workflow's start activity
+        max_depth: Maximum nesting depth printed
+        max_lines: Stop after printing this many lines
     """
-    if visited is None:
-        visited = []
-    
-    # Prevent infinite loops
-    if activity_id in visited:
-        print(f"{indent}... (cycle detected, already visited {activity_id})")
-        return
-    
-    visited.append(activity_id)
-    
-    # Get activity
-    activity = activities.get(activity_id)
-    if not activity:
-        print(f"{indent}Unknown Activity: {activity_id}")
+    start = graph.resolve(activity_id) if activity_id else graph.start
+    if start is None:
+        print(f"Unknown Activity: {activity_id}")
         return
     
-    # Print current activity
-    print(f"{indent}Activity: {activity.name}")
-    
-    # Get transitions from this activity
-    activity_transitions = transitions.get(activity_id, [])
-    if not activity_transitions:
-        print(f"{indent}  (End of path)")
-        return
+    for line in iter_path_lines(graph, start, max_depth, max_lines):
+        print(line)
+
+
+def print_paths(graph: WorkflowGraph, max_depth: Optional[int] = None, max_paths: Optional[int] = None) -> None:
+    """
+    Print every path from the start activity, one per line.
     
-    # Follow each transition
-    for transition in activity_transitions:
-        condition = conditions.get(transition.condition_id)
-        condition_name = condition.name if condition else "Unknown"
-        
-        print(f"{indent}  → [{condition_name}]")
-        
-        # Follow the path recursively (avoiding infinite loops)
-        if len(indent) < 40:  # Simple depth limitation for readability
-            generate_path(
-                transition.to_activity_id,
-                activities,
-                transitions,
-                conditions,
-                indent + "    ",
-                visited.copy()  # Create a copy to avoid modifying parent's visited list
-            )
-        else:
-            print(f"{indent}    ... (path continues, max depth reached)")
+    Args:
+        graph: Graph index of the workflow
+        max_depth: Maximum number of transitions followed on one path
+        max_paths: Stop after printing this many paths
+    """
+    for path in iter_paths(graph, max_depth=max_depth, max_paths=max_paths):
+        names = " → ".join(graph.node_names[node] for node in path.nodes)
+        suffix = {"cycle": " ↺", "depth": " …"}.get(path.end, "")
+        print(f"{names}{suffix}")
 
 
 def visualize_workflow(parser: ServiceNowWorkflowParser) -> None:
@@ -92,14 +68,10 @@ def visualize_workflow(parser: ServiceNowWorkflowParser) -> None:
         parser: Initialized workflow parser with data
     """
     workflow = parser.get_workflow_version()
-    activities = parser.get_activities()
-    transitions = parser.get_transitions()
+    graph = parser.get_graph()
     
     # Get the start activity
-    start_id = workflow.start_activity_id
-    start_activity = activities.get(start_id)
-    
-    if not start_activity:
+    if graph.start is None:
         print("Could not find start activity")
         return
     
@@ -111,43 +83,33 @@ def visualize_workflow(parser: ServiceNowWorkflowParser) -> None:
     visited = set()
     
     # Recursively print the workflow path
-    def print_path(activity_id: str, depth: int = 0) -> None:
-        if activity_id in visited:
+    def print_path(node: int, depth: int = 0) -> None:
+        if node in visited:
             print("  " * depth + "↓")
             print("  " * depth + "(cycle detected)")
             return
         
-        visited.add(activity_id)
-        
-        activity = activities.get(activity_id)
-        if not activity:
-            return
+        visited.add(node)
         
         print("  " * depth + "↓")
-        print("  " * depth + f"[{activity.name}]")
+        print("  " * depth + f"[{graph.node_names[node]}]")
         
-        activity_transitions = transitions.get(activity_id, [])
-        if not activity_transitions:
+        successors = graph.successors[node]
+        if not successors:
             return
         
         # More than one outgoing transition creates branches
-        if len(activity_transitions) > 1:
-            for i, transition in enumerate(activity_transitions):
-                to_id = transition.to_activity_id
-                to_activity = activities.get(to_id)
-                if not to_activity:
-                    continue
-                
-                print("  " * depth + f"{'├' if i < len(activity_transitions) - 1 else '└'}→ {to_activity.name}")
-                if to_id not in visited:
-                    print_path(to_id, depth + 2)
+        if len(successors) > 1:
+            for i, to_node in enumerate(successors):
+                print("  " * depth + f"{'├' if i < len(successors) - 1 else '└'}→ {graph.node_names[to_node]}")
+                if to_node not in visited:
+                    print_path(to_node, depth + 2)
         else:
             # Single transition, continue the path
-            to_id = activity_transitions[0].to_activity_id
-            print_path(to_id, depth)
+            print_path(successors[0], depth)
     
     # Start printing from the beginning
-    print_path(start_id)
+    print_path(graph.start)
 
 
 def export_as_json(parser: ServiceNowWorkflowParser, output_file: str) -> None:
@@ -159,20 +121,15 @@ def export_as_json(parser: ServiceNowWorkflowParser, output_file: str) -> None:
         output_file: Path to output JSON file
     """
     try:
-        # Create a serializable representation of the workflow
-        workflow_json = {
-            "workflow_version": vars(parser.get_workflow_version()),
-            "activities": {k: vars(v) for k, v in parser.get_activities().items()},
-            "stages": {k: vars(v) for k, v in parser.get_stages().items()},
-            "conditions": {k: vars(v) for k, v in parser.get_conditions().items()},
-            "transitions": {
-                k: [vars(t) for t in v] for k, v in parser.get_transitions().items()
-            },
-            "summary": vars(parser.get_workflow_summary())
-        }
-        
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(workflow_json, f, indent=2)
+        # Stream the workflow to the file record by record
+        with open(output_file, 'wb') as f:
+            write_workflow_json(
+                parser,
+                f,
+                sections=("version", "activities", "stages", "conditions", "transitions", "summary"),
+                indent=2,
+                keys={"version": "workflow_version"}
+            )
         
         print(f"Workflow data exported to {output_file}")
         
@@ -209,6 +166,25 @@ def main() -> None:
         help="Generate a textual representation of the workflow path"
     )
     
+    parser.add_argument(
+        "--list-paths",
+        action="store_true",
+        help="List every path from the start activity, one per line"
+    )
+    
+    parser.add_argument(
+        "--max-depth",
+        type=int,
+        help="Maximum depth followed by --path and --list-paths"
+    )
+    
+    parser.add_argument(
+        "--max-paths",
+        type=int,
+        default=1000,
+        help="Maximum number of paths listed by --list-paths (default: 1000)"
+    )
+    
     args = parser.parse_args()
     
     try:
@@ -234,15 +210,13 @@ def main() -> None:
         
         # Generate path if requested
         if args.path:
-            # Get workflow details
-            version = workflow_parser.get_workflow_version()
-            activities = workflow_parser.get_activities()
-            conditions = workflow_parser.get_conditions()
-            transitions = workflow_parser.get_transitions()
-            
             print("\n===== Workflow Path =====")
-            start_id = version.start_activity_id
-            generate_path(start_id, activities, transitions, conditions)
+            generate_path(workflow_parser.get_graph(), max_depth=args.max_depth)
+        
+        # List paths if requested
+        if args.list_paths:
+            print("\n===== Workflow Paths =====")
+            print_paths(workflow_parser.get_graph(), args.max_depth, args.max_paths)
         
     except Exception as e:
         print(f"Error processing workflow: {e}")
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+ServiceNow Workflow Batch Parser
+
+Parses many ServiceNow workflow XML exports in parallel and streams one
+NDJSON result per file, in completion order, followed by an aggregate report.
+"""
+
+import argparse
+import fnmatch
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+from typing import Dict, List, Any, Iterable, Iterator
+
+from workflow_serializer import record_to_dict
+from workflow_snapshot import load_workflow
+
+
+# Number of slowest files listed in the aggregate report
+SLOWEST_FILES = 10
+
+# Export file names looked for inside directories, plain or compressed
+DEFAULT_PATTERN = "*.xml,*.xml.gz,*.xml.zst,*.zip"
+
+
+def find_export_files(inputs: Iterable[str], pattern: str = DEFAULT_PATTERN) -> List[str]:
+    """
+    Expand files, directories and glob patterns into export file paths.
+
+    Args:
+        inputs: Paths to files or directories, or glob patterns
+        pattern: Comma separated file name patterns matched inside directories
+
+    Returns:
+        Sorted, de-duplicated list of file paths
+    """
+    files = set()
+    patterns = [p for p in pattern.split(",") if p]
+
+    for entry in inputs:
+        if os.path.isdir(entry):
+            for directory, _, names in os.walk(entry):
+                for name in names:
+                    if any(fnmatch.fnmatch(name, p) for p in patterns):
+                        files.add(os.path.join(directory, name))
+        elif any(char in entry for char in "*?["):
+            files.update(path for path in glob.glob(entry, recursive=True) if os.path.isfile(path))
+        else:
+            files.add(entry)
+
+    return sorted(files)
+
+
+def parse_export(file_path: str) -> Dict[str, Any]:
+    """
+    Parse one export and describe the outcome.
+
+    Never raises, so one bad file cannot abort a batch.
+
+    Args:
+        file_path: Path to the XML file, possibly compressed, or snapshot
+
+    Returns:
+        Result record with the summary and record counts, or the error
+    """
+    start = time.perf_counter()
+    result = {"type": "result", "file": file_path}
+
+    try:
+        # Only the summary and counts are needed, so no record models are built
+        parser = load_workflow(file_path, lazy=True)
+        summary = parser.get_workflow_summary()
+        graph = parser.get_graph()
+
+        result["success"] = True
+        result["summary"] = record_to_dict(summary)
+        result["counts"] = {
+            "activities": len(parser.get_activities()),
+            "stages": len(parser.get_stages()),
+            "conditions": len(parser.get_conditions()),
+            "transitions": graph.edge_count + len(graph.dangling)
+        }
+        # Empty for snapshots, which are not parsed
+        result["inputBytes"] = parser.stats.input_bytes
+        result["phases"] = {phase: round(seconds, 6) for phase, seconds in parser.stats.phases.items()}
+    except Exception as e:
+        result["success"] = False
+        result["error"] = f"{type(e).__name__}: {e}"
+
+    result["seconds"] = round(time.perf_counter() - start, 6)
+    return result
+
+
+def parse_exports(files: List[str], workers: int, chunksize: int) -> Iterator[Dict[str, Any]]:
+    """
+    Parse exports in a process pool, yielding results as they complete.
+
+    Args:
+        files: Export file paths
+        workers: Number of worker processes; 1 parses in this process
+        chunksize: Files handed to a worker at a time
+    """
+    if workers <= 1:
+        for file_path in files:
+            yield parse_export(file_path)
+        return
+
+    with multiprocessing.Pool(processes=workers) as pool:
+        yield from pool.imap_unordered(parse_export, files, chunksize)
+
+
+def build_report(results: List[Dict[str, Any]], wall_seconds: float) -> Dict[str, Any]:
+    """Aggregate per-file results into the final report record."""
+    succeeded = [r for r in results if r["success"]]
+    totals = {"activities": 0, "stages": 0, "conditions": 0, "transitions": 0}
+    for result in succeeded:
+        for key in totals:
+            totals[key] += result["counts"][key]
+
+    slowest = sorted(results, key=lambda r: r["seconds"], reverse=True)[:SLOWEST_FILES]
+
+    return {
+        "type": "report",
+        "files": len(results),
+        "succeeded": len(succeeded),
+        "failed": len(results) - len(succeeded),
+        "totals": totals,
+        "wallSeconds": round(wall_seconds, 6),
+        "parseSeconds": round(sum(r["seconds"] for r in results), 6),
+        "slowest": [{"file": r["file"], "seconds": r["seconds"]} for r in slowest],
+        "errors": [{"file": r["file"], "error": r["error"]} for r in results if not r["success"]]
+    }
+
+
+def main() -> int:
+    """Batch entry point."""
+    parser = argparse.ArgumentParser(
+        description="Parse many ServiceNow workflow XML exports in parallel and report as NDJSON"
+    )
+
+    parser.add_argument(
+        "inputs",
+        nargs="+",
+        help="Export files, directories or glob patterns"
+    )
+
+    parser.add_argument(
+        "--pattern",
+        default=DEFAULT_PATTERN,
+        help=f"Comma separated file name patterns used inside directories (default: {DEFAULT_PATTERN})"
+    )
+
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of worker processes (default: number of CPUs)"
+    )
+
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=0,
+        help="Files handed to a worker at a time (default: chosen from the batch size)"
+    )
+
+    parser.add_argument(
+        "--output",
+        metavar="FILE",
+        help="Write NDJSON to FILE instead of standard output"
+    )
+
+    args = parser.parse_args()
+
+    files = find_export_files(args.inputs, args.pattern)
+    if not files:
+        print("No workflow exports found", file=sys.stderr)
+        return 1
+
+    workers = max(1, min(args.workers, len(files)))
+    chunksize = args.chunksize or max(1, min(64, len(files) // (workers * 4)))
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    start = time.perf_counter()
+    results = []
+
+    try:
+        for result in parse_exports(files, workers, chunksize):
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+
+            # Only what the report needs is kept, not every summary
+            results.append({k: v for k, v in result.items() if k not in ("summary", "phases")})
+
+        out.write(json.dumps(build_report(results, time.perf_counter() - start)) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    # Non-zero when any export failed to parse
+    return 0 if all(r["success"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,628 @@
+#!/usr/bin/env python3
+"""
+ServiceNow Workflow Parser Benchmarks
+
+Generates synthetic ServiceNow workflow exports and times the parser, the
+summary, the JSON export and the path traversals, on them and on real
+exports such as uploads kept by parse profiling. Results are recorded to a
+JSON baseline and later runs are checked against it for regressions.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Any, Sequence, TextIO
+from xml.sax.saxutils import quoteattr
+
+from servicenow_workflow_parser import (
+    ServiceNowWorkflowParser,
+    iter_records,
+    lxml_etree,
+    open_export,
+    resolve_backend,
+)
+from workflow_app import export_as_json, generate_path, visualize_workflow
+from workflow_layout import compute_layout
+
+
+# Benchmarked operations in the order they are reported
+OPERATIONS = [
+    "parse", "parse_stream", "parse_summary", "parse_summary_lazy",
+    "summary", "export_json", "generate_path", "visualize", "layout"
+]
+
+# Metrics compared against the baseline
+REGRESSION_METRICS = ["wall_min", "peak_rss_kb", "alloc_peak_bytes"]
+
+# How far back or forward a generated transition may jump
+TRANSITION_WINDOW = 10
+
+# Small exports exercising the corners where XML backends could differ
+EQUIVALENCE_CASES = {
+    "comments_and_pis": (
+        b'<?xml version="1.0" encoding="UTF-8"?><unload><!-- export -->'
+        b'<wf_activity><?pi data?><name>A<!-- inline --></name><sys_id>a1</sys_id></wf_activity></unload>'
+    ),
+    "cdata_and_entities": (
+        b'<unload><wf_condition><condition><![CDATA[a < b && c]]></condition>'
+        b'<name>x &amp; y &#169;</name><activity display_value="&quot;q&quot;">a1</activity>'
+        b'<sys_id>c1</sys_id></wf_condition></unload>'
+    ),
+    "latin1": (
+        '<?xml version="1.0" encoding="ISO-8859-1"?><unload><wf_stage><name>Étape</name>'
+        '<sys_id>s1</sys_id><order>1</order></wf_stage></unload>'.encode("latin-1")
+    ),
+    "whitespace_and_empty": (
+        b'<unload>\n  <wf_activity>\n    <name>  padded  </name>\n    <stage/>\n    <x></x>\n'
+        b'    <sys_id>a1</sys_id>\n  </wf_activity>\n</unload>'
+    ),
+    "duplicate_fields": (
+        b'<unload><wf_activity><name>first</name><name>second</name><sys_id>a1</sys_id></wf_activity></unload>'
+    ),
+    "nested_and_wrapped": (
+        b'<unload><batch><wf_activity><name>A</name><sys_id>a1</sys_id></wf_activity>'
+        b'<other><x>1</x></other><wf_activity><name>B</name><sys_id>a2</sys_id>'
+        b'<wf_condition><name>inner</name><sys_id>c1</sys_id></wf_condition></wf_activity></batch>'
+        b'<wf_transition><from display_value="a1">a1</from><to display_value="a2">a2</to>'
+        b'<sys_id>t1</sys_id></wf_transition></unload>'
+    ),
+    "internal_entities": (
+        b'<?xml version="1.0"?><!DOCTYPE unload [<!ENTITY co "Acme &amp; Co"><!ENTITY n "&co; Ltd">]>'
+        b'<unload><wf_activity><name>A &co; B</name><description>&n;</description>'
+        b'<sys_id>a1</sys_id></wf_activity></unload>'
+    ),
+    "namespaced": (
+        b'<unload xmlns:sn="urn:sn"><wf_activity><sn:name>ns</sn:name><name>plain</name>'
+        b'<sys_id sn:kind="id">a1</sys_id></wf_activity></unload>'
+    ),
+}
+
+
+def _sys_id(kind: int, index: int) -> str:
+    """Build a deterministic 32 character sys_id for a generated record."""
+    return f"{kind:02x}{index:030x}"
+
+
+def generate_workflow_xml(
+    out: TextIO,
+    activity_count: int,
+    stage_count: int = 5,
+    branching: int = 2,
+    cycle_density: float = 0.05,
+    seed: int = 0,
+    display_values: str = "sys_id"
+) -> None:
+    """
+    Write a synthetic ServiceNow workflow export.
+
+    Records are written one at a time, so exports of any size can be
+    generated without holding them in memory.
+
+    Args:
+        out: Text stream to write the XML to
+        activity_count: Number of wf_activity records
+        stage_count: Number of wf_stage records
+        branching: Maximum number of outgoing transitions per activity
+        cycle_density: Probability that a transition points backwards
+        seed: Random seed, so the same arguments give the same export
+        display_values: "sys_id" to put sys_ids in reference display values
+            (what the parser keys on), or "name" as real exports do
+    """
+    rng = random.Random(seed)
+    activity_count = max(activity_count, 2)
+    version_id = _sys_id(1, 0)
+
+    def reference(tag: str, sys_id: str, name: str) -> str:
+        display = sys_id if display_values == "sys_id" else name
+        return f"<{tag} display_value={quoteattr(display)}>{sys_id}</{tag}>"
+
+    def activity_name(index: int) -> str:
+        if index == 0:
+            return "Begin"
+        if index == activity_count - 1:
+            return "End"
+        return f"Activity {index}"
+
+    out.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+    out.write('<unload unload_date="2024-01-01 00:00:00">\n')
+
+    out.write('<wf_workflow_version action="INSERT_OR_UPDATE">')
+    out.write("<active>true</active>")
+    out.write(f"<description>Synthetic workflow with {activity_count} activities</description>")
+    out.write("<name>Synthetic Workflow</name>")
+    out.write(reference("start", _sys_id(3, 0), activity_name(0)))
+    out.write(f"<sys_id>{version_id}</sys_id>")
+    out.write("<table>sc_req_item</table>")
+    out.write("</wf_workflow_version>\n")
+
+    for index in range(stage_count):
+        out.write('<wf_stage action="INSERT_OR_UPDATE">')
+        out.write(f"<name>Stage {index}</name>")
+        out.write(f"<order>{(index + 1) * 100}</order>")
+        out.write(f"<sys_id>{_sys_id(2, index)}</sys_id>")
+        out.write(f"<value>stage_{index}</value>")
+        out.write(reference("workflow_version", version_id, "Synthetic Workflow"))
+        out.write("</wf_stage>\n")
+
+    definitions = ["Approval - User", "Run Script", "If", "Set Values", "Notification", "Timer"]
+    for index in range(activity_count):
+        if index == 0:
+            definition = "Begin"
+        elif index == activity_count - 1:
+            definition = "End"
+        else:
+            definition = definitions[index % len(definitions)]
+
+        out.write('<wf_activity action="INSERT_OR_UPDATE">')
+        out.write(reference("activity_definition", _sys_id(9, index % 16), definition))
+        out.write(f"<name>{activity_name(index)}</name>")
+        if stage_count:
+            stage_index = index * stage_count // activity_count
+            out.write(reference("stage", _sys_id(2, stage_index), f"Stage {stage_index}"))
+        else:
+            out.write("<stage/>")
+        out.write(f"<sys_id>{_sys_id(3, index)}</sys_id>")
+        out.write(reference("workflow_version", version_id, "Synthetic Workflow"))
+        out.write(f"<x>{(index % 20) * 150}</x>")
+        out.write(f"<y>{(index // 20) * 100}</y>")
+        out.write("</wf_activity>\n")
+
+    # Every activity but the last gets 1..branching conditions, each with a transition
+    edges = []
+    condition_index = 0
+    for index in range(activity_count - 1):
+        for order in range(rng.randint(1, max(branching, 1))):
+            if index > 0 and rng.random() < cycle_density:
+                target = rng.randint(max(0, index - TRANSITION_WINDOW), index)
+            else:
+                target = rng.randint(index + 1, min(activity_count - 1, index + TRANSITION_WINDOW))
+
+            condition_id = _sys_id(4, condition_index)
+            out.write('<wf_condition action="INSERT_OR_UPDATE">')
+            out.write(reference("activity", _sys_id(3, index), activity_name(index)))
+            out.write(f"<condition>branch == {order}</condition>")
+            out.write(f"<name>Branch {order}</name>")
+            out.write(f"<order>{order + 1}</order>")
+            out.write(f"<sys_id>{condition_id}</sys_id>")
+            out.write("</wf_condition>\n")
+
+            edges.append((condition_index, order, index, target))
+            condition_index += 1
+
+    for transition_index, (condition_number, order, source, target) in enumerate(edges):
+        out.write('<wf_transition action="INSERT_OR_UPDATE">')
+        out.write(reference("condition", _sys_id(4, condition_number), f"Branch {order}"))
+        out.write(reference("from", _sys_id(3, source), activity_name(source)))
+        out.write(f"<sys_id>{_sys_id(5, transition_index)}</sys_id>")
+        out.write(reference("to", _sys_id(3, target), activity_name(target)))
+        out.write("</wf_transition>\n")
+
+    out.write("</unload>\n")
+
+
+def _parse_file(xml_path: str, backend: str = "auto", lazy: bool = False) -> ServiceNowWorkflowParser:
+    """Parse a benchmark input with the streaming parser."""
+    parser = ServiceNowWorkflowParser(backend=backend, lazy=lazy)
+    with open(xml_path, "rb") as f:
+        parser.parse_stream(f)
+    return parser
+
+
+def _parse_summary(xml_path: str, backend: str, lazy: bool) -> None:
+    """What a summary request does: parse, then summarize and count."""
+    parser = _parse_file(xml_path, backend, lazy)
+    parser.get_workflow_summary()
+    len(parser.get_conditions())
+
+
+def _operation(name: str, xml_path: str, workdir: str, backend: str = "auto"):
+    """
+    Prepare a benchmarked operation.
+
+    Returns:
+        Callable running the operation once; setup such as parsing the input
+        for the non-parse operations is done here and not timed
+    """
+    if name == "parse":
+        with open(xml_path, "r", encoding="utf-8") as f:
+            xml_content = f.read()
+        return lambda: ServiceNowWorkflowParser(backend=backend).parse(xml_content)
+
+    if name == "parse_stream":
+        return lambda: _parse_file(xml_path, backend)
+
+    if name in ("parse_summary", "parse_summary_lazy"):
+        return lambda: _parse_summary(xml_path, backend, name == "parse_summary_lazy")
+
+    parser = _parse_file(xml_path, backend)
+
+    if name == "summary":
+        return parser.get_workflow_summary
+
+    if name == "export_json":
+        output_file = os.path.join(workdir, "export.json")
+        return lambda: export_as_json(parser, output_file)
+
+    if name == "generate_path":
+        return lambda: generate_path(parser.get_graph())
+
+    if name == "visualize":
+        return lambda: visualize_workflow(parser)
+
+    if name == "layout":
+        # Not the cached layout, which would only be computed once
+        return lambda: compute_layout(parser.get_graph())
+
+    raise ValueError(f"Unknown operation: {name}")
+
+
+def _run_case(name: str, xml_path: str, repeat: int, backend: str = "auto") -> Dict[str, Any]:
+    """
+    Measure one operation on one input.
+
+    Runs in a fresh worker process so peak RSS belongs to this case only.
+    """
+    workdir = tempfile.mkdtemp(prefix="wf-bench-")
+    result = {}
+
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            run = _operation(name, xml_path, workdir, backend)
+
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                run()
+                timings.append(time.perf_counter() - start)
+
+            tracemalloc.start()
+            run()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        result["wall_min"] = min(timings)
+        result["wall_median"] = statistics.median(timings)
+        result["alloc_peak_bytes"] = peak
+        result["alloc_net_bytes"] = current
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        for entry in os.listdir(workdir):
+            os.unlink(os.path.join(workdir, entry))
+        os.rmdir(workdir)
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result["peak_rss_kb"] = max_rss // 1024 if sys.platform == "darwin" else max_rss
+    return result
+
+
+def run_benchmarks(
+    sizes: List[int],
+    operations: List[str],
+    repeat: int = 3,
+    branching: int = 2,
+    cycle_density: float = 0.05,
+    stage_count: int = 5,
+    seed: int = 0,
+    backend: str = "auto",
+    files: Sequence[str] = ()
+) -> Dict[str, Any]:
+    """
+    Run every operation against a synthetic export of every size, and
+    against the given export files.
+
+    Args:
+        files: Real exports, possibly compressed; they are decompressed
+            first so every operation reads plain XML
+
+    Returns:
+        Benchmark report with run metadata and results keyed by
+        "<operation>/<activity count>" or "<operation>/<file name>"
+    """
+    results = {}
+
+    with tempfile.TemporaryDirectory(prefix="wf-bench-") as tmpdir:
+        inputs = []
+        for size in sizes:
+            xml_path = os.path.join(tmpdir, f"workflow-{size}.xml")
+            with open(xml_path, "w", encoding="utf-8") as f:
+                generate_workflow_xml(f, size, stage_count, branching, cycle_density, seed)
+            inputs.append((str(size), xml_path))
+
+        for position, file_path in enumerate(files):
+            xml_path = os.path.join(tmpdir, f"file-{position}.xml")
+            with open_export(file_path) as source, open(xml_path, "wb") as f:
+                shutil.copyfileobj(source, f)
+            inputs.append((os.path.basename(file_path), xml_path))
+
+        for label, xml_path in inputs:
+            for name in operations:
+                with ProcessPoolExecutor(max_workers=1) as executor:
+                    result = executor.submit(_run_case, name, xml_path, repeat, backend).result()
+
+                result["input_bytes"] = os.path.getsize(xml_path)
+                results[f"{name}/{label}"] = result
+                print(_format_result(f"{name}/{label}", result), file=sys.stderr)
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "repeat": repeat,
+            "branching": branching,
+            "cycle_density": cycle_density,
+            "stage_count": stage_count,
+            "seed": seed,
+            "backend": resolve_backend(backend)
+        },
+        "results": results
+    }
+
+
+def find_regressions(
+    report: Dict[str, Any],
+    baseline: Dict[str, Any],
+    threshold: float
+) -> List[str]:
+    """
+    Compare a report against a baseline.
+
+    Args:
+        report: Report from run_benchmarks
+        baseline: Previously saved report
+        threshold: Allowed relative increase, e.g. 0.1 for 10%
+
+    Returns:
+        Human readable description of every regression found
+    """
+    regressions = []
+
+    for key, result in report["results"].items():
+        previous = baseline.get("results", {}).get(key)
+        if not previous:
+            continue
+
+        if "error" in result and "error" not in previous:
+            regressions.append(f"{key}: now fails with {result['error']}")
+            continue
+
+        for metric in REGRESSION_METRICS:
+            if metric not in result or not previous.get(metric):
+                continue
+            ratio = result[metric] / previous[metric]
+            if ratio > 1 + threshold:
+                regressions.append(
+                    f"{key}: {metric} {previous[metric]:.6g} -> {result[metric]:.6g} (+{(ratio - 1) * 100:.1f}%)"
+                )
+
+    return regressions
+
+
+def _parsed_models(data: bytes, backend: str, stream: bool) -> Dict[str, Any]:
+    """Parse an export and collect everything a parser exposes."""
+    parser = ServiceNowWorkflowParser(backend=backend)
+    if stream:
+        parser.parse_stream(data)
+    else:
+        parser.parse(data)
+    return {
+        "version": parser.get_workflow_version(),
+        "activities": parser.get_activities(),
+        "stages": parser.get_stages(),
+        "conditions": parser.get_conditions(),
+        "transitions": parser.get_transitions(),
+        "summary": parser.get_workflow_summary()
+    }
+
+
+def check_backends(inputs: Dict[str, bytes], repeat: int = 3) -> List[str]:
+    """
+    Check that the lxml and standard library backends agree, and time them.
+
+    Both backends must stream the same records and build the same models,
+    with the streaming and the DOM parser alike. Timings of the streaming
+    parser are reported on standard error.
+
+    Args:
+        inputs: Export contents keyed by a name used in messages
+        repeat: Timed runs per backend and input
+
+    Returns:
+        Description of every difference found
+    """
+    differences = []
+
+    for name, data in inputs.items():
+        records = {backend: list(iter_records(data, backend)) for backend in ("stdlib", "lxml")}
+        if records["stdlib"] != records["lxml"]:
+            position = next(
+                (i for i, (a, b) in enumerate(zip(records["stdlib"], records["lxml"])) if a != b),
+                min(len(records["stdlib"]), len(records["lxml"]))
+            )
+            differences.append(f"{name}: records differ from record {position}")
+            continue
+
+        for stream in (True, False):
+            if _parsed_models(data, "stdlib", stream) != _parsed_models(data, "lxml", stream):
+                differences.append(f"{name}: {'streamed' if stream else 'DOM'} models differ")
+
+        timings = {}
+        for backend in ("stdlib", "lxml"):
+            runs = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                ServiceNowWorkflowParser(backend=backend).parse_stream(data)
+                runs.append(time.perf_counter() - start)
+            timings[backend] = min(runs)
+        print(f"{name:<24} stdlib {timings['stdlib'] * 1000:10.2f} ms  "
+              f"lxml {timings['lxml'] * 1000:10.2f} ms  "
+              f"speedup {timings['stdlib'] / max(timings['lxml'], 1e-9):5.2f}x", file=sys.stderr)
+
+    return differences
+
+
+def _format_result(key: str, result: Dict[str, Any]) -> str:
+    """Format one benchmark result as a report line."""
+    if "error" in result:
+        return f"{key:<24} ERROR {result['error']}"
+    return (f"{key:<24} {result['wall_min'] * 1000:10.2f} ms  "
+            f"rss {result['peak_rss_kb'] / 1024:8.1f} MB  "
+            f"alloc {result['alloc_peak_bytes'] / (1024 * 1024):8.1f} MB")
+
+
+def main() -> int:
+    """Benchmark entry point."""
+    parser = argparse.ArgumentParser(
+        description="Benchmark the ServiceNow workflow parser on synthetic exports"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    generate_parser = subparsers.add_parser("generate", help="Write a synthetic workflow export")
+    generate_parser.add_argument("output", help="Path of the XML file to write")
+    generate_parser.add_argument("--activities", type=int, default=1000, help="Number of activities")
+    generate_parser.add_argument(
+        "--display-values",
+        choices=["sys_id", "name"],
+        default="sys_id",
+        help="Put sys_ids or, as real exports do, record names in reference display values"
+    )
+
+    run_parser = subparsers.add_parser("run", help="Run the benchmarks")
+    run_parser.add_argument(
+        "--sizes",
+        default="10,100,1000,10000",
+        help="Comma separated activity counts to benchmark (default: 10,100,1000,10000)"
+    )
+    run_parser.add_argument(
+        "--operations",
+        default=",".join(OPERATIONS),
+        help="Comma separated operations to benchmark"
+    )
+    run_parser.add_argument(
+        "--files",
+        nargs="+",
+        default=[],
+        metavar="FILE",
+        help="Real exports to benchmark as well, such as inputs kept by parse profiling; "
+             "pass --sizes '' to benchmark only these"
+    )
+    run_parser.add_argument("--repeat", type=int, default=3, help="Timed runs per case")
+    run_parser.add_argument("--output", metavar="FILE", help="Write the report as JSON to FILE")
+    run_parser.add_argument("--baseline", metavar="FILE", help="Flag regressions against this report")
+    run_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Allowed relative increase over the baseline (default: 0.1)"
+    )
+
+    run_parser.add_argument(
+        "--backend",
+        choices=["auto", "lxml", "stdlib"],
+        default="auto",
+        help="XML backend to parse with (default: stdlib)"
+    )
+
+    check_parser = subparsers.add_parser(
+        "check-backends",
+        help="Check that the lxml and standard library backends parse identically, and time them"
+    )
+    check_parser.add_argument("files", nargs="*", help="Real exports to check as well")
+    check_parser.add_argument(
+        "--sizes",
+        default="10,1000,10000",
+        help="Comma separated activity counts of generated exports (default: 10,1000,10000)"
+    )
+    check_parser.add_argument("--repeat", type=int, default=3, help="Timed runs per backend and input")
+
+    for sub in (generate_parser, run_parser, check_parser):
+        sub.add_argument("--stages", type=int, default=5, help="Number of stages")
+        sub.add_argument("--branching", type=int, default=2, help="Maximum transitions per activity")
+        sub.add_argument("--cycle-density", type=float, default=0.05, help="Share of backward transitions")
+        sub.add_argument("--seed", type=int, default=0, help="Random seed")
+
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        with open(args.output, "w", encoding="utf-8") as f:
+            generate_workflow_xml(
+                f, args.activities, args.stages, args.branching, args.cycle_density, args.seed, args.display_values
+            )
+        return 0
+
+    if args.command == "check-backends":
+        if lxml_etree is None:
+            print("lxml is not installed, nothing to compare", file=sys.stderr)
+            return 1
+
+        inputs = dict(EQUIVALENCE_CASES)
+        for size in (int(size) for size in args.sizes.split(",") if size):
+            for display_values in ("sys_id", "name"):
+                out = io.StringIO()
+                generate_workflow_xml(
+                    out, size, args.stages, args.branching, args.cycle_density, args.seed, display_values
+                )
+                inputs[f"generated-{size}-{display_values}"] = out.getvalue().encode("utf-8")
+        for file_path in args.files:
+            with open(file_path, "rb") as f:
+                inputs[file_path] = f.read()
+
+        differences = check_backends(inputs, args.repeat)
+        for difference in differences:
+            print(f"MISMATCH {difference}", file=sys.stderr)
+        return 1 if differences else 0
+
+    operations = [name for name in args.operations.split(",") if name]
+    unknown = [name for name in operations if name not in OPERATIONS]
+    if unknown:
+        parser.error(f"unknown operations: {', '.join(unknown)}")
+    try:
+        resolve_backend(args.backend)
+    except ValueError as e:
+        parser.error(str(e))
+
+    report = run_benchmarks(
+        [int(size) for size in args.sizes.split(",") if size],
+        operations,
+        args.repeat,
+        args.branching,
+        args.cycle_density,
+        args.stages,
+        args.seed,
+        args.backend,
+        args.files
+    )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+        regressions = find_regressions(report, baseline, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,540 @@
+import hashlib
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Any, BinaryIO, Callable, Optional, Tuple, Union
+
+from servicenow_workflow_parser import ParseLimits, ServiceNowWorkflowParser
+from workflow_diff import apply_workflow_diff
+from workflow_snapshot import SnapshotError, open_snapshot, write_snapshot
+
+
+# Read size used when hashing upload streams
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class ParseCache:
+    """
+    Size-bounded LRU cache of parsed workflows keyed by upload content hash.
+
+    Entries are evicted least recently used first once either the entry
+    limit or the byte budget is exceeded, and expire after a fixed time to
+    live. An entry is weighted by the uncompressed XML it was parsed from,
+    which a compressed upload can be many times larger than.
+
+    With a spill directory, evicted entries are written there as snapshots
+    instead of being dropped, and are memory-mapped back on their next use.
+    Spilled entries keep their expiry time and have their own LRU byte
+    budget; snapshots found in the directory at startup are reused.
+
+    With patching, a miss on a new export of a workflow version that is
+    cached under another key is answered by applying the diff to a copy of
+    the cached parse, which shares the unchanged models and keeps the
+    graph index, instead of caching the fresh parse.
+
+    Cached parsers are shared between requests and must be treated as
+    read-only.
+    """
+
+    def __init__(self, max_entries: int = 64, max_bytes: int = 256 * 1024 * 1024,
+                 ttl_seconds: Optional[float] = 3600.0, compact: bool = False, lazy: bool = False,
+                 spill_dir: Optional[str] = None, max_spill_bytes: int = 1024 * 1024 * 1024,
+                 limits: Optional[ParseLimits] = None, patch_reexports: bool = False):
+        """
+        Args:
+            max_entries: Maximum number of cached workflows
+            max_bytes: Maximum total weight of cached workflows; see weight
+            ttl_seconds: Seconds an entry stays valid, or None to never expire
+            compact: Parse into the memory-compact model variants
+            lazy: Parse in lazy mode, building models only when a response
+                reads them
+            spill_dir: Directory for snapshots of evicted entries, or None
+                to drop evicted entries
+            max_spill_bytes: Maximum total size of the spilled snapshots
+            limits: Bounds uploads must stay within when parsed, or None
+            patch_reexports: Patch the cached parse of an earlier export of
+                the same workflow version on a miss
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.compact = compact
+        self.lazy = lazy
+        self.spill_dir = spill_dir
+        self.max_spill_bytes = max_spill_bytes
+        self.limits = limits
+        self.patch_reexports = patch_reexports
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.spills = 0
+        self.spill_hits = 0
+        self.spill_errors = 0
+        self.patches = 0
+        self._entries: "OrderedDict[str, Tuple[ServiceNowWorkflowParser, int, float]]" = OrderedDict()
+        self._total_bytes = 0
+        # Workflow version sys_id -> key of its most recently cached parse
+        self._versions: Dict[str, str] = {}
+        # key -> (weight, snapshot size, expiry), least recently used first
+        self._spilled: "OrderedDict[str, Tuple[int, int, float]]" = OrderedDict()
+        self._spill_bytes = 0
+        self._lock = threading.Lock()
+
+        if spill_dir is not None:
+            os.makedirs(spill_dir, exist_ok=True)
+            self._index_spill_dir()
+
+    @staticmethod
+    def content_key(content: bytes) -> str:
+        """Get the cache key of an upload's content."""
+        return hashlib.sha256(content).hexdigest()
+
+    @staticmethod
+    def stream_key(stream: BinaryIO) -> Tuple[str, int]:
+        """
+        Get the cache key of a seekable upload stream without reading it
+        into memory. The stream is rewound to where it started.
+
+        Returns:
+            Content hash and size in bytes of the remaining stream
+        """
+        start = stream.tell()
+        digest = hashlib.sha256()
+        while True:
+            chunk = stream.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+        size = stream.tell() - start
+        stream.seek(start)
+        return digest.hexdigest(), size
+
+    @staticmethod
+    def weight(parser: ServiceNowWorkflowParser, size: int) -> int:
+        """
+        Get the weight a parse counts for against the byte budget.
+
+        Args:
+            parser: Parser holding the parsed workflow
+            size: Size of the upload in bytes, possibly compressed
+
+        Returns:
+            Uncompressed XML bytes read by the parse, or the upload size
+            when larger or when the parser was not parsed from XML
+        """
+        return max(size, parser.stats.input_bytes)
+
+    def get(self, key: str) -> Optional[ServiceNowWorkflowParser]:
+        """
+        Get a cached parse.
+
+        Args:
+            key: Content hash of the upload
+
+        Returns:
+            Cached parser or None when not cached or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                spilled = self._spilled.get(key)
+                if spilled is None:
+                    self.misses += 1
+                    return None
+            else:
+                parser, size, expires_at = entry
+                if expires_at < time.monotonic():
+                    self._remove(key)
+                    self.expirations += 1
+                    self.misses += 1
+                    return None
+
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return parser
+
+        return self._load_spilled(key, spilled)
+
+    def touch(self, key: str, ttl_seconds: Optional[float]) -> None:
+        """
+        Keep an entry, in memory or spilled, valid for at least another
+        ttl_seconds, or forever when None. Expiry is never brought forward.
+        """
+        expires_at = time.monotonic() + ttl_seconds if ttl_seconds is not None else float("inf")
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] < expires_at:
+                self._entries[key] = (entry[0], entry[1], expires_at)
+            spilled = self._spilled.get(key)
+            if spilled is not None and spilled[2] < expires_at:
+                self._spilled[key] = (spilled[0], spilled[1], expires_at)
+
+    def put(self, key: str, parser: ServiceNowWorkflowParser, size: int) -> None:
+        """
+        Cache a parse, evicting least recently used entries to make room.
+
+        Args:
+            key: Content hash of the upload
+            parser: Parser holding the parsed workflow
+            size: Weight of the parse, from weight
+        """
+        # Parses weighing more than the whole budget are never cached
+        if size > self.max_bytes or self.max_entries <= 0:
+            return
+
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds is not None else float("inf")
+        self._insert(key, parser, size, expires_at)
+
+    def _insert(self, key: str, parser: ServiceNowWorkflowParser, size: int, expires_at: float) -> None:
+        """Add an entry and spill or drop what no longer fits."""
+        evicted = []
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (parser, size, expires_at)
+            self._total_bytes += size
+            version = parser.get_workflow_version()
+            if version is not None:
+                self._versions[version.id] = key
+
+            while len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                evicted.append((oldest_key, self._entries[oldest_key]))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+        # Snapshots are written outside the lock; a concurrent get of an
+        # entry being spilled just misses
+        if self.spill_dir is not None:
+            for evicted_key, entry in evicted:
+                self._spill(evicted_key, *entry)
+
+    def get_or_parse(self, upload: Union[bytes, BinaryIO]) -> ServiceNowWorkflowParser:
+        """
+        Get the parse of an upload, parsing and caching it on a miss.
+
+        Args:
+            upload: Raw upload content, or the upload's binary stream which
+                is hashed and parsed in chunks without copying it
+
+        Returns:
+            Parser holding the parsed workflow
+        """
+        return self.get_or_parse_keyed(upload)[0]
+
+    def get_or_parse_keyed(
+        self,
+        upload: Union[bytes, BinaryIO],
+        parse: Optional[Callable[[Union[bytes, BinaryIO]], ServiceNowWorkflowParser]] = None,
+        refresh: bool = False
+    ) -> Tuple[ServiceNowWorkflowParser, str, int]:
+        """
+        Like get_or_parse, also returning the upload's cache key and size.
+
+        Args:
+            upload: Raw upload content or the upload's binary stream
+            parse: Function parsing the upload on a miss, such as a
+                profiled parse; defaults to the cache's own
+            refresh: Parse even when the upload is cached, replacing the entry
+
+        Returns:
+            Parser, content hash and upload size in bytes
+        """
+        if isinstance(upload, (bytes, bytearray)):
+            key, size = self.content_key(upload), len(upload)
+        elif upload.seekable():
+            key, size = self.stream_key(upload)
+        else:
+            # The stream can only be read once, so hash and parse a copy
+            return self.get_or_parse_keyed(upload.read(), parse, refresh)
+
+        parser = None if refresh else self.get(key)
+        if parser is None:
+            parser = (parse or self.parse)(upload)
+            weight = self.weight(parser, size)
+            if self.patch_reexports:
+                parser = self._patch_previous(key, parser)
+            self.put(key, parser, weight)
+        return parser, key, size
+
+    def _patch_previous(self, key: str, parser: ServiceNowWorkflowParser) -> ServiceNowWorkflowParser:
+        """
+        Patch a copy of the cached parse of an earlier export of the same
+        workflow version to match a fresh parse.
+
+        Args:
+            key: Content hash of the fresh parse's upload
+            parser: Fresh parse
+
+        Returns:
+            The patched copy, or parser when no earlier export is cached
+        """
+        version = parser.get_workflow_version()
+        if version is None:
+            return parser
+        with self._lock:
+            previous_key = self._versions.get(version.id)
+            entry = self._entries.get(previous_key) if previous_key not in (None, key) else None
+        if entry is None or entry[0].compact != parser.compact:
+            return parser
+
+        # Cached parsers are shared, so the earlier parse itself stays as it is
+        patched = entry[0].copy()
+        apply_workflow_diff(patched, parser)
+        with self._lock:
+            self.patches += 1
+        return patched
+
+    def parse(self, upload: Union[bytes, BinaryIO]) -> ServiceNowWorkflowParser:
+        """Parse an upload the way cache misses are parsed."""
+        parser = ServiceNowWorkflowParser(compact=self.compact, lazy=self.lazy, limits=self.limits)
+        parser.parse_stream(upload)
+        return parser
+
+    def clear(self) -> None:
+        """Remove every cached entry, including spilled snapshots."""
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+            self._versions.clear()
+            spilled = list(self._spilled)
+            self._spilled.clear()
+            self._spill_bytes = 0
+        for key in spilled:
+            self._delete_spill_file(key)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get cache counters and current usage."""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+                'maxEntries': self.max_entries,
+                'maxBytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'spilledEntries': len(self._spilled),
+                'spilledBytes': self._spill_bytes,
+                'maxSpillBytes': self.max_spill_bytes if self.spill_dir is not None else 0,
+                'spills': self.spills,
+                'spillHits': self.spill_hits,
+                'spillErrors': self.spill_errors,
+                'patches': self.patches
+            }
+
+    def _remove(self, key: str) -> None:
+        """Remove an entry; the lock must be held."""
+        parser, size, _ = self._entries.pop(key)
+        self._total_bytes -= size
+        version = parser.get_workflow_version()
+        if version is not None and self._versions.get(version.id) == key:
+            del self._versions[version.id]
+
+    def _spill_path(self, key: str) -> str:
+        return os.path.join(self.spill_dir, f"{key}.snap")
+
+    def _spill(self, key: str, parser: ServiceNowWorkflowParser, size: int, expires_at: float) -> None:
+        """Write an evicted entry to the spill directory."""
+        if expires_at < time.monotonic():
+            return
+
+        with self._lock:
+            # Entries loaded from a snapshot are still on disk
+            if key in self._spilled:
+                self._spilled.move_to_end(key)
+                return
+
+        try:
+            snapshot_size = write_snapshot(parser, self._spill_path(key))
+        except (OSError, ValueError):
+            with self._lock:
+                self.spill_errors += 1
+            return
+
+        dropped = []
+        with self._lock:
+            self._spilled[key] = (size, snapshot_size, expires_at)
+            self._spill_bytes += snapshot_size
+            self.spills += 1
+            while self._spill_bytes > self.max_spill_bytes and self._spilled:
+                oldest_key, (_, oldest_size, _) = self._spilled.popitem(last=False)
+                self._spill_bytes -= oldest_size
+                dropped.append(oldest_key)
+        for dropped_key in dropped:
+            self._delete_spill_file(dropped_key)
+
+    def _load_spilled(self, key: str, spilled: Tuple[int, int, float]) -> Optional[ServiceNowWorkflowParser]:
+        """Map a spilled snapshot back in and make it a cached entry again."""
+        size, snapshot_size, expires_at = spilled
+        snapshot = None
+        if expires_at >= time.monotonic():
+            try:
+                snapshot = open_snapshot(self._spill_path(key))
+            except (OSError, SnapshotError):
+                pass
+
+        with self._lock:
+            if snapshot is None:
+                if self._spilled.pop(key, None) is not None:
+                    self._spill_bytes -= snapshot_size
+                    self.expirations += 1
+                self.misses += 1
+            else:
+                self._spilled.move_to_end(key)
+                self.spill_hits += 1
+
+        if snapshot is None:
+            self._delete_spill_file(key)
+            return None
+
+        self._insert(key, snapshot, size, expires_at)
+        return snapshot
+
+    def _delete_spill_file(self, key: str) -> None:
+        # Open snapshots keep their mapping after the file is removed
+        try:
+            os.remove(self._spill_path(key))
+        except OSError:
+            pass
+
+    def _index_spill_dir(self) -> None:
+        """Adopt snapshots left in the spill directory, oldest first."""
+        found = []
+        for name in os.listdir(self.spill_dir):
+            if name.endswith(".snap"):
+                stat = os.stat(os.path.join(self.spill_dir, name))
+                found.append((stat.st_mtime, name[:-len(".snap")], stat.st_size))
+
+        now = time.time()
+        for modified, key, snapshot_size in sorted(found):
+            if self.ttl_seconds is None:
+                expires_at = float("inf")
+            else:
+                expires_at = time.monotonic() + modified + self.ttl_seconds - now
+            # The parse's weight is unknown, so the snapshot size stands in
+            self._spilled[key] = (snapshot_size, snapshot_size, expires_at)
+            self._spill_bytes += snapshot_size
+
+        while self._spill_bytes > self.max_spill_bytes and self._spilled:
+            oldest_key, (_, oldest_size, _) = self._spilled.popitem(last=False)
+            self._spill_bytes -= oldest_size
+            self._delete_spill_file(oldest_key)
+
+
+@dataclass
+class WorkflowHandle:
+    """Reference to an uploaded workflow whose parse is held in a ParseCache."""
+    id: str
+    content_hash: str
+    size: int
+    file_name: str = ""
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'contentHash': self.content_hash,
+            'size': self.size,
+            'fileName': self.file_name
+        }
+
+
+class WorkflowHandles:
+    """
+    Bounded registry of upload handles.
+
+    Uploading a workflow once returns a handle, and later requests name the
+    handle instead of sending the file again. Handles expire after going
+    unused for the time to live, and the least recently used are dropped
+    beyond the handle limit. The parse itself lives in the cache, so a
+    handle only resolves while its cache entry, in memory or spilled, does;
+    using a handle extends the entry's expiry along with the handle's, so
+    only eviction from a full cache ends a handle in use.
+    """
+
+    def __init__(self, cache: ParseCache, max_handles: int = 4096,
+                 ttl_seconds: Optional[float] = 3600.0):
+        """
+        Args:
+            cache: Cache holding the parsed uploads
+            max_handles: Maximum number of live handles
+            ttl_seconds: Seconds a handle stays valid without use, or None
+                to never expire
+        """
+        self.cache = cache
+        self.max_handles = max_handles
+        self.ttl_seconds = ttl_seconds
+        self._handles: "OrderedDict[str, Tuple[WorkflowHandle, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expiry(self) -> float:
+        return time.monotonic() + self.ttl_seconds if self.ttl_seconds is not None else float("inf")
+
+    def register(self, content_hash: str, size: int, file_name: str = "") -> WorkflowHandle:
+        """
+        Create a handle for a cached upload.
+
+        Args:
+            content_hash: Cache key of the upload
+            size: Size of the upload in bytes
+            file_name: Name the upload was sent under
+
+        Returns:
+            New handle
+        """
+        handle = WorkflowHandle(secrets.token_urlsafe(16), content_hash, size, file_name)
+        with self._lock:
+            self._handles[handle.id] = (handle, self._expiry())
+            while len(self._handles) > self.max_handles:
+                self._handles.popitem(last=False)
+        return handle
+
+    def resolve(self, handle_id: str) -> Optional[WorkflowHandle]:
+        """Look up a live handle, extending its lifetime."""
+        with self._lock:
+            entry = self._handles.get(handle_id)
+            if entry is None:
+                return None
+            handle, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._handles[handle_id]
+                return None
+            self._handles[handle_id] = (handle, self._expiry())
+            self._handles.move_to_end(handle_id)
+            return handle
+
+    def get_parser(self, handle_id: str) -> Optional[Tuple[WorkflowHandle, ServiceNowWorkflowParser]]:
+        """
+        Get the parse behind a handle.
+
+        Returns:
+            Handle and parser, or None when the handle or its parse is gone
+        """
+        handle = self.resolve(handle_id)
+        if handle is None:
+            return None
+        self.cache.touch(handle.content_hash, self.ttl_seconds)
+        parser = self.cache.get(handle.content_hash)
+        if parser is None:
+            self.release(handle_id)
+            return None
+        return handle, parser
+
+    def release(self, handle_id: str) -> bool:
+        """Drop a handle; the cached parse stays for other handles and uploads."""
+        with self._lock:
+            return self._handles.pop(handle_id, None) is not None
+
+    def stats(self) -> Dict[str, Any]:
+        """Get current usage."""
+        with self._lock:
+            return {
+                'handles': len(self._handles),
+                'maxHandles': self.max_handles
+            }
@@ -1,11 +1,23 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import Depends, FastAPI, UploadFile, File, Header, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Dict, Any, List
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 import os
-import tempfile
+import time
+import zlib
+from typing import Dict, Any, List, Optional, Tuple
 from pydantic import BaseModel
 
-from servicenow_workflow_parser import ServiceNowWorkflowParser
+from servicenow_workflow_parser import ParseLimits, ServiceNowWorkflowParser, WorkflowParseLimitError, add_parse_hook
+from workflow_analysis import analyze_workflow
+from workflow_cache import ParseCache, WorkflowHandles
+from workflow_executor import ExecutorSaturated, ParseExecutor
+from workflow_layout import LayoutQuery
+from workflow_metrics import CONTENT_TYPE, WorkflowMetrics
+from workflow_profiling import PROFILE_HEADER, profiler_from_environ
+from workflow_query import QueryError, RecordQuery, run_query, split_fields
+from workflow_serializer import DETAIL_SECTIONS, iter_workflow_json, record_to_dict
+from workflow_spatial import get_spatial_index, viewport_payload
 
 app = FastAPI(
     title="ServiceNow Workflow API",
@@ -13,15 +25,386 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# Enable CORS
+# Largest piece of a gzip request body inflated at once
+INFLATE_CHUNK_SIZE = 64 * 1024
+
+# Largest request body accepted, counted after any Content-Encoding is undone
+MAX_BODY_BYTES = 16 * 1024 * 1024
+
+# Bounds on the XML an upload may hold once decompressed; crossing one
+# stops the parse with a 413
+PARSE_LIMITS = ParseLimits(
+    max_bytes=256 * 1024 * 1024,
+    max_depth=64,
+    max_records=200000
+)
+
+
+class BodySizeLimitMiddleware:
+    """
+    Answer requests whose body is larger than max_bytes with a 413.
+
+    A declared Content-Length over the limit is refused before the body is
+    read. Otherwise bodies are counted as they arrive and cut off at the
+    limit, so chunked and compressed bodies cannot get past it either.
+    """
+
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    def rejection(self) -> JSONResponse:
+        return JSONResponse(
+            {"detail": {
+                "error": f"Request body is larger than {self.max_bytes} bytes",
+                "limit": "max_body_bytes",
+                "maximum": self.max_bytes
+            }},
+            status_code=413
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        length = dict(scope["headers"]).get(b"content-length")
+        if length and length.isdigit() and int(length) > self.max_bytes:
+            await self.rejection()(scope, receive, send)
+            return
+
+        received = 0
+        exceeded = False
+        rejected = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            if exceeded:
+                return {"type": "http.request", "body": b"", "more_body": False}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # End the body here; whatever the application makes of
+                    # the truncated body is replaced by the 413
+                    exceeded = True
+                    return {"type": "http.request", "body": b"", "more_body": False}
+            return message
+
+        async def checked_send(message):
+            nonlocal rejected
+            if not exceeded:
+                await send(message)
+            elif not rejected:
+                rejected = True
+                await self.rejection()(scope, receive, send)
+
+        await self.app(scope, limited_receive, checked_send)
+
+
+# Inside the gzip middleware, so the limit applies to the inflated body
+app.add_middleware(BodySizeLimitMiddleware, max_bytes=MAX_BODY_BYTES)
+
+
+class GzipRequestMiddleware:
+    """
+    Decompress request bodies sent with Content-Encoding: gzip.
+
+    Body chunks are inflated as the application reads them, at most
+    INFLATE_CHUNK_SIZE bytes at a time, so a compressed upload is never held
+    decompressed in memory. Uploaded files that are themselves compressed
+    need no header; the parser detects them.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        encoding = headers.get(b"content-encoding", b"").strip().lower()
+        if encoding in (b"", b"identity"):
+            await self.app(scope, receive, send)
+            return
+        if encoding != b"gzip":
+            response = JSONResponse(
+                {"detail": f"Unsupported Content-Encoding: {encoding.decode('latin-1')}"},
+                status_code=415
+            )
+            await response(scope, receive, send)
+            return
+
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        tail = b""
+        more_body = True
+
+        async def inflating_receive():
+            nonlocal tail, more_body
+            while tail or more_body:
+                if not tail:
+                    message = await receive()
+                    if message["type"] != "http.request":
+                        return message
+                    tail = message.get("body", b"")
+                    more_body = message.get("more_body", False)
+
+                body = decompressor.decompress(tail, INFLATE_CHUNK_SIZE)
+                tail = decompressor.unconsumed_tail
+                if not tail and not more_body:
+                    body += decompressor.flush()
+                if body or not (tail or more_body):
+                    return {"type": "http.request", "body": body, "more_body": bool(tail or more_body)}
+
+            # The body is done; later calls wait for the disconnect
+            return await receive()
+
+        # Changed in place, so outer middleware sees the route chosen inside
+        scope["headers"] = [
+            (name, value) for name, value in scope["headers"]
+            if name not in (b"content-encoding", b"content-length")
+        ]
+        await self.app(scope, inflating_receive, send)
+
+
+app.add_middleware(GzipRequestMiddleware)
+
+# Request and parse metrics, served on /metrics
+metrics = WorkflowMetrics()
+add_parse_hook(metrics.observe_phase)
+
+
+class MetricsMiddleware:
+    """
+    Record each request's count, latency and body size as sent.
+
+    Latency runs until the last body chunk is sent, so streamed responses
+    are measured in full.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        length = dict(scope["headers"]).get(b"content-length")
+        size = int(length) if length and length.isdigit() else None
+        status = 500
+        recorded = False
+
+        def record():
+            nonlocal recorded
+            if not recorded:
+                recorded = True
+                route = scope.get("route")
+                endpoint = route.path if route is not None else "unmatched"
+                metrics.observe_request(scope["method"], endpoint, status, time.perf_counter() - started, size)
+
+        async def send_and_record(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                record()
+
+        try:
+            await self.app(scope, receive, send_and_record)
+        finally:
+            record()
+
+
+app.add_middleware(MetricsMiddleware)
+
+# Enable CORS. Added last, so it is the outermost middleware and the 413 and
+# 415 answers of the middlewares above carry the headers the UI needs to read
+# them
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
-    allow_headers=["*"],
+    # Not X-Workflow-Profile, which is for operators rather than browsers
+    allow_headers=["Content-Type", "Content-Encoding"],
+)
+
+# Parsed uploads shared by all endpoints, keyed by content hash; evicted
+# parses are kept as snapshots when WORKFLOW_SPILL_DIR is set. Parses are
+# lazy: summaries and analysis read rows, and models are only built for
+# responses that return them. A new export of a cached workflow version is
+# patched from the earlier parse, sharing its unchanged models
+parse_cache = ParseCache(
+    max_entries=64,
+    max_bytes=256 * 1024 * 1024,
+    ttl_seconds=3600,
+    lazy=True,
+    spill_dir=os.environ.get("WORKFLOW_SPILL_DIR"),
+    limits=PARSE_LIMITS,
+    patch_reexports=True
+)
+
+# Handles let a client upload a workflow once and query it afterwards
+workflow_handles = WorkflowHandles(parse_cache, max_handles=4096, ttl_seconds=3600)
+
+# Parsing runs in warmed worker processes so large uploads don't block the
+# event loop; once max_queue parses are waiting, requests get a 503
+parse_executor = ParseExecutor(
+    kind="process", max_workers=4, max_queue=32, limits=PARSE_LIMITS, lazy=True
 )
 
+
+# Parses asked for with WORKFLOW_PROFILE_SECRET in the X-Workflow-Profile
+# header, or slower than WORKFLOW_PROFILE_THRESHOLD, are profiled into
+# WORKFLOW_PROFILE_DIR when set
+parse_profiler = profiler_from_environ()
+
+
+@app.on_event("startup")
+def start_parse_executor():
+    parse_executor.start()
+
+
+@app.on_event("shutdown")
+def stop_parse_executor():
+    parse_executor.shutdown()
+
+
+async def parse_upload(file: UploadFile, profile: Optional[str] = None) -> ServiceNowWorkflowParser:
+    """
+    Parse an uploaded workflow off the event loop, reusing the parse of an
+    identical upload unless the X-Workflow-Profile header value asks for
+    the parse to be profiled.
+    """
+    return (await parse_upload_keyed(file, profile))[0]
+
+
+async def parse_upload_keyed(file: UploadFile, profile: Optional[str] = None) -> Tuple[ServiceNowWorkflowParser, str, int]:
+    """
+    Like parse_upload, also returning the upload's content hash and size.
+
+    Hashing, cache lookups that may map a spilled snapshot back in, and
+    cache puts that may spill one to disk all run in the threadpool.
+    """
+    key, size = await run_in_threadpool(parse_cache.stream_key, file.file)
+    requested = parse_profiler.requested_mode(profile) if parse_profiler is not None else None
+    parser = None if requested is not None else await run_in_threadpool(parse_cache.get, key)
+    if parser is None:
+        mode = parse_profiler.mode(requested) if parse_profiler is not None else None
+        if mode is None:
+            parser = await parse_executor.parse(file.file)
+        else:
+            start = file.file.tell()
+            parser, captured = await parse_executor.profile(file.file, mode, parse_profiler.sample_interval)
+            file.file.seek(start)
+            await run_in_threadpool(
+                parse_profiler.keep, file.file, parser, captured, requested is not None, {"fileName": file.filename}
+            )
+        await run_in_threadpool(parse_cache.put, key, parser, parse_cache.weight(parser, size))
+        # Parse hooks only see parses in this process
+        if parse_executor.kind == "process":
+            metrics.observe_parse(parser.stats)
+    return parser, key, size
+
+
+def handle_parser(handle_id: str):
+    """Get the handle and parse behind a handle id, or fail with a 404."""
+    found = workflow_handles.get_parser(handle_id)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired workflow handle, upload the file again")
+    return found
+
+
+def summary_fields(parser: ServiceNowWorkflowParser) -> Dict[str, Any]:
+    """Build the summary fields shared by the parse and handle endpoints."""
+    return dict(
+        summary=record_to_dict(parser.get_workflow_summary()),
+        version=record_to_dict(parser.get_workflow_version()),
+        activityCount=len(parser.get_activities()),
+        stageCount=len(parser.get_stages()),
+        conditionCount=len(parser.get_conditions()),
+        analysis=analyze_workflow(parser).to_dict()
+    )
+
+
+def details_response(parser: ServiceNowWorkflowParser, query: RecordQuery) -> StreamingResponse:
+    """Stream the details selected by a query; the serializer runs in the threadpool."""
+    result = run_query(parser, query, DETAIL_SECTIONS)
+    return StreamingResponse(
+        iter_workflow_json(
+            parser,
+            extra={'success': True, **result.paging()},
+            values=result.values,
+            fields=query.fields
+        ),
+        media_type="application/json"
+    )
+
+
+def activities_response(parser: ServiceNowWorkflowParser, query: RecordQuery) -> StreamingResponse:
+    """Stream the activities selected by a query; the serializer runs in the threadpool."""
+    result = run_query(parser, query)
+    return StreamingResponse(
+        iter_workflow_json(
+            parser,
+            sections=('activities',),
+            extra={'success': True, 'count': result.total, **result.paging()},
+            values=result.values,
+            fields=query.fields
+        ),
+        media_type="application/json"
+    )
+
+
+def record_query(
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated record fields to return"),
+    stage: Optional[str] = None,
+    activity_definition: Optional[str] = None
+) -> RecordQuery:
+    """Build the record query from the request's query parameters."""
+    try:
+        return RecordQuery(
+            offset=offset,
+            limit=limit,
+            cursor=cursor,
+            fields=split_fields(fields),
+            stage=stage,
+            activity_definition=activity_definition
+        )
+    except QueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def layout_query(
+    layout: str = Query("layered", description="layered, or xml for the coordinates in the export"),
+    x: Optional[float] = None,
+    y: Optional[float] = None,
+    width: Optional[float] = None,
+    height: Optional[float] = None,
+    zoom: Optional[float] = Query(None, gt=0, description="Screen pixels per layout unit")
+) -> LayoutQuery:
+    """Build the layout query from the request's query parameters."""
+    given = [value is not None for value in (x, y, width, height)]
+    try:
+        if any(given) and not all(given):
+            raise QueryError("viewport needs x, y, width and height")
+        return LayoutQuery(
+            algorithm=layout,
+            viewport=(x, y, x + width, y + height) if all(given) else None,
+            zoom=zoom
+        )
+    except QueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 # Response models
 class ApiResponse(BaseModel):
     success: bool
@@ -34,10 +417,19 @@ class WorkflowSummaryResponse(ApiResponse):
     activityCount: int = 0
     stageCount: int = 0
     conditionCount: int = 0
+    analysis: Dict[str, Any] = None
     fileName: str = None
 
 
-class WorkflowDetailsResponse(ApiResponse):
+class PagedResponse(ApiResponse):
+    # Set when a query left records out
+    total: int = None
+    offset: int = None
+    limit: int = None
+    nextCursor: str = None
+
+
+class WorkflowDetailsResponse(PagedResponse):
     version: Dict[str, Any] = None
     activities: Dict[str, Dict[str, Any]] = None
     stages: Dict[str, Dict[str, Any]] = None
@@ -45,132 +437,229 @@ class WorkflowDetailsResponse(ApiResponse):
     transitions: Dict[str, List[Dict[str, Any]]] = None
 
 
-class WorkflowActivitiesResponse(ApiResponse):
+class WorkflowActivitiesResponse(PagedResponse):
     activities: Dict[str, Dict[str, Any]] = None
     count: int = 0
 
 
+class WorkflowHandleResponse(WorkflowSummaryResponse):
+    handle: Dict[str, Any] = None
+
+
+class WorkflowLayoutResponse(ApiResponse):
+    layout: str = None
+    # activities, or stages when zoomed out
+    level: str = None
+    bounds: Dict[str, float] = None
+    viewport: Dict[str, float] = None
+    nodeTotal: int = 0
+    edgeTotal: int = 0
+    nodes: List[Dict[str, Any]] = None
+    edges: List[Dict[str, Any]] = None
+    stages: List[Dict[str, Any]] = None
+    stageLinks: List[Dict[str, Any]] = None
+
+
+class CacheStatsResponse(ApiResponse):
+    cache: Dict[str, Any] = None
+    handles: Dict[str, Any] = None
+
+
+class ParseProfilesResponse(ApiResponse):
+    profiler: Dict[str, Any] = None
+    captures: List[Dict[str, Any]] = None
+
+
 @app.post("/api/workflow/parse", response_model=WorkflowSummaryResponse)
-async def parse_workflow(file: UploadFile = File(...)):
+async def parse_workflow(file: UploadFile = File(...), profile: Optional[str] = Header(None, alias=PROFILE_HEADER)):
     """
     Upload and parse a ServiceNow workflow XML file.
     Returns a summary of the workflow.
     """
     try:
-        # Create a temporary file to store the upload
-        with tempfile.NamedTemporaryFile(delete=False) as temp:
-            content = await file.read()
-            temp.write(content)
-            temp_path = temp.name
+        # Parse the workflow XML, reusing the parse of an identical upload
+        parser = await parse_upload(file, profile)
         
-        try:
-            # Parse the workflow XML
-            parser = ServiceNowWorkflowParser()
-            
-            with open(temp_path, 'r', encoding='utf-8') as f:
-                xml_content = f.read()
-                parser.parse(xml_content)
-            
-            # Get workflow summary
-            summary = parser.get_workflow_summary()
-            version = parser.get_workflow_version()
-            
-            # Prepare response
-            return WorkflowSummaryResponse(
-                success=True,
-                summary=vars(summary),
-                version=vars(version),
-                activityCount=len(parser.get_activities()),
-                stageCount=len(parser.get_stages()),
-                conditionCount=len(parser.get_conditions()),
-                fileName=file.filename
-            )
-        finally:
-            # Clean up the temporary file
-            os.unlink(temp_path)
+        # Prepare response; building the graph and analysis is CPU-bound
+        return WorkflowSummaryResponse(
+            success=True,
+            **await run_in_threadpool(summary_fields, parser),
+            fileName=file.filename
+        )
             
+    except ExecutorSaturated as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except WorkflowParseLimitError as e:
+        raise HTTPException(status_code=413, detail={"error": str(e), **e.to_dict()})
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @app.post("/api/workflow/details", response_model=WorkflowDetailsResponse)
-async def get_workflow_details(file: UploadFile = File(...)):
+async def get_workflow_details(
+    file: UploadFile = File(...),
+    query: RecordQuery = Depends(record_query),
+    profile: Optional[str] = Header(None, alias=PROFILE_HEADER)
+):
     """
     Get detailed workflow information from an uploaded file.
-    Returns all workflow components.
+    Returns all workflow components, or the page of them selected by the
+    offset/limit or cursor, fields, stage and activity_definition query
+    parameters.
     """
     try:
-        # Create a temporary file to store the upload
-        with tempfile.NamedTemporaryFile(delete=False) as temp:
-            content = await file.read()
-            temp.write(content)
-            temp_path = temp.name
+        # Parse the workflow XML, reusing the parse of an identical upload
+        parser = await parse_upload(file, profile)
         
-        try:
-            # Parse the workflow XML
-            parser = ServiceNowWorkflowParser()
-            
-            with open(temp_path, 'r', encoding='utf-8') as f:
-                xml_content = f.read()
-                parser.parse(xml_content)
-            
-            # Prepare response with full details
-            return WorkflowDetailsResponse(
-                success=True,
-                version=vars(parser.get_workflow_version()),
-                activities={k: vars(v) for k, v in parser.get_activities().items()},
-                stages={k: vars(v) for k, v in parser.get_stages().items()},
-                conditions={k: vars(v) for k, v in parser.get_conditions().items()},
-                transitions={
-                    k: [vars(t) for t in v] for k, v in parser.get_transitions().items()
-                }
-            )
-        finally:
-            # Clean up the temporary file
-            os.unlink(temp_path)
+        return await run_in_threadpool(details_response, parser, query)
             
+    except ExecutorSaturated as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except WorkflowParseLimitError as e:
+        raise HTTPException(status_code=413, detail={"error": str(e), **e.to_dict()})
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @app.post("/api/workflow/activities", response_model=WorkflowActivitiesResponse)
-async def get_workflow_activities(file: UploadFile = File(...)):
+async def get_workflow_activities(
+    file: UploadFile = File(...),
+    query: RecordQuery = Depends(record_query),
+    profile: Optional[str] = Header(None, alias=PROFILE_HEADER)
+):
     """
     Get workflow activities from an uploaded file.
-    Returns just the activities from the workflow.
+    Returns just the activities from the workflow, or the page of them
+    selected by the offset/limit or cursor, fields, stage and
+    activity_definition query parameters.
     """
     try:
-        # Create a temporary file to store the upload
-        with tempfile.NamedTemporaryFile(delete=False) as temp:
-            content = await file.read()
-            temp.write(content)
-            temp_path = temp.name
+        # Parse the workflow XML, reusing the parse of an identical upload
+        parser = await parse_upload(file, profile)
         
-        try:
-            # Parse the workflow XML
-            parser = ServiceNowWorkflowParser()
-            
-            with open(temp_path, 'r', encoding='utf-8') as f:
-                xml_content = f.read()
-                parser.parse(xml_content)
-            
-            # Get activities
-            activities = parser.get_activities()
+        return await run_in_threadpool(activities_response, parser, query)
             
-            # Prepare response
-            return WorkflowActivitiesResponse(
-                success=True,
-                activities={k: vars(v) for k, v in activities.items()},
-                count=len(activities)
-            )
-        finally:
-            # Clean up the temporary file
-            os.unlink(temp_path)
+    except ExecutorSaturated as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except WorkflowParseLimitError as e:
+        raise HTTPException(status_code=413, detail={"error": str(e), **e.to_dict()})
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.post("/api/workflow/upload", response_model=WorkflowHandleResponse, status_code=201)
+async def upload_workflow(file: UploadFile = File(...), profile: Optional[str] = Header(None, alias=PROFILE_HEADER)):
+    """
+    Upload and parse a ServiceNow workflow XML file once.
+    Returns a handle for the handle endpoints along with the summary.
+    """
+    try:
+        # Parse the workflow XML, reusing the parse of an identical upload
+        parser, content_hash, size = await parse_upload_keyed(file, profile)
+        handle = workflow_handles.register(content_hash, size, file.filename or "")
+        # Index the diagram now so the first viewport query pans as fast as the rest
+        await run_in_threadpool(get_spatial_index, parser)
+        
+        return WorkflowHandleResponse(
+            success=True,
+            handle=handle.to_dict(),
+            **await run_in_threadpool(summary_fields, parser),
+            fileName=handle.file_name
+        )
             
+    except ExecutorSaturated as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except WorkflowParseLimitError as e:
+        raise HTTPException(status_code=413, detail={"error": str(e), **e.to_dict()})
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@app.get("/api/workflow/handles/{handle_id}", response_model=WorkflowHandleResponse)
+def get_handle_summary(handle_id: str):
+    """
+    Get the summary of an uploaded workflow by handle.
+    """
+    handle, parser = handle_parser(handle_id)
+    return WorkflowHandleResponse(
+        success=True,
+        handle=handle.to_dict(),
+        **summary_fields(parser),
+        fileName=handle.file_name
+    )
+
+
+@app.get("/api/workflow/handles/{handle_id}/details", response_model=WorkflowDetailsResponse)
+def get_handle_details(handle_id: str, query: RecordQuery = Depends(record_query)):
+    """
+    Get detailed workflow information of an uploaded workflow by handle.
+    Takes the same query parameters as /api/workflow/details.
+    """
+    return details_response(handle_parser(handle_id)[1], query)
+
+
+@app.get("/api/workflow/handles/{handle_id}/activities", response_model=WorkflowActivitiesResponse)
+def get_handle_activities(handle_id: str, query: RecordQuery = Depends(record_query)):
+    """
+    Get the activities of an uploaded workflow by handle.
+    Takes the same query parameters as /api/workflow/activities.
+    """
+    return activities_response(handle_parser(handle_id)[1], query)
+
+
+@app.get("/api/workflow/handles/{handle_id}/layout", response_model=WorkflowLayoutResponse)
+def get_handle_layout(handle_id: str, query: LayoutQuery = Depends(layout_query)):
+    """
+    Get diagram coordinates of an uploaded workflow by handle.
+    Returns every activity and transition, or only those inside the
+    viewport given by x, y, width and height; zoomed out below 0.25,
+    stage boxes and the transition counts between them.
+    """
+    return WorkflowLayoutResponse(success=True, **viewport_payload(handle_parser(handle_id)[1], query))
+
+
+@app.delete("/api/workflow/handles/{handle_id}", response_model=ApiResponse)
+async def release_handle(handle_id: str):
+    """
+    Release a workflow handle once the client is done with it.
+    """
+    if not workflow_handles.release(handle_id):
+        raise HTTPException(status_code=404, detail="Unknown or expired workflow handle")
+    return ApiResponse(success=True)
+
+
+@app.get("/api/workflow/profiles", response_model=ParseProfilesResponse)
+def get_parse_profiles():
+    """
+    Get the kept parse profiles, newest first.
+    Each names its profile and retained upload in the profile directory.
+    """
+    if parse_profiler is None:
+        raise HTTPException(status_code=404, detail="Parse profiling is not enabled, set WORKFLOW_PROFILE_DIR")
+    return ParseProfilesResponse(
+        success=True,
+        profiler=parse_profiler.stats(),
+        captures=parse_profiler.store.captures()
+    )
+
+
+@app.get("/metrics", response_class=Response)
+def get_metrics():
+    """
+    Get request and parse metrics in the Prometheus text format.
+    """
+    return Response(metrics.render(), media_type=CONTENT_TYPE)
+
+
+@app.get("/api/workflow/cache", response_model=CacheStatsResponse)
+async def get_cache_stats():
+    """
+    Get parse cache statistics.
+    Returns hit/miss counters and current usage.
+    """
+    return CacheStatsResponse(success=True, cache=parse_cache.stats(), handles=workflow_handles.stats())
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -1,14 +1,186 @@
-from flask import Flask, request, jsonify
+import gzip
 import os
-import tempfile
+import time
+
+from flask import Flask, Response, g, request, jsonify
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
-from servicenow_workflow_parser import ServiceNowWorkflowParser
+from werkzeug.wsgi import LimitedStream
+from servicenow_workflow_parser import ParseLimits, WorkflowParseLimitError, add_parse_hook
+from workflow_analysis import analyze_workflow
+from workflow_cache import ParseCache, WorkflowHandles
+from workflow_layout import LayoutQuery
+from workflow_metrics import CONTENT_TYPE, WorkflowMetrics
+from workflow_profiling import PROFILE_HEADER, profiler_from_environ
+from workflow_query import QueryError, RecordQuery, run_query
+from workflow_serializer import DETAIL_SECTIONS, iter_workflow_json, record_to_dict
+from workflow_spatial import get_spatial_index, viewport_payload
 
 app = Flask(__name__)
 
 # Configure maximum file size (16MB)
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 
+# Bounds on the XML an upload may hold once decompressed; crossing one
+# stops the parse with a 413
+PARSE_LIMITS = ParseLimits(
+    max_bytes=256 * 1024 * 1024,
+    max_depth=64,
+    max_records=200000
+)
+
+# Parsed uploads shared by all endpoints, keyed by content hash; evicted
+# parses are kept as snapshots when WORKFLOW_SPILL_DIR is set. Parses are
+# lazy: summaries and analysis read rows, and models are only built for
+# responses that return them. A new export of a cached workflow version is
+# patched from the earlier parse, sharing its unchanged models
+parse_cache = ParseCache(
+    max_entries=64,
+    max_bytes=256 * 1024 * 1024,
+    ttl_seconds=3600,
+    lazy=True,
+    spill_dir=os.environ.get('WORKFLOW_SPILL_DIR'),
+    limits=PARSE_LIMITS,
+    patch_reexports=True
+)
+
+# Handles let a client upload a workflow once and query it afterwards
+workflow_handles = WorkflowHandles(parse_cache, max_handles=4096, ttl_seconds=3600)
+
+# Request and parse metrics, served on /metrics
+metrics = WorkflowMetrics()
+add_parse_hook(metrics.observe_phase)
+
+# Parses asked for with WORKFLOW_PROFILE_SECRET in the X-Workflow-Profile
+# header, or slower than WORKFLOW_PROFILE_THRESHOLD, are profiled into
+# WORKFLOW_PROFILE_DIR when set
+parse_profiler = profiler_from_environ()
+
+
+@app.before_request
+def start_request_metrics():
+    """Note when a request arrived and its body size as sent."""
+    g.request_started = time.perf_counter()
+    g.request_size = request.content_length
+
+
+@app.before_request
+def decode_request_body():
+    """
+    Decompress request bodies sent with Content-Encoding: gzip.
+    
+    The body is inflated while the form parser reads it, and
+    MAX_CONTENT_LENGTH then applies to the decompressed size. Uploaded files
+    that are themselves compressed need no header; the parser detects them.
+    """
+    encoding = request.headers.get('Content-Encoding', '').strip().lower()
+    if encoding in ('', 'identity'):
+        return None
+    if encoding != 'gzip':
+        return jsonify({
+            'success': False,
+            'error': f'Unsupported Content-Encoding: {encoding}'
+        }), 415
+    
+    environ = request.environ
+    body = environ['wsgi.input']
+    if request.content_length is not None:
+        body = LimitedStream(body, request.content_length)
+    
+    # Without a length, werkzeug reads the body to its end, capped at
+    # MAX_CONTENT_LENGTH
+    environ['wsgi.input'] = gzip.GzipFile(fileobj=body, mode='rb')
+    environ.pop('CONTENT_LENGTH', None)
+    environ['wsgi.input_terminated'] = True
+    return None
+
+
+def parse_upload(file):
+    """
+    Parse an upload, reusing the parse of an identical upload unless the
+    request asks for the parse to be profiled.
+    
+    Returns:
+        Parser, content hash and upload size in bytes
+    """
+    if parse_profiler is None:
+        return parse_cache.get_or_parse_keyed(file.stream)
+    
+    requested = parse_profiler.requested_mode(request.headers.get(PROFILE_HEADER))
+    details = {'fileName': secure_filename(file.filename)}
+    return parse_cache.get_or_parse_keyed(
+        file.stream,
+        lambda upload: parse_profiler.profile_parse(parse_cache.parse, upload, requested, details),
+        refresh=requested is not None
+    )
+
+
+def summary_payload(parser):
+    """Build the summary members shared by the parse and handle endpoints."""
+    return {
+        'summary': record_to_dict(parser.get_workflow_summary()),
+        'version': record_to_dict(parser.get_workflow_version()),
+        'activityCount': len(parser.get_activities()),
+        'stageCount': len(parser.get_stages()),
+        'conditionCount': len(parser.get_conditions()),
+        'analysis': analyze_workflow(parser).to_dict()
+    }
+
+
+def details_response(parser, query):
+    """Stream the details selected by a query without building them in memory."""
+    result = run_query(parser, query, DETAIL_SECTIONS)
+    return Response(
+        iter_workflow_json(
+            parser,
+            extra={'success': True, **result.paging()},
+            values=result.values,
+            fields=query.fields
+        ),
+        mimetype='application/json'
+    )
+
+
+def activities_response(parser, query):
+    """Stream the activities selected by a query without building them in memory."""
+    result = run_query(parser, query)
+    return Response(
+        iter_workflow_json(
+            parser,
+            sections=('activities',),
+            extra={'success': True, 'count': result.total, **result.paging()},
+            values=result.values,
+            fields=query.fields
+        ),
+        mimetype='application/json'
+    )
+
+
+def limit_exceeded(e):
+    """Describe an upload that crossed the request size or a parse limit."""
+    if isinstance(e, RequestEntityTooLarge):
+        maximum = app.config['MAX_CONTENT_LENGTH']
+        return jsonify({
+            'success': False,
+            'error': f'Upload is larger than {maximum} bytes',
+            'limit': 'max_content_length',
+            'maximum': maximum
+        }), 413
+    
+    return jsonify({
+        'success': False,
+        'error': str(e),
+        **e.to_dict()
+    }), 413
+
+
+def handle_not_found():
+    return jsonify({
+        'success': False,
+        'error': 'Unknown or expired workflow handle, upload the file again'
+    }), 404
+
+
 @app.route('/api/workflow/parse', methods=['POST'])
 def parse_workflow():
     """
@@ -32,39 +204,20 @@ def parse_workflow():
                 'error': 'No file selected'
             }), 400
         
-        # Create a temporary file to store the upload
-        with tempfile.NamedTemporaryFile(delete=False) as temp:
-            file.save(temp.name)
-            temp_path = temp.name
+        # Parse the workflow XML, reusing the parse of an identical upload
+        parser = parse_upload(file)[0]
         
-        try:
-            # Parse the workflow XML
-            parser = ServiceNowWorkflowParser()
-            
-            with open(temp_path, 'r', encoding='utf-8') as f:
-                xml_content = f.read()
-                parser.parse(xml_content)
-            
-            # Get workflow summary
-            summary = parser.get_workflow_summary()
-            version = parser.get_workflow_version()
-            
-            # Prepare response
-            response = {
-                'success': True,
-                'summary': vars(summary),
-                'version': vars(version),
-                'activityCount': len(parser.get_activities()),
-                'stageCount': len(parser.get_stages()),
-                'conditionCount': len(parser.get_conditions()),
-                'fileName': secure_filename(file.filename)
-            }
-            
-            return jsonify(response), 200
-        finally:
-            # Clean up the temporary file
-            os.unlink(temp_path)
+        # Prepare response
+        response = {
+            'success': True,
+            **summary_payload(parser),
+            'fileName': secure_filename(file.filename)
+        }
+        
+        return jsonify(response), 200
             
+    except (WorkflowParseLimitError, RequestEntityTooLarge) as e:
+        return limit_exceeded(e)
     except Exception as e:
         return jsonify({
             'success': False,
@@ -76,9 +229,13 @@ def parse_workflow():
 def get_workflow_details():
     """
     Get detailed workflow information from an uploaded file.
-    Returns all workflow components.
+    Returns all workflow components, or the page of them selected by the
+    offset/limit or cursor, fields, stage and activity_definition query
+    parameters.
     """
     try:
+        query = RecordQuery.from_params(request.args)
+        
         # Check if file was provided
         if 'file' not in request.files:
             return jsonify({
@@ -95,36 +252,18 @@ def get_workflow_details():
                 'error': 'No file selected'
             }), 400
         
-        # Create a temporary file to store the upload
-        with tempfile.NamedTemporaryFile(delete=False) as temp:
-            file.save(temp.name)
-            temp_path = temp.name
+        # Parse the workflow XML, reusing the parse of an identical upload
+        parser = parse_upload(file)[0]
         
-        try:
-            # Parse the workflow XML
-            parser = ServiceNowWorkflowParser()
-            
-            with open(temp_path, 'r', encoding='utf-8') as f:
-                xml_content = f.read()
-                parser.parse(xml_content)
-            
-            # Prepare response with full details
-            response = {
-                'success': True,
-                'version': vars(parser.get_workflow_version()),
-                'activities': {k: vars(v) for k, v in parser.get_activities().items()},
-                'stages': {k: vars(v) for k, v in parser.get_stages().items()},
-                'conditions': {k: vars(v) for k, v in parser.get_conditions().items()},
-                'transitions': {
-                    k: [vars(t) for t in v] for k, v in parser.get_transitions().items()
-                }
-            }
-            
-            return jsonify(response), 200
-        finally:
-            # Clean up the temporary file
-            os.unlink(temp_path)
+        return details_response(parser, query), 200
             
+    except (WorkflowParseLimitError, RequestEntityTooLarge) as e:
+        return limit_exceeded(e)
+    except QueryError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
@@ -136,9 +275,13 @@ def get_workflow_details():
 def get_workflow_activities():
     """
     Get workflow activities from an uploaded file.
-    Returns just the activities from the workflow.
+    Returns just the activities from the workflow, or the page of them
+    selected by the offset/limit or cursor, fields, stage and
+    activity_definition query parameters.
     """
     try:
+        query = RecordQuery.from_params(request.args)
+        
         # Check if file was provided
         if 'file' not in request.files:
             return jsonify({
@@ -155,34 +298,177 @@ def get_workflow_activities():
                 'error': 'No file selected'
             }), 400
         
-        # Create a temporary file to store the upload
-        with tempfile.NamedTemporaryFile(delete=False) as temp:
-            file.save(temp.name)
-            temp_path = temp.name
+        # Parse the workflow XML, reusing the parse of an identical upload
+        parser = parse_upload(file)[0]
         
-        try:
-            # Parse the workflow XML
-            parser = ServiceNowWorkflowParser()
+        return activities_response(parser, query), 200
             
-            with open(temp_path, 'r', encoding='utf-8') as f:
-                xml_content = f.read()
-                parser.parse(xml_content)
+    except (WorkflowParseLimitError, RequestEntityTooLarge) as e:
+        return limit_exceeded(e)
+    except QueryError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/workflow/upload', methods=['POST'])
+def upload_workflow():
+    """
+    Upload and parse a ServiceNow workflow XML file once.
+    Returns a handle for the handle endpoints along with the summary.
+    """
+    try:
+        # Check if file was provided
+        if 'file' not in request.files:
+            return jsonify({
+                'success': False,
+                'error': 'No file provided'
+            }), 400
+        
+        file = request.files['file']
+        
+        # Check if filename is empty
+        if file.filename == '':
+            return jsonify({
+                'success': False,
+                'error': 'No file selected'
+            }), 400
+        
+        # Parse the workflow XML, reusing the parse of an identical upload
+        parser, content_hash, size = parse_upload(file)
+        handle = workflow_handles.register(content_hash, size, secure_filename(file.filename))
+        # Index the diagram now so the first viewport query pans as fast as the rest
+        get_spatial_index(parser)
+        
+        return jsonify({
+            'success': True,
+            'handle': handle.to_dict(),
+            **summary_payload(parser),
+            'fileName': handle.file_name
+        }), 201
+            
+    except (WorkflowParseLimitError, RequestEntityTooLarge) as e:
+        return limit_exceeded(e)
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/workflow/handles/<handle_id>', methods=['GET'])
+def get_handle_summary(handle_id):
+    """
+    Get the summary of an uploaded workflow by handle.
+    """
+    try:
+        found = workflow_handles.get_parser(handle_id)
+        if found is None:
+            return handle_not_found()
+        handle, parser = found
+        
+        return jsonify({
+            'success': True,
+            'handle': handle.to_dict(),
+            **summary_payload(parser),
+            'fileName': handle.file_name
+        }), 200
             
-            # Get activities
-            activities = parser.get_activities()
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/workflow/handles/<handle_id>/details', methods=['GET'])
+def get_handle_details(handle_id):
+    """
+    Get detailed workflow information of an uploaded workflow by handle.
+    Takes the same query parameters as /api/workflow/details.
+    """
+    try:
+        query = RecordQuery.from_params(request.args)
+        
+        found = workflow_handles.get_parser(handle_id)
+        if found is None:
+            return handle_not_found()
+        
+        return details_response(found[1], query), 200
             
-            # Prepare response
-            response = {
-                'success': True,
-                'activities': {k: vars(v) for k, v in activities.items()},
-                'count': len(activities)
-            }
+    except QueryError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/workflow/handles/<handle_id>/activities', methods=['GET'])
+def get_handle_activities(handle_id):
+    """
+    Get the activities of an uploaded workflow by handle.
+    Takes the same query parameters as /api/workflow/activities.
+    """
+    try:
+        query = RecordQuery.from_params(request.args)
+        
+        found = workflow_handles.get_parser(handle_id)
+        if found is None:
+            return handle_not_found()
+        
+        return activities_response(found[1], query), 200
             
-            return jsonify(response), 200
-        finally:
-            # Clean up the temporary file
-            os.unlink(temp_path)
+    except QueryError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/workflow/handles/<handle_id>/layout', methods=['GET'])
+def get_handle_layout(handle_id):
+    """
+    Get diagram coordinates of an uploaded workflow by handle.
+    Returns every activity and transition, or only those inside the
+    viewport given by the x, y, width and height query parameters. Below
+    a zoom of 0.25 screen pixels per unit, stage boxes and the transition
+    counts between them are returned instead. The layout query parameter
+    picks the computed layers (layered) or the coordinates saved in the
+    export (xml).
+    """
+    try:
+        query = LayoutQuery.from_params(request.args)
+        
+        found = workflow_handles.get_parser(handle_id)
+        if found is None:
+            return handle_not_found()
+        
+        return jsonify({
+            'success': True,
+            **viewport_payload(found[1], query)
+        }), 200
             
+    except QueryError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
@@ -190,12 +476,77 @@ def get_workflow_activities():
         }), 500
 
 
+@app.route('/api/workflow/handles/<handle_id>', methods=['DELETE'])
+def release_handle(handle_id):
+    """
+    Release a workflow handle once the client is done with it.
+    """
+    if not workflow_handles.release(handle_id):
+        return handle_not_found()
+    return jsonify({'success': True}), 200
+
+
+@app.route('/api/workflow/cache', methods=['GET'])
+def get_cache_stats():
+    """
+    Get parse cache statistics.
+    Returns hit/miss counters and current usage.
+    """
+    return jsonify({
+        'success': True,
+        'cache': parse_cache.stats(),
+        'handles': workflow_handles.stats()
+    }), 200
+
+
+@app.route('/api/workflow/profiles', methods=['GET'])
+def get_parse_profiles():
+    """
+    Get the kept parse profiles, newest first.
+    Each names its profile and retained upload in the profile directory.
+    """
+    if parse_profiler is None:
+        return jsonify({
+            'success': False,
+            'error': 'Parse profiling is not enabled, set WORKFLOW_PROFILE_DIR'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'profiler': parse_profiler.stats(),
+        'captures': parse_profiler.store.captures()
+    }), 200
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Get request and parse metrics in the Prometheus text format.
+    """
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
+
+
+@app.after_request
+def record_request_metrics(response):
+    """Record a request once its response, streamed or not, has been sent."""
+    started = g.get('request_started')
+    if started is None:
+        return response
+    
+    method, status, size = request.method, response.status_code, g.get('request_size')
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    response.call_on_close(
+        lambda: metrics.observe_request(method, endpoint, status, time.perf_counter() - started, size)
+    )
+    return response
+
+
 # Enable CORS for development
 @app.after_request
 def add_cors_headers(response):
     response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
-    response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
+    response.headers.add('Access-Control-Allow-Headers', 'Content-Type, Content-Encoding')
+    response.headers.add('Access-Control-Allow-Methods', 'GET, POST, DELETE, OPTIONS')
     return response
 
 
@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+"""
+ServiceNow Workflow Diff
+
+Compares two parsed versions of a workflow by record sys_id. The diff can
+also be applied to a parsed workflow in place, updating its record maps
+and graph index in time proportional to the change instead of rebuilding
+them.
+"""
+
+import argparse
+import bisect
+import dataclasses
+import json
+import sys
+from dataclasses import dataclass, field
+from typing import Dict, List, Any, Iterable, Optional, Set, Tuple
+
+from servicenow_workflow_parser import ServiceNowWorkflowParser, WorkflowGraph, WorkflowTransition
+from workflow_snapshot import load_workflow
+
+
+# Record sections compared by sys_id, in report order
+RECORD_SECTIONS = ("stages", "activities", "conditions", "transitions")
+
+
+@dataclass
+class SectionDiff:
+    """Differences in one record section, by sys_id."""
+    added: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    # sys_id -> field name -> [old value, new value]
+    changed: Dict[str, Dict[str, List[Any]]] = field(default_factory=dict)
+
+    @property
+    def change_count(self) -> int:
+        return len(self.added) + len(self.removed) + len(self.changed)
+
+
+@dataclass
+class WorkflowDiff:
+    """Differences between two parsed versions of a workflow."""
+    # Field name -> [old value, new value]
+    version: Dict[str, List[Any]] = field(default_factory=dict)
+    stages: SectionDiff = field(default_factory=SectionDiff)
+    activities: SectionDiff = field(default_factory=SectionDiff)
+    conditions: SectionDiff = field(default_factory=SectionDiff)
+    transitions: SectionDiff = field(default_factory=SectionDiff)
+
+    @property
+    def change_count(self) -> int:
+        """Number of changed records, counting a changed version as one."""
+        return (1 if self.version else 0) + sum(getattr(self, s).change_count for s in RECORD_SECTIONS)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Get a JSON-serializable representation including the change count."""
+        result = dataclasses.asdict(self)
+        result["change_count"] = self.change_count
+        return result
+
+
+def _field_changes(old: Any, new: Any) -> Dict[str, List[Any]]:
+    """Compare two records field by field."""
+    if old is None or new is None:
+        if old is new:
+            return {}
+        record = old if new is None else new
+        return {f.name: [getattr(old, f.name, None), getattr(new, f.name, None)]
+                for f in dataclasses.fields(record)}
+
+    changes = {}
+    for f in dataclasses.fields(old):
+        old_value = getattr(old, f.name)
+        new_value = getattr(new, f.name)
+        if old_value != new_value:
+            changes[f.name] = [old_value, new_value]
+    return changes
+
+
+def _diff_section(old: Dict[str, Any], new: Dict[str, Any]) -> SectionDiff:
+    """Match two record maps by key."""
+    diff = SectionDiff()
+    for key, record in old.items():
+        other = new.get(key)
+        if other is None:
+            diff.removed.append(key)
+        elif record is not other and record != other:
+            diff.changed[key] = _field_changes(record, other)
+    diff.added = [key for key in new if key not in old]
+    return diff
+
+
+def _transitions_by_id(parser: ServiceNowWorkflowParser) -> Dict[str, WorkflowTransition]:
+    """Flatten the grouped transitions into a map keyed by sys_id."""
+    return {t.id: t for transition_list in parser.get_transitions().values() for t in transition_list}
+
+
+def diff_workflows(old: ServiceNowWorkflowParser, new: ServiceNowWorkflowParser) -> WorkflowDiff:
+    """
+    Compare two parsed versions of a workflow.
+
+    Records are matched by sys_id, so both should be parsed with the same
+    model type; compact and regular models compare as changed.
+
+    Args:
+        old: Parsed earlier version
+        new: Parsed later version
+
+    Returns:
+        Added, removed and changed records for each section
+    """
+    return WorkflowDiff(
+        version=_field_changes(old.get_workflow_version(), new.get_workflow_version()),
+        stages=_diff_section(old.get_stages(), new.get_stages()),
+        activities=_diff_section(old.get_activities(), new.get_activities()),
+        conditions=_diff_section(old.get_conditions(), new.get_conditions()),
+        transitions=_diff_section(_transitions_by_id(old), _transitions_by_id(new))
+    )
+
+
+class _GraphPatch:
+    """
+    Updates a graph index for changed activities and transitions.
+
+    Transitions whose endpoints may resolve differently are detached while
+    the old indexes are in place, the node indexes are updated, and the
+    transitions are attached again against the new indexes. Removed nodes
+    are filled with the last node, so node ids stay dense.
+    """
+
+    def __init__(self, graph: WorkflowGraph):
+        self.graph = graph
+        self.detached: Dict[int, WorkflowTransition] = {}
+        self.detached_dangling: Set[int] = set()
+
+    def incident(self, node: int) -> Iterable[WorkflowTransition]:
+        """Transitions leaving or entering a node."""
+        graph = self.graph
+        yield from graph.out_transitions[node]
+        for source in set(graph.predecessors[node]):
+            for target, transition in zip(graph.successors[source], graph.out_transitions[source]):
+                if target == node:
+                    yield transition
+
+    def collect(self, references: Set[str], moved: Iterable[int]) -> None:
+        """Detach every transition whose endpoints may resolve differently."""
+        graph = self.graph
+        candidates = {}
+        for reference in references:
+            node = graph.resolve(reference)
+            if node is not None:
+                for transition in self.incident(node):
+                    if transition.from_activity_id == reference or transition.to_activity_id == reference:
+                        candidates[id(transition)] = transition
+        for node in moved:
+            for transition in self.incident(node):
+                candidates[id(transition)] = transition
+        for transition in graph.dangling:
+            if transition.from_activity_id in references or transition.to_activity_id in references:
+                candidates[id(transition)] = transition
+
+        for transition in candidates.values():
+            self.detach(transition)
+
+    def detach(self, transition: WorkflowTransition) -> None:
+        """Remove a transition from the graph while the old indexes are in place."""
+        if id(transition) in self.detached:
+            return
+        graph = self.graph
+        self.detached[id(transition)] = transition
+        source = graph.resolve(transition.from_activity_id)
+        target = graph.resolve(transition.to_activity_id)
+        if source is None or target is None:
+            self.detached_dangling.add(id(transition))
+            return
+
+        out = graph.out_transitions[source]
+        position = next(i for i, t in enumerate(out) if t is transition)
+        del out[position]
+        del graph.successors[source][position]
+        graph.predecessors[target].remove(source)
+        graph.edge_count -= 1
+
+    def attach(self, transition: WorkflowTransition) -> None:
+        """Add a transition to the graph against the new indexes."""
+        graph = self.graph
+        source = graph.resolve(transition.from_activity_id)
+        target = graph.resolve(transition.to_activity_id)
+        if source is None or target is None:
+            graph.dangling.append(transition)
+            return
+        graph.successors[source].append(target)
+        graph.predecessors[target].append(source)
+        graph.out_transitions[source].append(transition)
+        graph.edge_count += 1
+
+    def move_stage(self, node: int, old_stage: str, new_stage: str, new_node: Optional[int] = None) -> None:
+        """Update stage membership when a node changes stage or id."""
+        members = self.graph.stage_members
+        if old_stage:
+            members[old_stage].remove(node)
+            if not members[old_stage]:
+                del members[old_stage]
+        if new_stage:
+            bisect.insort(members.setdefault(new_stage, []), node if new_node is None else new_node)
+
+
+def _removal_moves(removed: List[int], size: int) -> List[Tuple[int, int]]:
+    """
+    Plan the moves that keep node ids dense.
+
+    Removals are handled from the highest node down, each filled with the
+    current last node, which is then never itself waiting for removal.
+
+    Returns:
+        (removed node, node moved into its place or None) pairs
+    """
+    plan = []
+    for node in sorted(removed, reverse=True):
+        size -= 1
+        plan.append((node, size if size != node else None))
+    return plan
+
+
+def apply_workflow_diff(
+    parser: ServiceNowWorkflowParser,
+    new: ServiceNowWorkflowParser,
+    diff: Optional[WorkflowDiff] = None
+) -> WorkflowDiff:
+    """
+    Update a parsed workflow in place to match a later version.
+
+    Only changed records are replaced, taken from ``new``, and the graph
+    index is patched rather than rebuilt: the cost follows the number of
+    changed records and the transitions touching them, plus a pass over
+    the activity names. The result matches a fresh graph over the updated
+    records, but record order may differ from a fresh parse of the later
+    version, which matters only where activities share a display name.
+    The summary is derived from the graph, so it follows.
+
+    A lazy parser or snapshot has its models built first and its record
+    maps replaced with plain dicts, which diffing builds the models for
+    anyway. Use ``parser.copy()`` to leave the earlier version untouched.
+
+    Args:
+        parser: Parsed earlier version, updated in place
+        new: Parsed later version
+        diff: Diff between the two, computed when not given
+
+    Returns:
+        The applied diff
+    """
+    parser.materialize()
+    if diff is None:
+        diff = diff_workflows(parser, new)
+
+    graph = parser.get_graph()
+    patch = _GraphPatch(graph)
+    old_transitions = _transitions_by_id(parser)
+    new_transitions = _transitions_by_id(new)
+    activity_diff = diff.activities
+
+    # References whose resolution may change
+    references: Set[str] = set()
+    for sys_id in activity_diff.removed:
+        references.update((sys_id, parser.activities[sys_id].name))
+    for sys_id in activity_diff.added:
+        references.update((sys_id, new.activities[sys_id].name))
+    for sys_id, changes in activity_diff.changed.items():
+        if "name" in changes:
+            references.update(changes["name"])
+
+    moves = _removal_moves([graph.sys_id_index[sys_id] for sys_id in activity_diff.removed], len(graph))
+    moved = [source for _, source in moves if source is not None]
+    references.update(graph.node_names[node] for node in moved)
+
+    patch.collect(references, moved)
+    for sys_id in diff.transitions.removed + list(diff.transitions.changed):
+        patch.detach(old_transitions[sys_id])
+
+    # Record maps
+    for section in ("stages", "activities", "conditions"):
+        records = getattr(parser, section)
+        section_diff = getattr(diff, section)
+        for sys_id in section_diff.removed:
+            del records[sys_id]
+        for sys_id in list(section_diff.changed) + section_diff.added:
+            records[sys_id] = getattr(new, section)[sys_id]
+
+    for sys_id in diff.transitions.removed + list(diff.transitions.changed):
+        transition = old_transitions[sys_id]
+        group = parser.transitions[transition.from_activity_id]
+        group.remove(transition)
+        if not group:
+            del parser.transitions[transition.from_activity_id]
+    for sys_id in list(diff.transitions.changed) + diff.transitions.added:
+        transition = new_transitions[sys_id]
+        parser.transitions.setdefault(transition.from_activity_id, []).append(transition)
+
+    if diff.version:
+        parser.workflow_version = new.get_workflow_version()
+
+    # Node indexes
+    for node, source in moves:
+        sys_id = graph.node_ids[node]
+        patch.move_stage(node, graph.activities[node].stage_id, "")
+        del graph.sys_id_index[sys_id]
+        if source is not None:
+            graph.node_ids[node] = graph.node_ids[source]
+            graph.node_names[node] = graph.node_names[source]
+            graph.activities[node] = graph.activities[source]
+            graph.sys_id_index[graph.node_ids[node]] = node
+            stage_id = graph.activities[node].stage_id
+            patch.move_stage(source, stage_id, stage_id, new_node=node)
+        for column in (graph.node_ids, graph.node_names, graph.activities,
+                       graph.successors, graph.predecessors, graph.out_transitions):
+            column.pop()
+
+    for sys_id in activity_diff.changed:
+        node = graph.sys_id_index[sys_id]
+        activity = parser.activities[sys_id]
+        patch.move_stage(node, graph.activities[node].stage_id, activity.stage_id)
+        graph.node_names[node] = activity.name
+        graph.activities[node] = activity
+
+    for sys_id in activity_diff.added:
+        activity = parser.activities[sys_id]
+        node = len(graph.node_ids)
+        graph.node_ids.append(sys_id)
+        graph.node_names.append(activity.name)
+        graph.activities.append(activity)
+        graph.sys_id_index[sys_id] = node
+        for column in (graph.successors, graph.predecessors, graph.out_transitions):
+            column.append([])
+        patch.move_stage(node, "", activity.stage_id)
+
+    if moves:
+        # Keep activity order in step with node order, as after a parse
+        parser.activities = dict(zip(graph.node_ids, graph.activities))
+
+    # The first activity with a name wins when names repeat
+    for name in references:
+        graph.name_index.pop(name, None)
+    for node, name in enumerate(graph.node_names):
+        if name in references:
+            graph.name_index.setdefault(name, node)
+
+    # Transitions
+    graph.dangling = [t for t in graph.dangling if id(t) not in patch.detached_dangling]
+    replaced = set(diff.transitions.removed) | set(diff.transitions.changed)
+    for transition in patch.detached.values():
+        if transition.id not in replaced:
+            patch.attach(transition)
+    for sys_id in list(diff.transitions.changed) + diff.transitions.added:
+        patch.attach(new_transitions[sys_id])
+
+    # Any change, transitions and start activity included, moves the diagram
+    if diff.change_count:
+        graph.invalidate()
+    version = parser.workflow_version
+    graph.start = graph.resolve(version.start_activity_id if version else "")
+
+    return diff
+
+
+def main() -> int:
+    """Diff entry point; exits non-zero when the workflows differ."""
+    parser = argparse.ArgumentParser(
+        description="Compare two versions of a ServiceNow workflow by record sys_id"
+    )
+
+    parser.add_argument("old", help="Earlier workflow XML file or snapshot")
+    parser.add_argument("new", help="Later workflow XML file or snapshot")
+
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Print the diff as JSON instead of text"
+    )
+
+    args = parser.parse_args()
+    diff = diff_workflows(load_workflow(args.old), load_workflow(args.new))
+
+    if args.json:
+        print(json.dumps(diff.to_dict(), indent=2))
+        return 1 if diff.change_count else 0
+
+    for name, (old_value, new_value) in diff.version.items():
+        print(f"version: {name}: {old_value!r} -> {new_value!r}")
+    for section in RECORD_SECTIONS:
+        section_diff = getattr(diff, section)
+        for sys_id in section_diff.added:
+            print(f"{section}: added {sys_id}")
+        for sys_id in section_diff.removed:
+            print(f"{section}: removed {sys_id}")
+        for sys_id, changes in section_diff.changed.items():
+            for name, (old_value, new_value) in changes.items():
+                print(f"{section}: changed {sys_id} {name}: {old_value!r} -> {new_value!r}")
+
+    return 1 if diff.change_count else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+import asyncio
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Any, BinaryIO, Callable, Optional, Tuple
+
+from servicenow_workflow_parser import ParseLimits, ServiceNowWorkflowParser
+from workflow_profiling import ParseProfile, profile_call
+
+
+# Tiny document parsed by each worker when the pool is warmed
+WARM_UP_XML = b"<unload><wf_workflow_version><sys_id>warm-up</sys_id></wf_workflow_version></unload>"
+
+
+class ExecutorSaturated(Exception):
+    """Raised when the parse executor has no room for another request."""
+
+
+def parse_workflow_bytes(content: bytes, limits: Optional[ParseLimits] = None,
+                         lazy: bool = False) -> ServiceNowWorkflowParser:
+    """
+    Parse raw workflow XML in a worker.
+
+    The returned parser holds no DOM, so it pickles back to the caller,
+    lazy or not.
+    """
+    parser = ServiceNowWorkflowParser(lazy=lazy, limits=limits)
+    parser.parse_stream(content)
+    return parser
+
+
+def parse_workflow_stream(stream: BinaryIO, limits: Optional[ParseLimits] = None,
+                          lazy: bool = False) -> ServiceNowWorkflowParser:
+    """Parse a workflow XML stream in a worker thread."""
+    parser = ServiceNowWorkflowParser(lazy=lazy, limits=limits)
+    parser.parse_stream(stream)
+    return parser
+
+
+def profile_workflow_bytes(
+    content: bytes,
+    limits: Optional[ParseLimits],
+    mode: str,
+    interval: float,
+    lazy: bool = False
+) -> Tuple[ServiceNowWorkflowParser, ParseProfile]:
+    """Parse raw workflow XML in a worker under a profiler; see profile_call."""
+    return profile_call(mode, parse_workflow_bytes, content, limits, lazy, interval=interval)
+
+
+def profile_workflow_stream(
+    stream: BinaryIO,
+    limits: Optional[ParseLimits],
+    mode: str,
+    interval: float,
+    lazy: bool = False
+) -> Tuple[ServiceNowWorkflowParser, ParseProfile]:
+    """Parse a workflow XML stream in a worker thread under a profiler."""
+    return profile_call(mode, parse_workflow_stream, stream, limits, lazy, interval=interval)
+
+
+def _warm_up() -> None:
+    """Import and exercise the parser once so the first request is not cold."""
+    parse_workflow_bytes(WARM_UP_XML)
+
+
+async def _read(stream: BinaryIO) -> bytes:
+    """Read an upload stream without blocking the event loop on a spooled file."""
+    return await asyncio.get_running_loop().run_in_executor(None, stream.read)
+
+
+class ParseExecutor:
+    """
+    Runs CPU-bound workflow parsing off the event loop.
+
+    At most ``max_concurrency`` parses run at a time. Up to ``max_queue``
+    more wait their turn, and further requests fail fast with
+    ExecutorSaturated so the caller can shed load.
+    """
+
+    def __init__(self, kind: str = "process", max_workers: Optional[int] = None,
+                 max_concurrency: Optional[int] = None, max_queue: int = 32,
+                 limits: Optional[ParseLimits] = None, lazy: bool = False):
+        """
+        Args:
+            kind: "process" for a process pool or "thread" for a thread pool
+            max_workers: Pool size, defaults to the number of CPUs
+            max_concurrency: Parses allowed to run at once, defaults to max_workers
+            max_queue: Parses allowed to wait for a free slot
+            limits: Bounds uploads must stay within, or None
+            lazy: Parse in lazy mode, building models only when read
+        """
+        if kind not in ("process", "thread"):
+            raise ValueError(f"Unknown executor kind: {kind}")
+
+        self.kind = kind
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_concurrency = max_concurrency or self.max_workers
+        self.max_queue = max_queue
+        self.limits = limits
+        self.lazy = lazy
+        self.pending = 0
+        self.rejected = 0
+        self._executor: Optional[Executor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def start(self) -> None:
+        """Create the pool and warm every worker."""
+        if self._executor is not None:
+            return
+
+        if self.kind == "process":
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_warm_up)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="workflow-parse")
+
+        # One task per worker makes the pool start all of them now
+        wait([self._executor.submit(_warm_up) for _ in range(self.max_workers)])
+
+    def shutdown(self) -> None:
+        """Stop the pool, waiting for running parses."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """
+        Run a function in the pool once a concurrency slot is free.
+
+        Raises:
+            ExecutorSaturated: If the queue of waiting calls is full
+        """
+        if self._executor is None:
+            self.start()
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        self._check_capacity()
+
+        self.pending += 1
+        try:
+            async with self._semaphore:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+    async def parse(self, stream: BinaryIO) -> ServiceNowWorkflowParser:
+        """
+        Parse an upload stream in the pool.
+
+        Threads read the stream directly; processes are sent its bytes,
+        read in the event loop's default executor.
+        """
+        if self.kind == "process":
+            # Reject before copying the upload into memory
+            self._check_capacity()
+            return await self.run(parse_workflow_bytes, await _read(stream), self.limits, self.lazy)
+        return await self.run(parse_workflow_stream, stream, self.limits, self.lazy)
+
+    async def profile(self, stream: BinaryIO, mode: str, interval: float) -> Tuple[ServiceNowWorkflowParser, ParseProfile]:
+        """
+        Like parse, profiling the parse where it runs.
+
+        Args:
+            stream: Upload stream
+            mode: "cprofile" or "sample"
+            interval: Seconds between stack samples in sample mode
+
+        Returns:
+            Parser and profile
+        """
+        if self.kind == "process":
+            self._check_capacity()
+            return await self.run(profile_workflow_bytes, await _read(stream), self.limits, mode, interval, self.lazy)
+        return await self.run(profile_workflow_stream, stream, self.limits, mode, interval, self.lazy)
+
+    def _check_capacity(self) -> None:
+        """Raise ExecutorSaturated if no more calls may wait."""
+        if self.pending >= self.max_concurrency + self.max_queue:
+            self.rejected += 1
+            raise ExecutorSaturated("Parser is busy, retry later")
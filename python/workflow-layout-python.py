@@ -0,0 +1,572 @@
+"""
+Diagram layout for parsed workflows, computed on the server.
+
+The layered layout places activities top to bottom in the direction of
+their transitions: transitions closing a loop are reversed to make the graph
+acyclic, activities are assigned to layers by longest path, long
+transitions get a bend point per layer they cross, up to a limit, layers are reordered to
+reduce crossings, and activities are moved towards their neighbours without
+overlapping. Transitions are routed through their bend points.
+
+Coordinates are kept in flat arrays in node order, so a layout of a
+10,000-activity workflow is a few hundred kilobytes and viewport queries
+only touch numbers.
+"""
+
+import threading
+import weakref
+from array import array
+from dataclasses import dataclass
+from typing import Dict, List, Any, Mapping, Optional, Sequence, Tuple
+
+from servicenow_workflow_parser import ServiceNowWorkflowParser, WorkflowGraph, WorkflowTransition
+from workflow_query import QueryError
+
+
+# Layout algorithms: computed layers, or the coordinates saved in the export
+LAYOUT_ALGORITHMS = ("layered", "xml")
+
+# Size of an activity box and the space between boxes
+NODE_WIDTH = 160.0
+NODE_HEIGHT = 60.0
+NODE_GAP = 40.0
+LAYER_GAP = 80.0
+
+# Horizontal space taken by a bend point of a long transition
+BEND_WIDTH = 20.0
+
+# Transitions crossing more layers than this are drawn straight, without bend
+# points; they take no part in ordering, which keeps large graphs fast
+MAX_BEND_LAYERS = 8
+
+# Size of the loop drawn for a transition from an activity to itself
+SELF_LOOP_SIZE = 20.0
+
+# Alternating down and up passes over the layers to reduce crossings
+CROSSING_SWEEPS = 4
+
+# Passes moving activities towards their neighbours after ordering
+PLACEMENT_SWEEPS = 2
+
+# Rectangle as (min x, min y, max x, max y)
+Box = Tuple[float, float, float, float]
+
+
+@dataclass
+class WorkflowLayout:
+    """
+    Diagram coordinates of a workflow graph.
+
+    Node arrays are in node order. Edges are the graph's resolved
+    transitions in adjacency order; dangling transitions have no endpoint
+    to draw and are left out.
+    """
+    algorithm: str
+    # Top left corner of each activity box
+    x: array
+    y: array
+    # Layer of each activity, or -1 when the export's coordinates were used
+    layer: array
+    node_width: float
+    node_height: float
+    edge_source: array
+    edge_target: array
+    edge_transitions: List[WorkflowTransition]
+    # Each edge's route as flat x, y pairs from source to target
+    edge_points: List[array]
+    # Bounding box of each edge's route, four values per edge
+    edge_boxes: array
+    # Edges drawn against the layer direction to break a loop
+    reversed_edges: bytearray
+    bounds: Box
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.edge_transitions)
+
+    def node_box(self, node: int) -> Box:
+        return (self.x[node], self.y[node], self.x[node] + self.node_width, self.y[node] + self.node_height)
+
+
+def _edge_list(graph: WorkflowGraph) -> Tuple[array, array, List[WorkflowTransition]]:
+    """Flatten the graph's adjacency into parallel edge arrays."""
+    sources, targets, transitions = array("i"), array("i"), []
+    for node, successors in enumerate(graph.successors):
+        sources.extend([node] * len(successors))
+        targets.extend(successors)
+        transitions.extend(graph.out_transitions[node])
+    return sources, targets, transitions
+
+
+def _back_edges(graph: WorkflowGraph, sources: array, targets: array) -> bytearray:
+    """
+    Find edges closing a loop with an iterative depth-first search.
+
+    The search starts at the start activity, then at activities without
+    predecessors, so the workflow's natural direction is kept.
+
+    Returns:
+        Flag per edge, set for back edges and self loops
+    """
+    count = len(graph)
+    first_edge = array("i", [0]) * (count + 1)
+    for node in range(count):
+        first_edge[node + 1] = first_edge[node] + len(graph.successors[node])
+
+    back = bytearray(len(sources))
+    # 0 unvisited, 1 on the search path, 2 finished
+    state = bytearray(count)
+    roots = ([graph.start] if graph.start is not None else []) + \
+        [node for node in range(count) if not graph.predecessors[node]] + list(range(count))
+
+    for root in roots:
+        if state[root]:
+            continue
+        state[root] = 1
+        # Each frame is (node, next edge to follow)
+        work = [(root, first_edge[root])]
+        while work:
+            node, edge = work[-1]
+            if edge == first_edge[node + 1]:
+                state[node] = 2
+                work.pop()
+                continue
+            work[-1] = (node, edge + 1)
+            target = targets[edge]
+            if state[target] == 1:
+                back[edge] = 1
+            elif not state[target]:
+                state[target] = 1
+                work.append((target, first_edge[target]))
+
+    return back
+
+
+def _assign_layers(count: int, sources: array, targets: array, back: bytearray) -> List[int]:
+    """
+    Layer the acyclic graph by longest path from its sources.
+
+    Sources are then moved down to just above their nearest successor, so
+    branches starting late do not leave long transitions behind.
+    """
+    down: List[List[int]] = [[] for _ in range(count)]
+    indegree = [0] * count
+    for edge in range(len(sources)):
+        source, target = sources[edge], targets[edge]
+        if source == target:
+            continue
+        if back[edge]:
+            source, target = target, source
+        down[source].append(target)
+        indegree[target] += 1
+
+    layer = [0] * count
+    order = [node for node in range(count) if not indegree[node]]
+    for node in order:
+        next_layer = layer[node] + 1
+        for target in down[node]:
+            if layer[target] < next_layer:
+                layer[target] = next_layer
+            indegree[target] -= 1
+            if not indegree[target]:
+                order.append(target)
+
+    has_predecessor = bytearray(count)
+    for targets_of in down:
+        for target in targets_of:
+            has_predecessor[target] = 1
+    for node in range(count):
+        if not has_predecessor[node] and down[node]:
+            layer[node] = min(layer[target] for target in down[node]) - 1
+
+    return layer
+
+
+def _order_layers(layers: List[List[int]], up: List[List[int]], down: List[List[int]]) -> List[int]:
+    """
+    Reorder each layer by the barycenter of its neighbours in the layer
+    above, then below, alternately.
+
+    Returns:
+        Position of each vertex within its layer
+    """
+    position = [0] * len(up)
+    for members in layers:
+        for index, vertex in enumerate(members):
+            position[vertex] = index
+
+    for sweep in range(CROSSING_SWEEPS):
+        downward = sweep % 2 == 0
+        neighbours = up if downward else down
+        for members in (layers[1:] if downward else reversed(layers[:-1])):
+            keys = {}
+            for vertex in members:
+                adjacent = neighbours[vertex]
+                # Vertices without neighbours on that side keep their place
+                keys[vertex] = (sum([position[n] for n in adjacent]) / len(adjacent)
+                                if adjacent else position[vertex])
+            members.sort(key=keys.__getitem__)
+            for index, vertex in enumerate(members):
+                position[vertex] = index
+
+    return position
+
+
+def _place_layers(layers: List[List[int]], up: List[List[int]], down: List[List[int]],
+                  widths: List[float]) -> List[float]:
+    """
+    Give each vertex a horizontal center, keeping layer order and spacing.
+
+    Vertices start packed from the left, then each pass moves them to the
+    mean center of their neighbours in the layer above, then below. Overlaps
+    are resolved by pushing right from the left and left from the right, and
+    taking the average of both, which keeps the spacing and stays close to
+    where the vertices wanted to be.
+
+    Returns:
+        Horizontal center of each vertex
+    """
+    center = [0.0] * len(widths)
+    for members in layers:
+        left = 0.0
+        for vertex in members:
+            center[vertex] = left + widths[vertex] / 2
+            left += widths[vertex] + NODE_GAP
+
+    for sweep in range(2 * PLACEMENT_SWEEPS):
+        downward = sweep % 2 == 0
+        neighbours = up if downward else down
+        for members in (layers[1:] if downward else reversed(layers[:-1])):
+            wanted = []
+            for vertex in members:
+                adjacent = neighbours[vertex]
+                wanted.append(sum([center[n] for n in adjacent]) / len(adjacent) if adjacent else center[vertex])
+
+            pushed_right = []
+            limit = float("-inf")
+            for vertex, target in zip(members, wanted):
+                half = widths[vertex] / 2
+                placed = max(target, limit + half)
+                pushed_right.append(placed)
+                limit = placed + half + NODE_GAP
+
+            limit = float("inf")
+            for index in range(len(members) - 1, -1, -1):
+                half = widths[members[index]] / 2
+                placed = min(wanted[index], limit - half)
+                center[members[index]] = (placed + pushed_right[index]) / 2
+                limit = placed - half - NODE_GAP
+
+    return center
+
+
+def layered_layout(graph: WorkflowGraph) -> WorkflowLayout:
+    """
+    Lay a workflow out in layers, top to bottom.
+
+    Args:
+        graph: Graph index of the workflow
+
+    Returns:
+        Layout with every activity on a layer and transitions routed
+        through a bend point per layer they cross
+    """
+    count = len(graph)
+    sources, targets, transitions = _edge_list(graph)
+    back = _back_edges(graph, sources, targets)
+    node_layer = _assign_layers(count, sources, targets, back)
+
+    # Vertices are the activities followed by the bend points of long edges
+    layer_of = list(node_layer)
+    up: List[List[int]] = [[] for _ in range(count)]
+    down: List[List[int]] = [[] for _ in range(count)]
+    chains: List[Optional[List[int]]] = []
+
+    for edge in range(len(sources)):
+        source, target = sources[edge], targets[edge]
+        if source == target:
+            chains.append(None)
+            continue
+        if back[edge]:
+            source, target = target, source
+        chain = [source]
+        if layer_of[target] - layer_of[source] > MAX_BEND_LAYERS:
+            chains.append(chain + [target])
+            continue
+        for level in range(layer_of[source] + 1, layer_of[target]):
+            bend = len(layer_of)
+            layer_of.append(level)
+            up.append([])
+            down.append([])
+            chain.append(bend)
+        chain.append(target)
+        for upper, lower in zip(chain, chain[1:]):
+            down[upper].append(lower)
+            up[lower].append(upper)
+        chains.append(chain)
+
+    layers: List[List[int]] = [[] for _ in range(max(layer_of, default=-1) + 1)]
+    for vertex, level in enumerate(layer_of):
+        layers[level].append(vertex)
+
+    _order_layers(layers, up, down)
+    widths = [NODE_WIDTH] * count + [BEND_WIDTH] * (len(layer_of) - count)
+    center = _place_layers(layers, up, down, widths)
+
+    layer_height = NODE_HEIGHT + LAYER_GAP
+    x = array("d", [center[node] - NODE_WIDTH / 2 for node in range(count)])
+    y = array("d", [node_layer[node] * layer_height for node in range(count)])
+
+    points = []
+    for edge, chain in enumerate(chains):
+        if chain is None:
+            points.append(_self_loop(x[sources[edge]], y[sources[edge]]))
+            continue
+        route = array("d", [center[chain[0]], layer_of[chain[0]] * layer_height + NODE_HEIGHT])
+        for bend in chain[1:-1]:
+            route.extend((center[bend], layer_of[bend] * layer_height + NODE_HEIGHT / 2))
+        route.extend((center[chain[-1]], layer_of[chain[-1]] * layer_height))
+        if back[edge]:
+            route = _reverse_route(route)
+        points.append(route)
+
+    return _finish_layout("layered", x, y, array("i", node_layer), sources, targets, transitions, points, back)
+
+
+def xml_layout(graph: WorkflowGraph) -> WorkflowLayout:
+    """
+    Lay a workflow out at the coordinates saved in its export.
+
+    Transitions are drawn straight from the bottom of their source to the
+    top of their target. Missing or invalid coordinates count as 0.
+    """
+    count = len(graph)
+    x = array("d", [_coordinate(graph.activities[node].x) for node in range(count)])
+    y = array("d", [_coordinate(graph.activities[node].y) for node in range(count)])
+    sources, targets, transitions = _edge_list(graph)
+
+    points = []
+    for source, target in zip(sources, targets):
+        if source == target:
+            points.append(_self_loop(x[source], y[source]))
+            continue
+        points.append(array("d", [
+            x[source] + NODE_WIDTH / 2, y[source] + NODE_HEIGHT,
+            x[target] + NODE_WIDTH / 2, y[target]
+        ]))
+
+    return _finish_layout(
+        "xml", x, y, array("i", [-1]) * count, sources, targets, transitions, points, bytearray(len(sources))
+    )
+
+
+def _coordinate(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _self_loop(left: float, top: float) -> array:
+    """Route a transition from an activity back to itself around its right side."""
+    right = left + NODE_WIDTH
+    middle = top + NODE_HEIGHT / 2
+    return array("d", [
+        right, middle - SELF_LOOP_SIZE / 2,
+        right + SELF_LOOP_SIZE, middle - SELF_LOOP_SIZE / 2,
+        right + SELF_LOOP_SIZE, middle + SELF_LOOP_SIZE / 2,
+        right, middle + SELF_LOOP_SIZE / 2
+    ])
+
+
+def _reverse_route(route: array) -> array:
+    reversed_route = array("d")
+    for index in range(len(route) - 2, -1, -2):
+        reversed_route.extend((route[index], route[index + 1]))
+    return reversed_route
+
+
+def _finish_layout(algorithm: str, x: array, y: array, layer: array, sources: array, targets: array,
+                   transitions: List[WorkflowTransition], points: List[array],
+                   reversed_edges: bytearray) -> WorkflowLayout:
+    """Compute the edge and overall bounding boxes and assemble the layout."""
+    edge_boxes = array("d")
+    for route in points:
+        xs, ys = route[0::2], route[1::2]
+        edge_boxes.extend((min(xs), min(ys), max(xs), max(ys)))
+
+    if len(x):
+        bounds = (min(x), min(y), max(x) + NODE_WIDTH, max(y) + NODE_HEIGHT)
+        if points:
+            bounds = (min(bounds[0], min(edge_boxes[0::4])), min(bounds[1], min(edge_boxes[1::4])),
+                      max(bounds[2], max(edge_boxes[2::4])), max(bounds[3], max(edge_boxes[3::4])))
+    else:
+        bounds = (0.0, 0.0, 0.0, 0.0)
+
+    return WorkflowLayout(
+        algorithm=algorithm,
+        x=x,
+        y=y,
+        layer=layer,
+        node_width=NODE_WIDTH,
+        node_height=NODE_HEIGHT,
+        edge_source=sources,
+        edge_target=targets,
+        edge_transitions=transitions,
+        edge_points=points,
+        edge_boxes=edge_boxes,
+        reversed_edges=reversed_edges,
+        bounds=bounds
+    )
+
+
+# Layouts by graph and algorithm, with the graph version they were computed
+# for; applying a diff patches a graph in place and bumps its version, and a
+# layout is dropped with its graph
+_LAYOUTS: "weakref.WeakKeyDictionary[WorkflowGraph, Dict[str, Tuple[int, WorkflowLayout]]]" = \
+    weakref.WeakKeyDictionary()
+_LAYOUTS_LOCK = threading.Lock()
+
+
+def compute_layout(graph: WorkflowGraph, algorithm: str = "layered") -> WorkflowLayout:
+    """
+    Lay out a workflow graph.
+
+    Args:
+        graph: Graph index of the workflow
+        algorithm: "layered", or "xml" for the coordinates in the export
+
+    Raises:
+        ValueError: If the algorithm is unknown
+    """
+    if algorithm == "layered":
+        return layered_layout(graph)
+    if algorithm == "xml":
+        return xml_layout(graph)
+    raise ValueError(f"Unknown layout algorithm: {algorithm}")
+
+
+def get_layout(parser: ServiceNowWorkflowParser, algorithm: str = "layered") -> WorkflowLayout:
+    """
+    Get the layout of a parsed workflow, computing it on first use.
+
+    The layout is kept for as long as the parser's graph and recomputed
+    when the graph changes, so every viewport query in between reads the
+    same arrays.
+    """
+    graph = parser.get_graph()
+    version = graph.version
+    with _LAYOUTS_LOCK:
+        cached = _LAYOUTS.get(graph, {}).get(algorithm)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    layout = compute_layout(graph, algorithm)
+    with _LAYOUTS_LOCK:
+        _LAYOUTS.setdefault(graph, {})[algorithm] = (version, layout)
+    return layout
+
+
+@dataclass
+class LayoutQuery:
+    """Which layout to use and which part of it to return."""
+    algorithm: str = "layered"
+    # Rectangle to return the contents of, or None for everything
+    viewport: Optional[Box] = None
+    # Screen pixels per layout unit, or None to always return activities
+    zoom: Optional[float] = None
+
+    def __post_init__(self):
+        if self.algorithm not in LAYOUT_ALGORITHMS:
+            raise QueryError(f"layout must be one of {', '.join(LAYOUT_ALGORITHMS)}")
+        if self.viewport is not None:
+            min_x, min_y, max_x, max_y = self.viewport
+            if max_x < min_x or max_y < min_y:
+                raise QueryError("viewport must not have a negative width or height")
+        if self.zoom is not None and not self.zoom > 0:
+            raise QueryError("zoom must be greater than 0")
+
+    @classmethod
+    def from_params(cls, params: Mapping[str, str]) -> "LayoutQuery":
+        """
+        Build a query from request query parameters.
+
+        Args:
+            params: layout ("layered" or "xml"), x, y, width and height
+                of the viewport, all four or none, and zoom
+
+        Raises:
+            QueryError: If a parameter is not valid
+        """
+        names = ("x", "y", "width", "height")
+        given = [params.get(name) not in (None, "") for name in names]
+        viewport = None
+        if any(given):
+            if not all(given):
+                raise QueryError("viewport needs x, y, width and height")
+            try:
+                x, y, width, height = (float(params[name]) for name in names)
+            except ValueError:
+                raise QueryError("x, y, width and height must be numbers") from None
+            viewport = (x, y, x + width, y + height)
+
+        zoom = None
+        if params.get("zoom") not in (None, ""):
+            try:
+                zoom = float(params["zoom"])
+            except ValueError:
+                raise QueryError("zoom must be a number") from None
+
+        return cls(algorithm=params.get("layout") or "layered", viewport=viewport, zoom=zoom)
+
+
+def _box_dict(box: Sequence[float]) -> Dict[str, float]:
+    return {"x": box[0], "y": box[1], "width": box[2] - box[0], "height": box[3] - box[1]}
+
+
+def layout_payload(parser: ServiceNowWorkflowParser, query: LayoutQuery,
+                   nodes: Optional[Sequence[int]] = None,
+                   edges: Optional[Sequence[int]] = None) -> Dict[str, Any]:
+    """
+    Build the response members describing a workflow's layout.
+
+    Args:
+        parser: Parsed workflow
+        query: Layout to use and the viewport it was queried for
+        nodes: Nodes to include, all of them when None
+        edges: Edges to include, all of them when None
+
+    Returns:
+        Layout algorithm, bounds, totals, and the activities and transitions
+        to draw with their boxes and routes
+    """
+    graph = parser.get_graph()
+    layout = get_layout(parser, query.algorithm)
+    if nodes is None:
+        nodes = range(len(layout.x))
+    if edges is None:
+        edges = range(layout.edge_count)
+
+    node_ids = graph.node_ids
+    return {
+        "layout": layout.algorithm,
+        "bounds": _box_dict(layout.bounds),
+        "viewport": _box_dict(query.viewport) if query.viewport is not None else None,
+        "nodeTotal": len(graph),
+        "edgeTotal": layout.edge_count,
+        "nodes": [{
+            "id": node_ids[node],
+            "name": graph.node_names[node],
+            "x": layout.x[node],
+            "y": layout.y[node],
+            "width": layout.node_width,
+            "height": layout.node_height,
+            "layer": layout.layer[node]
+        } for node in nodes],
+        "edges": [{
+            "id": layout.edge_transitions[edge].id,
+            "source": node_ids[layout.edge_source[edge]],
+            "target": node_ids[layout.edge_target[edge]],
+            "points": [[route[i], route[i + 1]] for i in range(0, len(route), 2)],
+            "reversed": bool(layout.reversed_edges[edge])
+        } for edge in edges for route in (layout.edge_points[edge],)]
+    }
@@ -0,0 +1,240 @@
+"""
+Prometheus metrics for the workflow API.
+
+Counters and histograms are kept in a small thread-safe registry and rendered
+in the Prometheus text exposition format, so no client library is needed.
+Values are per process; run one scrape target per worker process.
+"""
+
+import bisect
+import math
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from servicenow_workflow_parser import RECORD_PHASES, ParseStats
+
+
+# Content type of the text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Upper bounds of the duration buckets, in seconds
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Upper bounds of the size buckets, in bytes
+SIZE_BUCKETS = tuple(1024 * 4 ** exponent for exponent in range(9))
+
+
+def _escape(value: str) -> str:
+    """Escape a label value for the exposition format."""
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    """A named metric with one series per combination of label values."""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {', '.join(self.labelnames) or 'none'}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        """Add to the series with the given label values."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(self._values.items())]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values over fixed buckets."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> (per-bucket counts with +Inf last, sum)
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        """Add an observation to the series with the given label values."""
+        key = self._key(labels)
+        bucket = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][bucket] += 1
+            series[1][0] += value
+
+    def count(self, **labels: str) -> int:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return sum(series[0]) if series else 0
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total[0])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Metrics rendered together on one /metrics endpoint."""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if any(existing.name == metric.name for existing in self._metrics):
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Render every metric in the text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class WorkflowMetrics:
+    """
+    The metrics both controllers export: requests, their latency and
+    payload sizes, and the phases, records and input bytes of parses.
+    """
+
+    def __init__(self, registry: Optional[MetricsRegistry] = None):
+        self.registry = registry or MetricsRegistry()
+        self.requests = self.registry.counter(
+            "workflow_http_requests_total",
+            "HTTP requests handled.",
+            ("method", "endpoint", "status")
+        )
+        self.request_seconds = self.registry.histogram(
+            "workflow_http_request_duration_seconds",
+            "Time from receiving a request to sending the end of its response.",
+            ("method", "endpoint")
+        )
+        self.request_bytes = self.registry.histogram(
+            "workflow_http_request_size_bytes",
+            "Size of request bodies as sent, before any Content-Encoding is undone.",
+            ("endpoint",),
+            SIZE_BUCKETS
+        )
+        self.parse_seconds = self.registry.histogram(
+            "workflow_parse_phase_seconds",
+            "Time spent per parse phase: xml, one per record type, parse (total), graph and summary.",
+            ("phase",)
+        )
+        self.parse_records = self.registry.counter(
+            "workflow_parse_records_total",
+            "Records parsed, by record type.",
+            ("record",)
+        )
+        self.parse_bytes = self.registry.histogram(
+            "workflow_parse_input_bytes",
+            "Uncompressed XML bytes read per parse.",
+            (),
+            SIZE_BUCKETS
+        )
+
+    def observe_request(self, method: str, endpoint: str, status: int, seconds: float,
+                        size: Optional[int] = None) -> None:
+        """
+        Record a finished request.
+
+        Args:
+            method: HTTP method
+            endpoint: Route template, not the raw path, to bound label values
+            status: Response status code
+            seconds: Time until the response was sent
+            size: Request body size in bytes, when known
+        """
+        self.requests.inc(method=method, endpoint=endpoint, status=str(status))
+        self.request_seconds.observe(seconds, method=method, endpoint=endpoint)
+        if size is not None:
+            self.request_bytes.observe(size, endpoint=endpoint)
+
+    def observe_phase(self, phase: str, seconds: float, stats: ParseStats) -> None:
+        """Parse hook recording a phase; see add_parse_hook."""
+        self.parse_seconds.observe(seconds, phase=phase)
+        if phase == "parse":
+            for record in RECORD_PHASES.values():
+                if stats.records.get(record):
+                    self.parse_records.inc(stats.records[record], record=record)
+            self.parse_bytes.observe(stats.input_bytes)
+
+    def observe_parse(self, stats: ParseStats) -> None:
+        """Record the phases of a parse that ran where the hooks could not see it, such as a worker process."""
+        for phase in ("xml", *RECORD_PHASES.values(), "parse"):
+            if phase in stats.phases:
+                self.observe_phase(phase, stats.phases[phase], stats)
+
+    def render(self) -> str:
+        return self.registry.render()
@@ -0,0 +1,200 @@
+from typing import Iterator, List, NamedTuple, Optional
+
+from servicenow_workflow_parser import WorkflowGraph
+
+
+class WorkflowPath(NamedTuple):
+    """A path through the workflow and why it stopped."""
+    nodes: List[int]
+    end: str  # "end", "cycle" or "depth"
+
+
+def iter_paths(
+    graph: WorkflowGraph,
+    start: Optional[int] = None,
+    max_depth: Optional[int] = None,
+    max_paths: Optional[int] = None
+) -> Iterator[WorkflowPath]:
+    """
+    Lazily enumerate the paths from an activity to the ends of the workflow.
+
+    Paths are produced depth first on an explicit stack, so long workflows
+    never hit the recursion limit. A path stops at an activity without
+    outgoing transitions, before an activity already on the path, or at
+    the depth limit.
+
+    Args:
+        graph: Graph index of the workflow
+        start: Node to start from, defaults to the workflow's start activity
+        max_depth: Maximum number of transitions followed on one path
+        max_paths: Stop after this many paths
+
+    Yields:
+        Paths as lists of node ids
+    """
+    if start is None:
+        start = graph.start
+    if start is None or (max_paths is not None and max_paths <= 0):
+        return
+
+    on_path = bytearray(len(graph))
+    path = [start]
+    on_path[start] = 1
+    # Each frame is the index of the next successor to follow
+    stack = [0]
+    produced = 0
+
+    def emit(end: str) -> WorkflowPath:
+        nonlocal produced
+        produced += 1
+        return WorkflowPath(list(path), end)
+
+    if not graph.successors[start]:
+        yield emit("end")
+        return
+
+    while stack:
+        node = path[-1]
+        successors = graph.successors[node]
+        index = stack[-1]
+
+        if index == len(successors):
+            stack.pop()
+            on_path[path.pop()] = 0
+            continue
+
+        stack[-1] = index + 1
+        target = successors[index]
+
+        if on_path[target]:
+            yield emit("cycle")
+        elif max_depth is not None and len(path) > max_depth:
+            yield emit("depth")
+        else:
+            path.append(target)
+            on_path[target] = 1
+            if graph.successors[target]:
+                stack.append(0)
+                continue
+            yield emit("end")
+            on_path[path.pop()] = 0
+
+        if max_paths is not None and produced >= max_paths:
+            return
+
+
+def iter_path_lines(
+    graph: WorkflowGraph,
+    start: Optional[int] = None,
+    max_depth: Optional[int] = None,
+    max_lines: Optional[int] = None
+) -> Iterator[str]:
+    """
+    Lazily render the workflow as an indented tree of paths.
+
+    Each activity's subtree is rendered once; later branches reaching the
+    same activity refer back to it instead of repeating it. Output size is
+    therefore linear in the number of activities and transitions, even for
+    workflows with many parallel joins. Dangling transitions are rendered
+    after an activity's other transitions, ending in an unknown activity.
+
+    Args:
+        graph: Graph index of the workflow
+        start: Node to start from, defaults to the workflow's start activity
+        max_depth: Maximum nesting depth rendered
+        max_lines: Stop after this many lines
+
+    Yields:
+        Output lines
+    """
+    lines = 0
+
+    def limit_reached() -> bool:
+        return max_lines is not None and lines >= max_lines
+
+    if start is None:
+        start = graph.start
+    if start is None:
+        yield "Unknown Activity: start activity not found"
+        return
+
+    on_path = bytearray(len(graph))
+    rendered = bytearray(len(graph))
+
+    # Transitions out of each node whose target does not resolve
+    dangling_out = graph.get_node_dangling()
+
+    def has_transitions(node: int) -> bool:
+        return bool(graph.successors[node]) or node in dangling_out
+
+    def visit(node: int, indent: str) -> Iterator[str]:
+        """Lines for reaching a node; marks it rendered and on the path when expanded."""
+        name = graph.node_names[node]
+        if on_path[node]:
+            yield f"{indent}... (cycle detected, already visited {name})"
+        elif rendered[node]:
+            yield f"{indent}Activity: {name} (continues as above)"
+        else:
+            rendered[node] = 1
+            yield f"{indent}Activity: {name}"
+            if not has_transitions(node):
+                yield f"{indent}  (End of path)"
+
+    for line in visit(start, ""):
+        yield line
+        lines += 1
+    if limit_reached() or not has_transitions(start):
+        return
+
+    on_path[start] = 1
+    # Each frame is (node, depth, index of the next transition to follow)
+    stack = [(start, 0, 0)]
+
+    while stack:
+        node, depth, index = stack[-1]
+        transitions = graph.out_transitions[node]
+        dangling = dangling_out.get(node, ())
+
+        if index == len(transitions) + len(dangling):
+            stack.pop()
+            on_path[node] = 0
+            continue
+
+        stack[-1] = (node, depth, index + 1)
+        indent = "    " * depth
+        transition = transitions[index] if index < len(transitions) else dangling[index - len(transitions)]
+        condition = graph.condition_for(transition)
+
+        yield f"{indent}  → [{condition.name if condition else 'Unknown'}]"
+        lines += 1
+        if limit_reached():
+            return
+
+        if index >= len(transitions):
+            if max_depth is not None and depth + 1 > max_depth:
+                yield f"{indent}    ... (path continues, max depth reached)"
+            else:
+                yield f"{indent}    Unknown Activity: {transition.to_activity_id}"
+            lines += 1
+            if limit_reached():
+                return
+            continue
+
+        target = graph.successors[node][index]
+        expand = not on_path[target] and not rendered[target]
+
+        if max_depth is not None and depth + 1 > max_depth:
+            yield f"{indent}    ... (path continues, max depth reached)"
+            lines += 1
+        else:
+            for line in visit(target, indent + "    "):
+                yield line
+                lines += 1
+                if limit_reached():
+                    return
+            if expand and has_transitions(target):
+                on_path[target] = 1
+                stack.append((target, depth + 1, 0))
+
+        if limit_reached():
+            return
@@ -0,0 +1,453 @@
+"""
+Opt-in profiling of slow or flagged workflow parses.
+
+A parse is profiled when the request asks for it with the X-Workflow-Profile
+header carrying the configured secret, or on every cache miss once a latency
+threshold is set. Requested parses run under cProfile and are always kept. Threshold parses are
+stack-sampled instead, which is cheap enough to leave on, and kept only
+when they took at least the threshold.
+
+A kept profile is written to a bounded local directory together with a JSON
+description and the upload as sent, named by its content hash and capped
+in size, so the slow parse can be replayed and benchmarked offline.
+"""
+
+import cProfile
+import hashlib
+import hmac
+import json
+import marshal
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Any, BinaryIO, Callable, Mapping, Optional, Tuple, Union
+
+from servicenow_workflow_parser import ServiceNowWorkflowParser, detect_compression
+
+
+# Request header asking for a parse to be profiled: the profiling secret, or
+# "sample:" followed by the secret for a stack-sampled profile
+PROFILE_HEADER = "X-Workflow-Profile"
+
+# Profilers a parse can run under
+PROFILE_MODES = ("cprofile", "sample")
+
+# Seconds between stack samples
+DEFAULT_SAMPLE_INTERVAL = 0.005
+
+# File name suffix of each mode's profile; .prof files load with pstats,
+# .folded files are flame graph input
+PROFILE_SUFFIXES = {"cprofile": ".prof", "sample": ".folded"}
+
+# Suffix of a retained upload, by detected compression
+INPUT_SUFFIXES = {None: ".xml", "gzip": ".xml.gz", "zstd": ".xml.zst", "zip": ".zip"}
+
+# Read size used when copying uploads into the store
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass
+class ParseProfile:
+    """Profile of one parse."""
+    mode: str
+    seconds: float
+    # Marshalled pstats data for cprofile, folded stacks for sample
+    data: bytes
+
+
+class StackSampler:
+    """
+    Sample one thread's Python stack at a fixed interval.
+
+    Used as a context manager around the code to sample, which runs on the
+    entering thread. Samples are counted per distinct stack and rendered in
+    the folded format flame graph tools read.
+    """
+
+    def __init__(self, interval: float = DEFAULT_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._target: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self) -> "StackSampler":
+        self._target = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="workflow-stack-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def folded(self) -> bytes:
+        """Render the samples as one "stack count" line per distinct stack."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common()).encode("utf-8")
+
+
+def profile_call(mode: str, fn: Callable[..., Any], *args: Any,
+                 interval: float = DEFAULT_SAMPLE_INTERVAL) -> Tuple[Any, ParseProfile]:
+    """
+    Run a function under a profiler.
+
+    Args:
+        mode: "cprofile" or "sample"
+        fn: Function to run on this thread
+        interval: Seconds between stack samples in sample mode
+
+    Returns:
+        The function's result and its profile
+    """
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Unknown profile mode: {mode}")
+
+    started = time.perf_counter()
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        result = profiler.runcall(fn, *args)
+        seconds = time.perf_counter() - started
+        profiler.create_stats()
+        # The format Profile.dump_stats writes
+        data = marshal.dumps(profiler.stats)
+    else:
+        with StackSampler(interval) as sampler:
+            result = fn(*args)
+        seconds = time.perf_counter() - started
+        data = sampler.folded()
+
+    return result, ParseProfile(mode, seconds, data)
+
+
+class ProfileStore:
+    """
+    Bounded directory of parse profiles and the uploads they came from.
+
+    Each capture is a JSON description ``<id>.json`` and its profile. Uploads
+    are stored once per content hash as ``input-<sha256>`` with the suffix of
+    their compression, and are left out beyond ``max_input_bytes``. The
+    oldest captures are dropped, along with uploads no capture refers to,
+    once there are more than ``max_captures`` or they take more than
+    ``max_bytes``.
+    """
+
+    def __init__(self, directory: str, max_captures: int = 32, max_bytes: int = 512 * 1024 * 1024,
+                 max_input_bytes: int = 64 * 1024 * 1024):
+        """
+        Args:
+            directory: Directory to keep captures in, created if missing
+            max_captures: Maximum number of captures kept
+            max_bytes: Maximum total size of captures and uploads
+            max_input_bytes: Largest upload retained with its capture
+        """
+        self.directory = directory
+        self.max_captures = max_captures
+        self.max_bytes = max_bytes
+        self.max_input_bytes = max_input_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def save(self, upload: Union[bytes, BinaryIO], profile: ParseProfile,
+             details: Optional[Mapping[str, Any]] = None) -> str:
+        """
+        Store a profile and the upload it was taken from.
+
+        Args:
+            upload: Raw upload content, or the upload's binary stream
+                positioned at its start
+            profile: Profile of the upload's parse
+            details: Further members for the capture description
+
+        Returns:
+            Capture id
+        """
+        content_hash, size, input_name = self._save_input(upload)
+
+        now = time.time()
+        capture_id = (time.strftime("%Y%m%dT%H%M%S", time.gmtime(now)) +
+                      f"{int(now % 1 * 1000000):06d}Z-{content_hash[:12]}")
+        profile_name = capture_id + PROFILE_SUFFIXES[profile.mode]
+        description = {
+            "id": capture_id,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(now)),
+            "mode": profile.mode,
+            "seconds": round(profile.seconds, 6),
+            "contentHash": content_hash,
+            "inputSize": size,
+            "input": input_name,
+            "profile": profile_name,
+            **(details or {})
+        }
+
+        with self._lock:
+            with open(os.path.join(self.directory, profile_name), "wb") as f:
+                f.write(profile.data)
+            with open(os.path.join(self.directory, capture_id + ".json"), "w", encoding="utf-8") as f:
+                json.dump(description, f, indent=2)
+            self._prune()
+
+        return capture_id
+
+    def captures(self) -> List[Dict[str, Any]]:
+        """Get the descriptions of the kept captures, newest first."""
+        found = []
+        with self._lock:
+            for name in sorted(os.listdir(self.directory), reverse=True):
+                if name.endswith(".json"):
+                    try:
+                        with open(os.path.join(self.directory, name), "r", encoding="utf-8") as f:
+                            found.append(json.load(f))
+                    except (OSError, ValueError):
+                        pass
+        return found
+
+    def _save_input(self, upload: Union[bytes, BinaryIO]) -> Tuple[str, int, Optional[str]]:
+        """
+        Hash an upload, keeping a copy unless it is too large or already kept.
+
+        Returns:
+            Content hash, size in bytes, and the kept file's name or None
+        """
+        if isinstance(upload, (bytes, bytearray)):
+            content_hash = hashlib.sha256(upload).hexdigest()
+            if len(upload) > self.max_input_bytes:
+                return content_hash, len(upload), None
+            name = "input-" + content_hash + INPUT_SUFFIXES[detect_compression(bytes(upload[:4]))]
+            path = os.path.join(self.directory, name)
+            if not os.path.exists(path):
+                self._write_atomic(path, upload)
+            return content_hash, len(upload), name
+
+        digest = hashlib.sha256()
+        size = 0
+        head = b""
+        with tempfile.NamedTemporaryFile(dir=self.directory, prefix=".input-", delete=False) as temp:
+            try:
+                while True:
+                    chunk = upload.read(COPY_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if not head:
+                        head = chunk[:4]
+                    digest.update(chunk)
+                    size += len(chunk)
+                    # Past the cap only the hash is still needed
+                    if size <= self.max_input_bytes:
+                        temp.write(chunk)
+            except BaseException:
+                temp.close()
+                os.remove(temp.name)
+                raise
+
+        content_hash = digest.hexdigest()
+        name = "input-" + content_hash + INPUT_SUFFIXES[detect_compression(head)]
+        path = os.path.join(self.directory, name)
+        if size > self.max_input_bytes or os.path.exists(path):
+            os.remove(temp.name)
+        else:
+            os.replace(temp.name, path)
+        return content_hash, size, name if size <= self.max_input_bytes else None
+
+    def _write_atomic(self, path: str, content: bytes) -> None:
+        with tempfile.NamedTemporaryFile(dir=self.directory, prefix=".input-", delete=False) as temp:
+            temp.write(content)
+        os.replace(temp.name, path)
+
+    def _prune(self) -> None:
+        """Drop the oldest captures beyond the limits; the lock must be held."""
+        sizes = {}
+        for name in os.listdir(self.directory):
+            if not name.startswith("."):
+                try:
+                    sizes[name] = os.path.getsize(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+        # Capture ids start with their creation time, so names sort oldest first
+        captures = sorted(name[:-len(".json")] for name in sizes if name.endswith(".json"))
+        inputs = {}
+        for capture_id in captures:
+            description = self._read_description(capture_id)
+            inputs[capture_id] = description.get("input") if description else None
+
+        def capture_files(capture_id: str) -> List[str]:
+            return [name for name in sizes if name.startswith(capture_id + ".")]
+
+        total = sum(sizes.values())
+        while captures and (len(captures) > self.max_captures or total > self.max_bytes):
+            oldest = captures.pop(0)
+            for name in capture_files(oldest):
+                total -= sizes.pop(name)
+                self._remove(name)
+            input_name = inputs.pop(oldest)
+            if input_name in sizes and input_name not in inputs.values():
+                total -= sizes.pop(input_name)
+                self._remove(input_name)
+
+    def _read_description(self, capture_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(os.path.join(self.directory, capture_id + ".json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _remove(self, name: str) -> None:
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except OSError:
+            pass
+
+
+class ParseProfiler:
+    """
+    Decides which parses to profile and keeps the profiles worth keeping.
+    """
+
+    def __init__(self, store: ProfileStore, threshold_seconds: Optional[float] = None,
+                 sample_interval: float = DEFAULT_SAMPLE_INTERVAL, header_secret: Optional[str] = None):
+        """
+        Args:
+            store: Where kept profiles and their uploads go
+            threshold_seconds: Sample every parse and keep those taking at
+                least this long, or None to profile requested parses only
+            sample_interval: Seconds between stack samples
+            header_secret: Secret a request must send in the
+                X-Workflow-Profile header to ask for a profile, or None to
+                ignore the header; requested profiles bypass the cache and
+                store the upload, so the header is not for anonymous clients
+        """
+        self.store = store
+        self.threshold_seconds = threshold_seconds
+        self.sample_interval = sample_interval
+        self.header_secret = header_secret or None
+        self.kept = 0
+
+    def requested_mode(self, header: Optional[str]) -> Optional[str]:
+        """
+        Get the profiler a request asks for.
+
+        Args:
+            header: Value of the X-Workflow-Profile header, if sent
+
+        Returns:
+            "cprofile", "sample", or None when the request does not ask or
+            does not send the secret
+        """
+        if self.header_secret is None or header is None:
+            return None
+        mode, separator, secret = header.strip().partition(":")
+        if not separator or mode.lower() not in PROFILE_MODES:
+            mode, secret = "cprofile", header.strip()
+        if not hmac.compare_digest(secret.encode(), self.header_secret.encode()):
+            return None
+        return mode.lower()
+
+    def mode(self, requested: Optional[str]) -> Optional[str]:
+        """Get the profiler to parse under, or None to parse unprofiled."""
+        if requested is not None:
+            return requested
+        return "sample" if self.threshold_seconds is not None else None
+
+    def keep(self, upload: Union[bytes, BinaryIO], parser: ServiceNowWorkflowParser,
+             profile: ParseProfile, requested: bool,
+             details: Optional[Mapping[str, Any]] = None) -> Optional[str]:
+        """
+        Store a profile when it was requested or the parse was slow.
+
+        Args:
+            upload: The parsed upload, as bytes or a stream at its start
+            parser: Parser holding the parse, for its stats
+            profile: Profile of the parse
+            requested: Whether the request asked for the profile
+            details: Further members for the capture description
+
+        Returns:
+            Capture id, or None when the profile was dropped
+        """
+        if not requested and profile.seconds < self.threshold_seconds:
+            return None
+
+        stats = parser.stats
+        capture_id = self.store.save(upload, profile, {
+            "trigger": "header" if requested else "threshold",
+            "thresholdSeconds": self.threshold_seconds,
+            "xmlBytes": stats.input_bytes,
+            "records": stats.records,
+            "phases": {phase: round(seconds, 6) for phase, seconds in stats.phases.items()},
+            **(details or {})
+        })
+        self.kept += 1
+        return capture_id
+
+    def profile_parse(self, parse: Callable[[Union[bytes, BinaryIO]], ServiceNowWorkflowParser],
+                      upload: Union[bytes, BinaryIO], requested_mode: Optional[str] = None,
+                      details: Optional[Mapping[str, Any]] = None) -> ServiceNowWorkflowParser:
+        """
+        Parse an upload in this thread, profiled as configured and requested.
+
+        Args:
+            parse: Function parsing the upload
+            upload: Raw upload content, or a seekable upload stream
+            requested_mode: Profiler the request asked for, if any
+            details: Further members for the capture description
+
+        Returns:
+            The parse function's parser
+        """
+        mode = self.mode(requested_mode)
+        if mode is None:
+            return parse(upload)
+
+        start = None if isinstance(upload, (bytes, bytearray)) else upload.tell()
+        parser, profile = profile_call(mode, parse, upload, interval=self.sample_interval)
+        if start is not None:
+            upload.seek(start)
+        self.keep(upload, parser, profile, requested_mode is not None, details)
+        return parser
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'thresholdSeconds': self.threshold_seconds,
+            'allowHeader': self.header_secret is not None,
+            'kept': self.kept
+        }
+
+
+def profiler_from_environ(environ: Mapping[str, str] = os.environ) -> Optional[ParseProfiler]:
+    """
+    Configure parse profiling from environment variables.
+
+    WORKFLOW_PROFILE_DIR enables profiling and names the store directory.
+    WORKFLOW_PROFILE_THRESHOLD sets the latency threshold in seconds, and
+    WORKFLOW_PROFILE_SECRET the secret requests must send in the header to
+    ask for a profile; without it the header is ignored.
+
+    Returns:
+        Profiler, or None when profiling is not enabled
+    """
+    directory = environ.get("WORKFLOW_PROFILE_DIR")
+    if not directory:
+        return None
+    threshold = environ.get("WORKFLOW_PROFILE_THRESHOLD")
+    return ParseProfiler(
+        ProfileStore(directory),
+        threshold_seconds=float(threshold) if threshold else None,
+        header_secret=environ.get("WORKFLOW_PROFILE_SECRET")
+    )
@@ -0,0 +1,222 @@
+"""
+Paging, filtering and field projection for the workflow record endpoints.
+
+Queries select activities through the graph indexes: by stage, by activity
+definition, or all of them, in node order. A page is then a slice of that
+node list, so only the records on the page are looked at and serialized.
+Conditions and transitions of a page are those of its activities, dangling
+transitions included. Conditions and transitions whose activity does not
+resolve belong to no activity; they come with the first page of a query
+without filters, so its pages together hold every record.
+"""
+
+import base64
+import bisect
+import dataclasses
+from dataclasses import dataclass
+from itertools import chain
+from typing import Dict, List, Any, Iterable, Mapping, Optional, Sequence
+
+from servicenow_workflow_parser import (
+    ServiceNowWorkflowParser,
+    WorkflowActivity,
+    WorkflowCondition,
+    WorkflowGraph,
+    WorkflowStage,
+    WorkflowTransition,
+)
+
+
+# Field names a projection may use, across all record types
+RECORD_FIELDS = frozenset(
+    f.name
+    for model in (WorkflowStage, WorkflowActivity, WorkflowCondition, WorkflowTransition)
+    for f in dataclasses.fields(model)
+)
+
+_CURSOR_PREFIX = "n:"
+
+
+class QueryError(ValueError):
+    """Raised for query parameters that are not valid."""
+
+
+def split_fields(value: Optional[str]) -> Optional[List[str]]:
+    """Split a comma-separated field list, or return None when not given."""
+    if value is None:
+        return None
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+@dataclass
+class RecordQuery:
+    """Which activities to return and which fields of each record."""
+    offset: int = 0
+    limit: Optional[int] = None
+    cursor: Optional[str] = None
+    fields: Optional[List[str]] = None
+    stage: Optional[str] = None
+    activity_definition: Optional[str] = None
+
+    def __post_init__(self):
+        if self.offset < 0:
+            raise QueryError("offset must not be negative")
+        if self.limit is not None and self.limit < 1:
+            raise QueryError("limit must be at least 1")
+        if self.cursor and self.offset:
+            raise QueryError("Use either offset or cursor, not both")
+        if self.fields is not None:
+            unknown = [name for name in self.fields if name not in RECORD_FIELDS]
+            if unknown:
+                raise QueryError(f"Unknown fields: {', '.join(unknown)}")
+
+    @classmethod
+    def from_params(cls, params: Mapping[str, str]) -> "RecordQuery":
+        """
+        Build a query from request query parameters.
+
+        Args:
+            params: offset, limit, cursor, fields (comma-separated), stage
+                and activity_definition, all optional
+
+        Raises:
+            QueryError: If a parameter is not valid
+        """
+        def integer(name: str) -> Optional[int]:
+            value = params.get(name)
+            if value in (None, ""):
+                return None
+            try:
+                return int(value)
+            except ValueError:
+                raise QueryError(f"{name} must be an integer") from None
+
+        return cls(
+            offset=integer("offset") or 0,
+            limit=integer("limit"),
+            cursor=params.get("cursor") or None,
+            fields=split_fields(params.get("fields")),
+            stage=params.get("stage"),
+            activity_definition=params.get("activity_definition")
+        )
+
+    @property
+    def selects_all(self) -> bool:
+        """Whether the query returns every record, possibly projected."""
+        return (self.offset == 0 and self.limit is None and not self.cursor and
+                self.stage is None and self.activity_definition is None)
+
+
+def encode_cursor(node: int) -> str:
+    """Encode the position after a node as an opaque cursor."""
+    return base64.urlsafe_b64encode(f"{_CURSOR_PREFIX}{node}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    """Decode a cursor into the node it continues after."""
+    try:
+        text = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        if text.startswith(_CURSOR_PREFIX):
+            return int(text[len(_CURSOR_PREFIX):])
+    except ValueError:
+        pass
+    raise QueryError("Invalid cursor")
+
+
+def _matching_nodes(graph: WorkflowGraph, query: RecordQuery) -> Sequence[int]:
+    """Nodes passing the query's filters, in node order."""
+    candidates = []
+    if query.stage is not None:
+        candidates.append(graph.stage_members.get(query.stage, []))
+    if query.activity_definition is not None:
+        candidates.append(graph.get_definition_members().get(query.activity_definition, []))
+
+    if not candidates:
+        return range(len(graph))
+    if len(candidates) == 1:
+        return candidates[0]
+
+    smaller, larger = sorted(candidates, key=len)
+    other = set(larger)
+    return [node for node in smaller if node in other]
+
+
+@dataclass
+class QueryResult:
+    """The page of a workflow selected by a query."""
+    query: RecordQuery
+    nodes: Sequence[int]
+    total: int
+    next_cursor: Optional[str]
+    values: Dict[str, Any]
+
+    def paging(self) -> Dict[str, Any]:
+        """Response members describing the page, empty when nothing was left out."""
+        if self.query.selects_all:
+            return {}
+        return {
+            "total": self.total,
+            "offset": self.query.offset,
+            "limit": self.query.limit,
+            "nextCursor": self.next_cursor
+        }
+
+
+def run_query(
+    parser: ServiceNowWorkflowParser,
+    query: RecordQuery,
+    sections: Iterable[str] = ("activities",)
+) -> QueryResult:
+    """
+    Select the page of a workflow described by a query.
+
+    Args:
+        parser: Initialized workflow parser with data
+        query: Filters, paging and projection
+        sections: Sections whose page models are needed: activities,
+            conditions and transitions; other sections are not paged
+
+    Returns:
+        The page, with models to pass to the serializer as ``values``
+    """
+    graph = parser.get_graph()
+    matching = _matching_nodes(graph, query)
+    total = len(matching)
+
+    if query.selects_all:
+        return QueryResult(query, matching, total, None, {})
+
+    start = query.offset
+    if query.cursor:
+        start = bisect.bisect_right(matching, decode_cursor(query.cursor))
+    end = total if query.limit is None else min(total, start + query.limit)
+    nodes = matching[start:end]
+    next_cursor = encode_cursor(nodes[-1]) if nodes and end < total else None
+
+    # Records without a resolvable activity go with the first unfiltered page
+    unattached = (start == 0 and not query.cursor and
+                  query.stage is None and query.activity_definition is None)
+
+    values: Dict[str, Any] = {}
+    sections = set(sections)
+    if "activities" in sections:
+        values["activities"] = {graph.node_ids[node]: graph.activities[node] for node in nodes}
+    if "conditions" in sections:
+        node_conditions = graph.get_node_conditions()
+        values["conditions"] = {
+            condition.id: condition for node in nodes for condition in node_conditions.get(node, ())
+        }
+        if unattached:
+            values["conditions"].update((condition.id, condition) for condition in graph.get_unattached_conditions())
+    if "transitions" in sections:
+        node_dangling = graph.get_node_dangling()
+        groups: Dict[str, List[WorkflowTransition]] = {}
+        for node in nodes:
+            for transition in chain(graph.out_transitions[node], node_dangling.get(node, ())):
+                groups.setdefault(transition.from_activity_id, []).append(transition)
+        if unattached:
+            for transition in graph.get_unattached_dangling():
+                groups.setdefault(transition.from_activity_id, []).append(transition)
+        values["transitions"] = groups
+
+    return QueryResult(query, nodes, total, next_cursor, values)
@@ -0,0 +1,219 @@
+import dataclasses
+import json
+from collections.abc import Mapping
+from typing import Callable, Dict, List, Any, BinaryIO, Iterable, Iterator, Optional, Sequence
+
+from servicenow_workflow_parser import ServiceNowWorkflowParser
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Sections of the details response, in output order
+DETAIL_SECTIONS = ("version", "activities", "stages", "conditions", "transitions")
+
+# Serialized output is handed out in chunks of about this size
+CHUNK_SIZE = 64 * 1024
+
+
+def record_to_dict(record: Any) -> Dict[str, Any]:
+    """
+    Convert a workflow model to a dict of its fields.
+
+    Works for the regular and the slotted compact models alike.
+    """
+    if record is None:
+        return None
+    return {f.name: getattr(record, f.name) for f in dataclasses.fields(record)}
+
+
+def _make_encoder(indent: Optional[int], backend: str):
+    """
+    Build a function encoding one value as JSON bytes.
+
+    The returned function takes the value and its nesting level; continuation
+    lines of indented output are padded to that level.
+    """
+    use_orjson = orjson is not None and backend != "json" and indent in (None, 2)
+    if backend == "orjson" and orjson is None:
+        raise ValueError("orjson backend requested but orjson is not installed")
+
+    if use_orjson:
+        option = orjson.OPT_INDENT_2 if indent else 0
+
+        def encode(value: Any, level: int) -> bytes:
+            data = orjson.dumps(value, option=option)
+            if indent and level:
+                data = data.replace(b"\n", b"\n" + b" " * (indent * level))
+            return data
+    else:
+        separators = (",", ": ") if indent else (",", ":")
+
+        def encode(value: Any, level: int) -> bytes:
+            text = json.dumps(value, indent=indent, separators=separators, default=record_to_dict)
+            if indent and level:
+                text = text.replace("\n", "\n" + " " * (indent * level))
+            return text.encode("utf-8")
+
+    return encode
+
+
+def _make_projection(fields: Sequence[str]) -> Callable[[Any], Any]:
+    """
+    Build a function reducing a record, or a list of records, to the given fields.
+
+    Fields a record type does not have are left out for that type.
+    """
+    names_by_type: Dict[type, List[str]] = {}
+
+    def project(record: Any) -> Any:
+        if isinstance(record, list):
+            return [project(item) for item in record]
+        names = names_by_type.get(type(record))
+        if names is None:
+            own = {f.name for f in dataclasses.fields(record)}
+            names = names_by_type[type(record)] = [name for name in fields if name in own]
+        return {name: getattr(record, name) for name in names}
+
+    return project
+
+
+def _section_value(parser: ServiceNowWorkflowParser, section: str) -> Any:
+    """Get the model behind a section name."""
+    if section == "version":
+        return parser.get_workflow_version()
+    if section == "activities":
+        return parser.get_activities()
+    if section == "stages":
+        return parser.get_stages()
+    if section == "conditions":
+        return parser.get_conditions()
+    if section == "transitions":
+        return parser.get_transitions()
+    if section == "summary":
+        return parser.get_workflow_summary()
+    raise ValueError(f"Unknown section: {section}")
+
+
+def _iter_chunks(parts: Iterable[bytes]) -> Iterator[bytes]:
+    """Coalesce small output parts into chunks of about CHUNK_SIZE bytes."""
+    buffer: List[bytes] = []
+    size = 0
+    for part in parts:
+        buffer.append(part)
+        size += len(part)
+        if size >= CHUNK_SIZE:
+            yield b"".join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def iter_workflow_json(
+    parser: ServiceNowWorkflowParser,
+    sections: Iterable[str] = DETAIL_SECTIONS,
+    indent: Optional[int] = None,
+    extra: Optional[Dict[str, Any]] = None,
+    keys: Optional[Dict[str, str]] = None,
+    backend: str = "auto",
+    values: Optional[Dict[str, Any]] = None,
+    fields: Optional[Sequence[str]] = None
+) -> Iterator[bytes]:
+    """
+    Serialize a parsed workflow as one JSON object, incrementally.
+
+    Records are encoded one at a time straight from the models, so memory
+    stays bounded by a single chunk rather than a copy of the workflow.
+
+    Args:
+        parser: Initialized workflow parser with data
+        sections: Sections to include: version, activities, stages,
+            conditions, transitions and summary
+        indent: Indentation width, or None for compact output
+        extra: Members written before the sections, such as a success flag
+        keys: Output key for a section when it differs from its name
+        backend: "orjson", "json", or "auto" to use orjson when installed
+        values: Models to write for some sections instead of the parser's,
+            such as one page of activities
+        fields: Write only these fields of the records in mapping sections
+
+    Yields:
+        Chunks of UTF-8 encoded JSON
+    """
+    return _iter_chunks(_iter_workflow_parts(
+        parser, sections, indent, extra, keys or {}, backend, values or {},
+        _make_projection(fields) if fields else None
+    ))
+
+
+def _iter_workflow_parts(
+    parser: ServiceNowWorkflowParser,
+    sections: Iterable[str],
+    indent: Optional[int],
+    extra: Optional[Dict[str, Any]],
+    keys: Dict[str, str],
+    backend: str,
+    values: Dict[str, Any],
+    project: Optional[Callable[[Any], Any]]
+) -> Iterator[bytes]:
+    """Yield the small output parts that make up the JSON object."""
+    encode = _make_encoder(indent, backend)
+    newline = b"\n" if indent else b""
+    colon = b": " if indent else b":"
+
+    def pad(level: int) -> bytes:
+        return b" " * (indent * level) if indent else b""
+
+    members = list((extra or {}).items()) + [(keys.get(s, s), s) for s in sections]
+    extra_count = len(extra or {})
+
+    yield b"{"
+    for position, (key, value) in enumerate(members):
+        yield (b"," if position else b"") + newline + pad(1) + encode(key, 0) + colon
+
+        if position < extra_count:
+            yield encode(value, 1)
+            continue
+
+        model = values[value] if value in values else _section_value(parser, value)
+        if not isinstance(model, Mapping):
+            yield encode(model, 1)
+            continue
+
+        # Mappings of records are streamed entry by entry
+        if not model:
+            yield b"{}"
+            continue
+
+        yield b"{"
+        for entry, (record_key, record) in enumerate(model.items()):
+            if project is not None:
+                record = project(record)
+            yield ((b"," if entry else b"") + newline + pad(2) + encode(record_key, 0) + colon +
+                   encode(record, 2))
+        yield newline + pad(1) + b"}"
+
+    yield newline + b"}"
+
+
+def write_workflow_json(
+    parser: ServiceNowWorkflowParser,
+    fp: BinaryIO,
+    sections: Iterable[str] = DETAIL_SECTIONS,
+    indent: Optional[int] = None,
+    extra: Optional[Dict[str, Any]] = None,
+    keys: Optional[Dict[str, str]] = None,
+    backend: str = "auto",
+    values: Optional[Dict[str, Any]] = None,
+    fields: Optional[Sequence[str]] = None
+) -> None:
+    """
+    Write a parsed workflow as JSON to a binary file object.
+
+    Takes the same arguments as iter_workflow_json.
+    """
+    for chunk in iter_workflow_json(parser, sections, indent, extra, keys, backend, values, fields):
+        fp.write(chunk)
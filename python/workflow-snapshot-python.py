@@ -0,0 +1,484 @@
+#!/usr/bin/env python3
+"""
+ServiceNow Workflow Snapshots
+
+A compact binary form of a parsed workflow that opens without parsing XML.
+
+A snapshot holds a string table, fixed-width record arrays of string
+indexes for each record type and the resolved adjacency of the workflow
+graph. Files are memory-mapped on open and records are only built when
+they are first read, so opening a snapshot costs the same for a workflow
+of ten activities or ten thousand.
+
+Layout, all integers unsigned little-endian:
+
+    header      magic "SNWF", format version (u32), flags (u32)
+    sections    (offset u64, item count u64) for each entry of SECTIONS
+    data        each section starts at an 8-byte boundary
+
+Every record section is a row-major u32 array with one string index per
+field, in the order given by the *_FIELDS tuples below.
+"""
+
+import argparse
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections.abc import Sequence
+from typing import Dict, List, Any, Callable, Optional, Union
+
+from servicenow_workflow_parser import (
+    LazyList,
+    LazyRecordMap,
+    ServiceNowWorkflowParser,
+    WorkflowGraph,
+    WorkflowVersion,
+    parse_workflow_file,
+)
+
+
+MAGIC = b"SNWF"
+FORMAT_VERSION = 1
+
+# Set when the snapshot was written from compact models
+FLAG_COMPACT = 1
+
+HEADER = struct.Struct("<4sII")
+SECTION = struct.Struct("<QQ")
+
+SECTIONS = (
+    "string_offsets",     # u32 per string plus one end offset
+    "string_data",        # UTF-8 bytes
+    "version",            # rows of VERSION_FIELDS, zero or one
+    "stages",             # rows of STAGE_FIELDS
+    "activities",         # rows of ACTIVITY_FIELDS, in graph node order
+    "conditions",         # rows of CONDITION_FIELDS
+    "transitions",        # rows of TRANSITION_FIELDS, grouped by source
+    "transition_groups",  # rows of (key, first transition, transition count)
+    "adjacency_offsets",  # u32 per node plus one end offset into adjacency_edges
+    "adjacency_edges",    # rows of (target node, transition)
+    "dangling",           # transitions with an endpoint that does not resolve
+)
+
+VERSION_FIELDS = ("id", "name", "table", "active", "description", "start_activity_id")
+STAGE_FIELDS = ("id", "name", "value", "order")
+ACTIVITY_FIELDS = ("id", "name", "activity_definition", "stage_id", "x", "y")
+CONDITION_FIELDS = ("id", "name", "activity_id", "condition", "order")
+TRANSITION_FIELDS = ("id", "condition_id", "from_activity_id", "to_activity_id")
+
+# Widths of the sections that are not plain string or record arrays
+_SECTION_WIDTHS = {
+    "string_offsets": 1,
+    "version": len(VERSION_FIELDS),
+    "stages": len(STAGE_FIELDS),
+    "activities": len(ACTIVITY_FIELDS),
+    "conditions": len(CONDITION_FIELDS),
+    "transitions": len(TRANSITION_FIELDS),
+    "transition_groups": 3,
+    "adjacency_offsets": 1,
+    "adjacency_edges": 2,
+    "dangling": 1,
+}
+
+_ALIGNMENT = 8
+
+
+class SnapshotError(ValueError):
+    """Raised when a file is not a readable workflow snapshot."""
+
+
+def _u32_array() -> array:
+    """Create an empty array of unsigned 32-bit integers."""
+    for typecode in ("I", "L"):
+        if array(typecode).itemsize == 4:
+            return array(typecode)
+    raise RuntimeError("No 32-bit array type on this platform")
+
+
+class _StringTable:
+    """De-duplicating string table built while writing a snapshot."""
+
+    def __init__(self):
+        self.index: Dict[str, int] = {"": 0}
+        self.strings: List[str] = [""]
+
+    def add(self, value: Any) -> int:
+        text = value if isinstance(value, str) else str(value)
+        position = self.index.get(text)
+        if position is None:
+            position = self.index[text] = len(self.strings)
+            self.strings.append(text)
+        return position
+
+    def add_row(self, rows: array, record: Any, fields) -> None:
+        for name in fields:
+            rows.append(self.add(getattr(record, name)))
+
+
+def write_snapshot(parser: ServiceNowWorkflowParser, path: str) -> int:
+    """
+    Write a parsed workflow as a snapshot file.
+
+    The file is written next to its destination and moved into place, so
+    readers never see a partial snapshot.
+
+    Args:
+        parser: Initialized workflow parser with data
+        path: Destination file path
+
+    Returns:
+        Size of the snapshot in bytes
+    """
+    graph = parser.get_graph()
+    strings = _StringTable()
+    sections = {name: _u32_array() for name in SECTIONS if name != "string_data"}
+
+    version = parser.get_workflow_version()
+    if version is not None:
+        for name in VERSION_FIELDS:
+            value = getattr(version, name)
+            if name == "active":
+                value = "true" if value else "false"
+            sections["version"].append(strings.add(value))
+
+    # Rows of a lazy parse are written as they are; no model is built
+    rows = parser.get_record_rows()
+
+    for stage in rows.stages:
+        strings.add_row(sections["stages"], stage, STAGE_FIELDS)
+
+    for activity in rows.activities:
+        strings.add_row(sections["activities"], activity, ACTIVITY_FIELDS)
+
+    for condition in rows.conditions:
+        strings.add_row(sections["conditions"], condition, CONDITION_FIELDS)
+
+    first = 0
+    for key, count in rows.transition_groups:
+        sections["transition_groups"].extend((strings.add(key), first, count))
+        first += count
+    for transition in rows.transitions:
+        strings.add_row(sections["transitions"], transition, TRANSITION_FIELDS)
+
+    edges = sections["adjacency_edges"]
+    for node in range(len(graph)):
+        sections["adjacency_offsets"].append(len(edges) // 2)
+        for target, transition in zip(graph.successors[node], rows.out_transitions[node]):
+            edges.extend((target, transition))
+    sections["adjacency_offsets"].append(len(edges) // 2)
+
+    sections["dangling"].extend(rows.dangling)
+
+    string_data = bytearray()
+    for text in strings.strings:
+        sections["string_offsets"].append(len(string_data))
+        string_data += text.encode("utf-8")
+    sections["string_offsets"].append(len(string_data))
+
+    flags = FLAG_COMPACT if parser.compact else 0
+    offset = HEADER.size + SECTION.size * len(SECTIONS)
+    table = []
+    payloads = []
+    for name in SECTIONS:
+        offset += -offset % _ALIGNMENT
+        if name == "string_data":
+            payload = bytes(string_data)
+            count = len(payload)
+        else:
+            data = sections[name]
+            if sys.byteorder != "little":
+                data.byteswap()
+            payload = data.tobytes()
+            count = len(data) // _SECTION_WIDTHS[name]
+        table.append(SECTION.pack(offset, count))
+        payloads.append((offset, payload))
+        offset += len(payload)
+
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "wb") as file:
+            file.write(HEADER.pack(MAGIC, FORMAT_VERSION, flags))
+            file.write(b"".join(table))
+            for position, payload in payloads:
+                file.write(b"\0" * (position - file.tell()))
+                file.write(payload)
+            size = file.tell()
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    return size
+
+
+class _Column(Sequence):
+    """One field of a record section, decoded from the string table on access."""
+
+    def __init__(self, snapshot: "WorkflowSnapshot", rows, width: int, field: int):
+        self._snapshot = snapshot
+        self._rows = rows
+        self._width = width
+        self._field = field
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[position] for position in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        return self._snapshot._string(self._rows[index * self._width + self._field])
+
+    def __len__(self) -> int:
+        return len(self._rows) // self._width
+
+
+class WorkflowSnapshot(ServiceNowWorkflowParser):
+    """
+    A parsed workflow loaded from a snapshot.
+
+    Works wherever a parser is expected. Record mappings are lazy: their
+    keys and records are decoded from the mapped file when first read, and
+    the graph index is rebuilt from the stored adjacency without resolving
+    any references. Snapshots are read-only.
+    """
+
+    def __init__(self, buffer, on_close: Optional[Callable[[], None]] = None):
+        """
+        Args:
+            buffer: Snapshot contents, such as a memory map
+            on_close: Called by close() once the views on buffer are released
+        """
+        self._views = []
+        self._on_close = on_close
+
+        data = memoryview(buffer)
+        self._views.append(data)
+        if len(data) < HEADER.size + SECTION.size * len(SECTIONS):
+            raise SnapshotError("File is too short to be a workflow snapshot")
+
+        magic, version, flags = HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise SnapshotError("File is not a workflow snapshot")
+        if version != FORMAT_VERSION:
+            raise SnapshotError(f"Unsupported snapshot format version: {version}")
+
+        super().__init__(compact=bool(flags & FLAG_COMPACT))
+
+        sections = {}
+        for position, name in enumerate(SECTIONS):
+            offset, count = SECTION.unpack_from(data, HEADER.size + SECTION.size * position)
+            if name == "string_data":
+                size = count
+            else:
+                size = count * _SECTION_WIDTHS[name] * 4
+            if offset + size > len(data):
+                raise SnapshotError(f"Snapshot section {name} is truncated")
+            view = data[offset:offset + size]
+            self._views.append(view)
+            sections[name] = view if name == "string_data" else self._u32(view)
+            self._views.append(sections[name])
+
+        self._string_offsets = sections["string_offsets"]
+        self._string_data = sections["string_data"]
+        self._strings: List[Optional[str]] = [None] * (len(self._string_offsets) - 1)
+        self._sections = sections
+
+        transitions = sections["transitions"]
+        self._transition_list = LazyList(
+            len(transitions) // len(TRANSITION_FIELDS),
+            lambda position: self._build(self._transition_model, transitions, TRANSITION_FIELDS, position)
+        )
+
+        self.stages = self._record_map(self._stage_model, "stages", STAGE_FIELDS)
+        self.activities = self._record_map(self._activity_model, "activities", ACTIVITY_FIELDS)
+        self.conditions = self._record_map(self._condition_model, "conditions", CONDITION_FIELDS)
+
+        groups = sections["transition_groups"]
+        self.transitions = LazyRecordMap(
+            _Column(self, groups, 3, 0),
+            lambda position: [self._transition_list[t] for t in
+                              range(groups[position * 3 + 1], groups[position * 3 + 1] + groups[position * 3 + 2])]
+        )
+
+        if len(sections["version"]):
+            values = dict(zip(VERSION_FIELDS, (self._string(index) for index in sections["version"])))
+            values["active"] = values["active"] == "true"
+            self.workflow_version = WorkflowVersion(**values)
+        self._version_parsed = True
+
+    @staticmethod
+    def _u32(view: memoryview):
+        """View little-endian bytes as u32 values, copying only on big-endian hosts."""
+        if sys.byteorder == "little":
+            return view.cast(_u32_array().typecode)
+        values = _u32_array()
+        values.frombytes(view)
+        values.byteswap()
+        return values
+
+    def _string(self, index: int) -> str:
+        """Decode a string table entry once."""
+        text = self._strings[index]
+        if text is None:
+            start = self._string_offsets[index]
+            end = self._string_offsets[index + 1]
+            text = self._strings[index] = str(self._string_data[start:end], "utf-8")
+        return text
+
+    def _build(self, model, rows, fields, position: int) -> Any:
+        """Build the model for one row of a record section."""
+        base = position * len(fields)
+        return model(**{name: self._string(rows[base + offset]) for offset, name in enumerate(fields)})
+
+    def _record_map(self, model, section: str, fields) -> LazyRecordMap:
+        """Lazy mapping of a record section keyed by sys_id."""
+        rows = self._sections[section]
+        return LazyRecordMap(
+            _Column(self, rows, len(fields), 0),
+            lambda position: self._build(model, rows, fields, position)
+        )
+
+    def parse(self, xml_content) -> None:
+        raise TypeError("Workflow snapshots are read-only")
+
+    def parse_stream(self, source) -> None:
+        raise TypeError("Workflow snapshots are read-only")
+
+    def get_graph(self) -> WorkflowGraph:
+        """Get the graph index, built from the stored adjacency on first use."""
+        if self._graph is None:
+            width = len(ACTIVITY_FIELDS)
+            rows = self._sections["activities"]
+            offsets = self._sections["adjacency_offsets"]
+            edges = self._sections["adjacency_edges"]
+            node_count = len(self.activities)
+
+            successors = [edges[2 * offsets[node]:2 * offsets[node + 1]:2].tolist() for node in range(node_count)]
+            out_transitions = LazyList(
+                node_count,
+                lambda node: [self._transition_list[t] for t in edges[2 * offsets[node] + 1:2 * offsets[node + 1]:2]]
+            )
+
+            self._graph = WorkflowGraph.from_adjacency(
+                list(_Column(self, rows, width, 0)),
+                list(_Column(self, rows, width, 1)),
+                list(_Column(self, rows, width, 3)),
+                LazyList(node_count, self.activities.at),
+                successors,
+                out_transitions,
+                [self._transition_list[t] for t in self._sections["dangling"]],
+                self.conditions,
+                self.workflow_version.start_activity_id if self.workflow_version else ""
+            )
+        return self._graph
+
+    def close(self) -> None:
+        """Release the mapped file. Records already read stay usable."""
+        for view in reversed(self._views):
+            if isinstance(view, memoryview):
+                view.release()
+        self._views = []
+        if self._on_close is not None:
+            self._on_close()
+            self._on_close = None
+
+    def __enter__(self) -> "WorkflowSnapshot":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def open_snapshot(path: str) -> WorkflowSnapshot:
+    """
+    Open a snapshot file by memory-mapping it.
+
+    Args:
+        path: Path to the snapshot
+
+    Returns:
+        Snapshot usable as a parser; close it to release the file
+    """
+    with open(path, "rb") as file:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        return WorkflowSnapshot(mapped, on_close=mapped.close)
+    except BaseException:
+        mapped.close()
+        raise
+
+
+def is_snapshot(path: str) -> bool:
+    """Check whether a file starts with the snapshot magic bytes."""
+    with open(path, "rb") as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def load_workflow(path: str, lazy: bool = False) -> Union[ServiceNowWorkflowParser, WorkflowSnapshot]:
+    """
+    Load a workflow from either a snapshot or an XML export.
+
+    Args:
+        path: Path to a snapshot or XML file
+        lazy: Parse XML exports in lazy mode; snapshots are always lazy
+
+    Returns:
+        Snapshot or initialized parser with parsed workflow data
+    """
+    if is_snapshot(path):
+        return open_snapshot(path)
+    return parse_workflow_file(path, lazy=lazy)
+
+
+def main() -> int:
+    """Convert XML exports to snapshots."""
+    parser = argparse.ArgumentParser(
+        description="Convert ServiceNow workflow XML exports to binary snapshots"
+    )
+
+    parser.add_argument(
+        "files",
+        nargs="+",
+        help="Paths to ServiceNow workflow XML files"
+    )
+
+    parser.add_argument(
+        "--output-dir",
+        metavar="DIR",
+        help="Directory for the snapshots (default: next to each export)"
+    )
+
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Load snapshots as compact models with numeric coordinates and order"
+    )
+
+    args = parser.parse_args()
+    failed = False
+
+    for file_path in args.files:
+        # w.xml.gz becomes w.snap like w.xml does
+        base = os.path.basename(file_path)
+        if base.lower().endswith((".gz", ".zst")):
+            base = os.path.splitext(base)[0]
+        base = os.path.splitext(base)[0] + ".snap"
+        target = os.path.join(args.output_dir or os.path.dirname(file_path), base)
+        try:
+            workflow = ServiceNowWorkflowParser(compact=args.compact)
+            with open(file_path, "rb") as file:
+                workflow.parse_stream(file)
+            size = write_snapshot(workflow, target)
+        except Exception as e:
+            failed = True
+            print(f"{file_path}: error: {e}", file=sys.stderr)
+            continue
+        print(f"{file_path} -> {target} ({size} bytes)")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,298 @@
+"""
+Spatial index over a workflow layout, for viewport queries.
+
+A uniform grid covers the layout's bounds. Each cell lists the activities
+whose box overlaps it and the transitions with a route segment crossing it,
+so a viewport query only looks at the cells under the viewport and then
+tests the few candidates exactly. Panning a large workflow costs in
+proportion to what is on screen, not to the size of the workflow.
+
+When zoomed out too far to tell activities apart, viewport queries return
+one box per stage and the transitions between stages instead.
+"""
+
+import math
+import threading
+import weakref
+from dataclasses import dataclass
+from typing import Dict, List, Any, Optional, Sequence, Tuple
+
+from servicenow_workflow_parser import ServiceNowWorkflowParser, WorkflowGraph
+from workflow_layout import Box, LayoutQuery, WorkflowLayout, get_layout, layout_payload
+
+
+# Average number of activities per grid cell the cell size aims for
+CELL_OCCUPANCY = 4
+
+# Below this zoom, in screen pixels per layout unit, stages are returned
+# instead of activities; a 160 unit wide activity is then under 40 pixels
+DETAIL_ZOOM = 0.25
+
+# Id of the aggregate holding the activities without a stage
+NO_STAGE = ""
+
+
+@dataclass
+class StageAggregate:
+    """Activities of one stage drawn as a single box when zoomed out."""
+    id: str
+    name: str
+    box: Box
+    activity_count: int
+
+
+def _segment_hits_box(x0: float, y0: float, x1: float, y1: float, box: Box) -> bool:
+    """Test whether a line segment intersects a rectangle, by clipping it (Liang-Barsky)."""
+    min_x, min_y, max_x, max_y = box
+    dx, dy = x1 - x0, y1 - y0
+    low, high = 0.0, 1.0
+    for p, q in ((-dx, x0 - min_x), (dx, max_x - x0), (-dy, y0 - min_y), (dy, max_y - y0)):
+        if p == 0:
+            if q < 0:
+                return False
+        else:
+            t = q / p
+            if p < 0:
+                low = max(low, t)
+            else:
+                high = min(high, t)
+            if low > high:
+                return False
+    return True
+
+
+class SpatialIndex:
+    """
+    Grid over the activities and transition routes of a layout.
+
+    Cells are square and keyed by row * columns + column; empty cells are
+    not stored.
+    """
+
+    def __init__(self, graph: WorkflowGraph, layout: WorkflowLayout, stage_names: Optional[Dict[str, str]] = None):
+        """
+        Args:
+            graph: Graph index the layout was computed for
+            layout: Layout to index
+            stage_names: Stage names by stage reference, for the aggregates
+        """
+        self.layout = layout
+        min_x, min_y, max_x, max_y = layout.bounds
+        width, height = max(max_x - min_x, 1.0), max(max_y - min_y, 1.0)
+
+        # Big enough to hold a few activities, and never smaller than one
+        self.cell_size = max(
+            layout.node_width, layout.node_height,
+            math.sqrt(width * height * CELL_OCCUPANCY / max(len(graph), 1))
+        )
+        self.origin = (min_x, min_y)
+        self.columns = int(width // self.cell_size) + 1
+        self.rows = int(height // self.cell_size) + 1
+
+        self.node_cells: Dict[int, List[int]] = {}
+        self.edge_cells: Dict[int, List[int]] = {}
+        for node in range(len(graph)):
+            for cell in self._box_cells(layout.node_box(node)):
+                self.node_cells.setdefault(cell, []).append(node)
+        for edge, route in enumerate(layout.edge_points):
+            for index in range(0, len(route) - 2, 2):
+                for cell in self._segment_cells(route[index], route[index + 1], route[index + 2], route[index + 3]):
+                    members = self.edge_cells.setdefault(cell, [])
+                    # Consecutive segments of a route often share a cell
+                    if not members or members[-1] != edge:
+                        members.append(edge)
+
+        self.stages, self.stage_links = self._aggregate_stages(graph, stage_names or {})
+
+    def _column(self, x: float) -> int:
+        return min(max(int((x - self.origin[0]) // self.cell_size), 0), self.columns - 1)
+
+    def _row(self, y: float) -> int:
+        return min(max(int((y - self.origin[1]) // self.cell_size), 0), self.rows - 1)
+
+    def _box_cells(self, box: Box) -> List[int]:
+        """Get the cells a rectangle overlaps."""
+        first_column, last_column = self._column(box[0]), self._column(box[2])
+        return [row * self.columns + column
+                for row in range(self._row(box[1]), self._row(box[3]) + 1)
+                for column in range(first_column, last_column + 1)]
+
+    def _segment_cells(self, x0: float, y0: float, x1: float, y1: float) -> List[int]:
+        """Get the cells a line segment crosses, one column at a time."""
+        if x0 > x1:
+            x0, y0, x1, y1 = x1, y1, x0, y0
+        origin_x, origin_y = self.origin
+        size, columns, last_row = self.cell_size, self.columns, self.rows - 1
+        first_column, last_column = self._column(x0), self._column(x1)
+        slope = (y1 - y0) / (x1 - x0) if first_column != last_column else 0.0
+
+        cells = []
+        for column in range(first_column, last_column + 1):
+            if first_column == last_column:
+                y_low, y_high = min(y0, y1), max(y0, y1)
+            else:
+                left = max(x0, origin_x + column * size)
+                right = min(x1, origin_x + (column + 1) * size)
+                y_low, y_high = sorted((y0 + (left - x0) * slope, y0 + (right - x0) * slope))
+            first_row = min(max(int((y_low - origin_y) // size), 0), last_row)
+            last_row_crossed = min(max(int((y_high - origin_y) // size), 0), last_row)
+            cells.extend(row * columns + column for row in range(first_row, last_row_crossed + 1))
+        return cells
+
+    def _aggregate_stages(self, graph: WorkflowGraph,
+                          stage_names: Dict[str, str]) -> Tuple[List[StageAggregate], Dict[Tuple[int, int], int]]:
+        """
+        Box the activities of each stage and count the transitions between stages.
+
+        Returns:
+            Stage aggregates, and transition counts keyed by source and
+            target aggregate
+        """
+        layout = self.layout
+        stage_of = [-1] * len(graph)
+        groups = list(graph.stage_members.items())
+        for index, (_, members) in enumerate(groups):
+            for node in members:
+                stage_of[node] = index
+        unstaged = [node for node in range(len(graph)) if stage_of[node] < 0]
+        if unstaged:
+            for node in unstaged:
+                stage_of[node] = len(groups)
+            groups.append((NO_STAGE, unstaged))
+
+        stages = []
+        for stage_id, members in groups:
+            stages.append(StageAggregate(
+                id=stage_id,
+                name=stage_names.get(stage_id, stage_id),
+                box=(
+                    min(layout.x[node] for node in members),
+                    min(layout.y[node] for node in members),
+                    max(layout.x[node] for node in members) + layout.node_width,
+                    max(layout.y[node] for node in members) + layout.node_height
+                ),
+                activity_count=len(members)
+            ))
+
+        links: Dict[Tuple[int, int], int] = {}
+        for edge in range(layout.edge_count):
+            key = (stage_of[layout.edge_source[edge]], stage_of[layout.edge_target[edge]])
+            if key[0] != key[1]:
+                links[key] = links.get(key, 0) + 1
+
+        return stages, links
+
+    def query(self, box: Box) -> Tuple[List[int], List[int]]:
+        """
+        Get the activities and transitions intersecting a rectangle.
+
+        Returns:
+            Nodes whose box intersects the rectangle, and edges with a route
+            segment crossing it, both in ascending order
+        """
+        layout = self.layout
+        min_x, min_y, max_x, max_y = box
+        node_candidates, edge_candidates = set(), set()
+        for cell in self._box_cells(box):
+            node_candidates.update(self.node_cells.get(cell, ()))
+            edge_candidates.update(self.edge_cells.get(cell, ()))
+
+        nodes = sorted(
+            node for node in node_candidates
+            if layout.x[node] <= max_x and layout.x[node] + layout.node_width >= min_x and
+            layout.y[node] <= max_y and layout.y[node] + layout.node_height >= min_y
+        )
+
+        edges = []
+        for edge in sorted(edge_candidates):
+            route = layout.edge_points[edge]
+            if any(_segment_hits_box(route[i], route[i + 1], route[i + 2], route[i + 3], box)
+                   for i in range(0, len(route) - 2, 2)):
+                edges.append(edge)
+
+        return nodes, edges
+
+    def query_stages(self, box: Box) -> Tuple[List[int], List[Tuple[int, int]]]:
+        """
+        Get the stage aggregates intersecting a rectangle.
+
+        Returns:
+            Aggregates whose box intersects the rectangle, and the links
+            with at least one end among them
+        """
+        min_x, min_y, max_x, max_y = box
+        stages = [index for index, stage in enumerate(self.stages)
+                  if stage.box[0] <= max_x and stage.box[2] >= min_x and
+                  stage.box[1] <= max_y and stage.box[3] >= min_y]
+        visible = set(stages)
+        links = [key for key in self.stage_links if key[0] in visible or key[1] in visible]
+        return stages, links
+
+
+# Indexes by graph and layout algorithm, with the graph version they were
+# built for, rebuilt and dropped with their graph like the layouts they index
+_INDEXES: "weakref.WeakKeyDictionary[WorkflowGraph, Dict[str, Tuple[int, SpatialIndex]]]" = \
+    weakref.WeakKeyDictionary()
+_INDEXES_LOCK = threading.Lock()
+
+
+def get_spatial_index(parser: ServiceNowWorkflowParser, algorithm: str = "layered") -> SpatialIndex:
+    """
+    Get the spatial index of a parsed workflow's layout, building the layout
+    and the index on first use and again after the graph changes.
+    """
+    graph = parser.get_graph()
+    version = graph.version
+    with _INDEXES_LOCK:
+        cached = _INDEXES.get(graph, {}).get(algorithm)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    stage_names = {stage_id: stage.name for stage_id, stage in parser.get_stages().items()}
+    index = SpatialIndex(graph, get_layout(parser, algorithm), stage_names)
+    with _INDEXES_LOCK:
+        _INDEXES.setdefault(graph, {})[algorithm] = (version, index)
+    return index
+
+
+def _center(box: Sequence[float]) -> List[float]:
+    return [(box[0] + box[2]) / 2, (box[1] + box[3]) / 2]
+
+
+def viewport_payload(parser: ServiceNowWorkflowParser, query: LayoutQuery) -> Dict[str, Any]:
+    """
+    Build the response members for what is visible of a workflow in the
+    query's viewport at the query's zoom.
+
+    Returns:
+        The layout members of layout_payload restricted to the viewport,
+        with the level of detail; below DETAIL_ZOOM, stage boxes and the
+        transition counts between them take the place of activities and
+        transitions
+    """
+    if query.viewport is None:
+        return {"level": "activities", **layout_payload(parser, query)}
+
+    index = get_spatial_index(parser, query.algorithm)
+    if query.zoom is None or query.zoom >= DETAIL_ZOOM:
+        nodes, edges = index.query(query.viewport)
+        return {"level": "activities", **layout_payload(parser, query, nodes, edges)}
+
+    stages, links = index.query_stages(query.viewport)
+    payload = layout_payload(parser, query, (), ())
+    payload["level"] = "stages"
+    payload["stages"] = [{
+        "id": index.stages[stage].id,
+        "name": index.stages[stage].name,
+        "x": index.stages[stage].box[0],
+        "y": index.stages[stage].box[1],
+        "width": index.stages[stage].box[2] - index.stages[stage].box[0],
+        "height": index.stages[stage].box[3] - index.stages[stage].box[1],
+        "activityCount": index.stages[stage].activity_count
+    } for stage in stages]
+    payload["stageLinks"] = [{
+        "source": index.stages[source].id,
+        "target": index.stages[target].id,
+        "count": index.stage_links[(source, target)],
+        "points": [_center(index.stages[source].box), _center(index.stages[target].box)]
+    } for source, target in links]
+    return payload
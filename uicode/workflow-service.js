@@ -24,13 +24,15 @@ const workflowService = {
     }
   },
   
-  // Get detailed workflow information
-  getWorkflowDetails: async (file) => {
+  // Get detailed workflow information, optionally one page of it:
+  // query may hold offset, limit, cursor, fields, stage and activity_definition
+  getWorkflowDetails: async (file, query = {}) => {
     const formData = new FormData();
     formData.append('file', file);
     
     try {
       const response = await axios.post(`${API_BASE_URL}/details`, formData, {
+        params: query,
         headers: {
           'Content-Type': 'multipart/form-data'
         }
@@ -40,6 +42,75 @@ const workflowService = {
       console.error('Error getting workflow details:', error);
       throw error;
     }
+  },
+  
+  // Upload and parse workflow XML once; the returned handle.id is used
+  // with the handle methods below instead of sending the file again
+  uploadWorkflow: async (file) => {
+    const formData = new FormData();
+    formData.append('file', file);
+    
+    try {
+      const response = await axios.post(`${API_BASE_URL}/upload`, formData, {
+        headers: {
+          'Content-Type': 'multipart/form-data'
+        }
+      });
+      return response.data;
+    } catch (error) {
+      console.error('Error uploading workflow:', error);
+      throw error;
+    }
+  },
+  
+  // Get the summary of an uploaded workflow
+  getWorkflowSummaryByHandle: async (handleId) => {
+    try {
+      const response = await axios.get(`${API_BASE_URL}/handles/${encodeURIComponent(handleId)}`);
+      return response.data;
+    } catch (error) {
+      console.error('Error getting workflow summary:', error);
+      throw error;
+    }
+  },
+  
+  // Get detailed information of an uploaded workflow, optionally one page of it
+  getWorkflowDetailsByHandle: async (handleId, query = {}) => {
+    try {
+      const response = await axios.get(`${API_BASE_URL}/handles/${encodeURIComponent(handleId)}/details`, {
+        params: query
+      });
+      return response.data;
+    } catch (error) {
+      console.error('Error getting workflow details:', error);
+      throw error;
+    }
+  },
+  
+  // Get diagram coordinates of an uploaded workflow, optionally only those
+  // inside a viewport given as { x, y, width, height, zoom }; when zoomed out
+  // the response has level 'stages' with stages and stageLinks instead
+  getWorkflowLayoutByHandle: async (handleId, viewport = {}, layout = 'layered') => {
+    try {
+      const response = await axios.get(`${API_BASE_URL}/handles/${encodeURIComponent(handleId)}/layout`, {
+        params: { layout, ...viewport }
+      });
+      return response.data;
+    } catch (error) {
+      console.error('Error getting workflow layout:', error);
+      throw error;
+    }
+  },
+  
+  // Release an uploaded workflow once it is no longer displayed
+  releaseWorkflow: async (handleId) => {
+    try {
+      const response = await axios.delete(`${API_BASE_URL}/handles/${encodeURIComponent(handleId)}`);
+      return response.data;
+    } catch (error) {
+      console.error('Error releasing workflow:', error);
+      throw error;
+    }
   }
 };
 